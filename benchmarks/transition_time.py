@@ -0,0 +1,50 @@
+'''Measures the time to go from one image to the next as a function of the number of labels.
+
+Requires a display (or xvfb-run). Usage: python benchmarks/transition_time.py
+'''
+import os
+import json
+import time
+import shutil
+import tempfile
+import tkinter as tk
+
+from PIL import Image
+
+from simplabel import ImageClassifier
+
+
+def run(nLabels, nImages=60, nTransitions=50):
+    directory = tempfile.mkdtemp()
+    try:
+        for i in range(nImages):
+            Image.new('RGB', (1024, 768), (i * 4 % 256, 80, 160)).save(os.path.join(directory, 'img{:03d}.jpg'.format(i)))
+        with open(os.path.join(directory, '.labels.json'), 'w') as f:
+            json.dump(['Label{}'.format(i) for i in range(nLabels)], f)
+
+        root = tk.Tk()
+        app = ImageClassifier(root, directory=directory, username='bench', autoRefresh=0)
+        root.update()
+
+        # Label every other image so button colors change on each transition
+        app.goto_first_image()
+        start = time.perf_counter()
+        for i in range(nTransitions):
+            if i % 2:
+                app.classify(app.categories[i % nLabels])
+            else:
+                app.next_image()
+            root.update_idletasks()
+        elapsed = (time.perf_counter() - start) / nTransitions
+
+        app.lock.release()
+        root.destroy()
+        return elapsed
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    print("{:>8} {:>16}".format("labels", "transition (ms)"))
+    for nLabels in [5, 20, 50, 100, 200]:
+        print("{:>8} {:>16.2f}".format(nLabels, 1000 * run(nLabels)))
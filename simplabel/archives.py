@@ -0,0 +1,188 @@
+import io
+import os
+import json
+import zlib
+import struct
+import logging
+import tarfile
+import zipfile
+import threading
+
+from PIL import Image
+
+# Images inside archives are referred to as 'archive.zip!member.jpg'
+separator = '!'
+archive_extensions = ('.zip', '.tar')
+
+
+def split_key(path):
+    '''Splits 'dir/archive.zip!member.jpg' into ('dir/archive.zip', 'member.jpg'), returns None for regular paths'''
+    lowerPath = path.lower()
+    for ext in archive_extensions:
+        idx = lowerPath.find(ext + separator)
+        if idx != -1:
+            end = idx + len(ext)
+            return path[:end], path[end+1:]
+    return None
+
+
+def is_archive_key(path):
+    return split_key(path) is not None
+
+
+def open_image(path):
+    '''Opens an image from a regular path or from an archive key'''
+    if is_archive_key(path):
+        return Image.open(io.BytesIO(read_member(path)))
+    return Image.open(path)
+
+
+def stat_image(path):
+    '''os.stat of the image, or of the archive containing it'''
+    parts = split_key(path)
+    return os.stat(parts[0] if parts else path)
+
+
+def read_member(path):
+    '''Returns the content of an archive member'''
+    return b''.join(iter_member(path))
+
+
+def iter_member(path, chunkSize=1024**2):
+    '''Yields the content of an archive member in chunks'''
+    archive, member = split_key(path)
+    return get_index(archive).iter_member(member, chunkSize)
+
+
+def copy_member(path, destination):
+    '''Streams an archive member to destination (a file path)'''
+    with open(destination, 'wb') as f:
+        for chunk in iter_member(path):
+            f.write(chunk)
+
+
+def list_archive_images(archive, extensions):
+    '''Returns the image members of an archive as keys relative to the archive directory'''
+    name = os.path.basename(archive)
+    return [name + separator + member for member in get_index(archive).members
+            if member.split('.')[-1].lower() in extensions]
+
+
+# Indices opened by this process
+_indices = {}
+_indicesLock = threading.Lock()
+
+def get_index(archive):
+    with _indicesLock:
+        index = _indices.get(archive)
+        if index is None or not index.is_current():
+            index = _indices[archive] = ArchiveIndex(archive)
+        return index
+
+
+class ArchiveIndex(object):
+    '''
+    Index of the members of a zip or tar archive allowing random access reads without extraction.
+
+    The index (member offsets and sizes) is built once and cached on disk next to the archive in
+    .<archive name>.index.json, it is rebuilt when the archive size or modification time changes.
+    Zip members that are stored or deflated and members of uncompressed tar archives are read with a
+    single seek, other members fall back to the zipfile and tarfile modules.
+
+    Parameters
+    ----------
+    archive : string
+        Path to the archive
+    '''
+
+    def __init__(self, archive):
+        self.archive = archive
+        directory, name = os.path.split(archive)
+        self.indexpath = os.path.join(directory, '.' + name + '.index.json')
+        st = os.stat(archive)
+        self.signature = [st.st_size, st.st_mtime]
+        self.kind = 'zip' if archive.lower().endswith('.zip') else 'tar'
+        # Members of compressed tar archives cannot be read at their offset
+        self.seekable = self.kind == 'zip' or _is_plain_tar(archive)
+        self.members = self._load() or self._build()
+
+    def is_current(self):
+        try:
+            st = os.stat(self.archive)
+        except OSError:
+            return False
+        return [st.st_size, st.st_mtime] == self.signature
+
+    def _load(self):
+        try:
+            with open(self.indexpath, 'r') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cached.get('signature') != self.signature:
+            return None
+        return cached['members']
+
+    def _build(self):
+        logging.info("Indexing archive {}".format(self.archive))
+        members = {}
+        if self.kind == 'zip':
+            with zipfile.ZipFile(self.archive) as z:
+                for info in z.infolist():
+                    if not info.is_dir():
+                        members[info.filename] = [info.header_offset, info.compress_size, info.file_size, info.compress_type]
+        else:
+            with tarfile.open(self.archive) as t:
+                for info in t:
+                    if info.isfile():
+                        members[info.name] = [info.offset_data, info.size, info.size, 0]
+
+        tmppath = self.indexpath + '.{}.tmp'.format(os.getpid())
+        try:
+            with open(tmppath, 'w') as f:
+                json.dump({'signature': self.signature, 'members': members}, f)
+            os.replace(tmppath, self.indexpath)
+        except OSError:
+            logging.warning("Could not cache the index of {}".format(self.archive))
+        return members
+
+    def iter_member(self, member, chunkSize=1024**2):
+        offset, compressSize, fileSize, compressType = self.members[member]
+
+        if self.kind == 'zip' and compressType not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            with zipfile.ZipFile(self.archive) as z, z.open(member) as f:
+                yield from iter(lambda: f.read(chunkSize), b'')
+            return
+        if not self.seekable:
+            with tarfile.open(self.archive) as t:
+                f = t.extractfile(member)
+                yield from iter(lambda: f.read(chunkSize), b'')
+            return
+
+        with open(self.archive, 'rb') as f:
+            if self.kind == 'zip':
+                # Skip the local file header, its name and extra field lengths can differ from the central directory
+                f.seek(offset)
+                header = f.read(30)
+                nameLength, extraLength = struct.unpack('<HH', header[26:30])
+                f.seek(offset + 30 + nameLength + extraLength)
+            else:
+                f.seek(offset)
+
+            decompressor = zlib.decompressobj(-15) if compressType == zipfile.ZIP_DEFLATED else None
+            remaining = compressSize
+            while remaining > 0:
+                chunk = f.read(min(chunkSize, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield decompressor.decompress(chunk) if decompressor else chunk
+            if decompressor:
+                yield decompressor.flush()
+
+
+def _is_plain_tar(path):
+    '''Compressed tar archives cannot be read at random offsets'''
+    with open(path, 'rb') as f:
+        magic = f.read(6)
+    return not (magic.startswith(b'\x1f\x8b') or magic.startswith(b'BZh') or magic.startswith(b'\xfd7zXZ'))
@@ -0,0 +1,167 @@
+import queue
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+
+class Cancelled(Exception):
+    '''Raised by a task that noticed its cancel token was set'''
+    pass
+
+
+class CancelToken(object):
+    '''Flag set from the Tk thread to ask a running task to stop, checked by the task between steps'''
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def check(self):
+        '''Raises Cancelled if the task was cancelled'''
+        if self.event.is_set():
+            raise Cancelled()
+
+
+class BackgroundTasks(object):
+    '''
+    Runs slow work (file reads and writes, directory scans, hashing) off the Tk thread.
+
+    Tasks run in a pool of worker threads and must not touch Tk widgets nor state changed by the UI: they get
+    what they need as arguments (copies taken on the Tk thread) and return a result. Finished tasks are put in a
+    queue that the Tk thread polls with after(), where the result is passed to the task's callback, which may
+    update the UI. Each task gets a CancelToken as its first argument: cancelled tasks should stop at the next
+    check and their callbacks are not called. onBusy is called on the Tk thread with the names of the running
+    tasks whenever they change, to show a busy indicator.
+
+        tasks = BackgroundTasks(root)
+        tasks.submit(lambda token, path: read(path), 'labels.json', name='Loading', callback=show)
+
+    Parameters
+    ----------
+    widget : tkinter widget
+        Widget used to schedule the polling of finished tasks on the Tk thread
+    workers : int
+        Number of worker threads (0 runs the tasks inline, e.g. in scripts and tests)
+    pollInterval : int
+        Delay in ms between two checks for finished tasks while some are running
+    onBusy : callable
+        Called with the sorted names of the running tasks when they change
+    '''
+
+    def __init__(self, widget, workers=2, pollInterval=50, onBusy=None):
+        self.widget = widget
+        self.workers = workers
+        self.pollInterval = pollInterval
+        self.onBusy = onBusy
+        self.pool = ThreadPoolExecutor(max_workers=workers) if workers > 0 else None
+        self.finished = queue.Queue()
+        # Futures submitted whose results were not delivered yet
+        self.pending = []
+        self.polling = None
+        self.busy = []
+
+    def submit(self, fn, *args, name=None, key=None, callback=None, errback=None):
+        '''
+        Runs fn(token, *args) in a worker thread and returns its future
+
+        callback(result) or errback(exception) is then called on the Tk thread. Exceptions of tasks without an
+        errback are logged. Tasks can be cancelled or waited for by key.
+        '''
+        token = CancelToken()
+        if self.pool is not None:
+            future = self.pool.submit(fn, token, *args)
+        else:
+            future = Future()
+            try:
+                future.set_result(fn(token, *args))
+            except Exception as e:
+                future.set_exception(e)
+        future.token = token
+        future.name = name
+        future.key = key
+        future.callback = callback
+        future.errback = errback
+        self.pending.append(future)
+        future.add_done_callback(self.finished.put)
+
+        if self.pool is None:
+            self.poll()
+        else:
+            self._update_busy()
+            self._schedule()
+        return future
+
+    def running(self, key=None):
+        '''Returns the futures not delivered yet (of key if passed)'''
+        return [future for future in self.pending if key is None or future.key == key]
+
+    def cancel(self, key=None):
+        '''Cancels the tasks of key, or all the tasks'''
+        for future in self.running(key):
+            future.token.cancel()
+            future.cancel()
+
+    def wait(self, future=None, key=None):
+        '''Blocks until future (or the tasks of key, or all the tasks) is done and delivers the finished tasks'''
+        futures = [future] if future is not None else self.running(key)
+        wait(futures)
+        self.poll()
+
+    def result(self, future):
+        '''Waits for future and returns its result, raising the exception of the task if it failed'''
+        self.wait(future)
+        return future.result()
+
+    def poll(self):
+        '''Delivers the results of the finished tasks to their callbacks (on the Tk thread)'''
+        while True:
+            try:
+                future = self.finished.get_nowait()
+            except queue.Empty:
+                break
+            if future not in self.pending:
+                continue
+            self.pending.remove(future)
+            if future.token.cancelled or future.cancelled():
+                continue
+            error = future.exception()
+            if isinstance(error, Cancelled):
+                continue
+            if error is not None:
+                if future.errback:
+                    future.errback(error)
+                else:
+                    logging.error("{} failed: {}".format(future.name or 'Background task', error))
+            elif future.callback:
+                future.callback(future.result())
+        self._update_busy()
+        self._schedule()
+
+    def shutdown(self):
+        '''Waits for the tasks not cancelled (e.g. saves) and stops the worker threads, results are not delivered'''
+        if self.polling is not None:
+            self.widget.after_cancel(self.polling)
+            self.polling = None
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+
+    def _scheduled_poll(self):
+        self.polling = None
+        self.poll()
+
+    def _schedule(self):
+        if self.pending and self.polling is None and self.pool is not None:
+            self.polling = self.widget.after(self.pollInterval, self._scheduled_poll)
+
+    def _update_busy(self):
+        busy = sorted(set(future.name for future in self.pending if future.name))
+        if busy != self.busy:
+            self.busy = busy
+            if self.onBusy:
+                self.onBusy(busy)
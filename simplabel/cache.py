@@ -0,0 +1,168 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from .archives import open_image, stat_image
+from .sources import list_images
+
+
+class ThumbnailCache(object):
+    '''
+    Content-addressed on-disk cache of thumbnails and previews shared by all labelers of a project.
+
+    Entries are stored under .simplabel_cache/ in the image directory, named after a hash of the image path,
+    modification time, file size and target size, so a modified image never hits a stale entry. Entries are
+    written to a temporary file and renamed in place which makes concurrent writers from several processes
+    or machines safe. Reads refresh the entry mtime and the least recently used entries are evicted to stay
+    under the disk budget.
+
+    Parameters
+    ----------
+    directory : string
+        Directory containing the images
+    budget : int
+        Maximum size of the cache in bytes
+    evictEvery : int
+        Number of writes between two evictions
+    '''
+
+    dirname = '.simplabel_cache'
+
+    def __init__(self, directory, budget=512*1024**2, evictEvery=200):
+        self.folder = directory
+        self.cacheDir = os.path.join(directory, self.dirname)
+        self.budget = budget
+        self.evictEvery = evictEvery
+        self._writes = 0
+
+    def key(self, img, size):
+        '''Returns the path of the cache entry for img at size, None if the image does not exist'''
+        try:
+            st = stat_image(os.path.join(self.folder, img))
+        except OSError:
+            return None
+        digest = hashlib.sha1("{}|{}|{}|{}x{}".format(img, st.st_mtime_ns, st.st_size, size[0], size[1])
+                              .encode('utf-8')).hexdigest()
+        return os.path.join(self.cacheDir, digest[:2], digest + '.jpg')
+
+    def get(self, img, size):
+        '''Returns the cached image for img at size or None'''
+        path = self.key(img, size)
+        if path is None:
+            return None
+        try:
+            with Image.open(path) as im:
+                im.load()
+        except (OSError, ValueError):
+            return None
+        # Mark the entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return im
+
+    def put(self, img, size, image):
+        '''Stores image as the entry for img at size'''
+        path = self.key(img, size)
+        if path is None:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique per process and thread, so concurrent renders of the same entry do not share a temporary file
+        tmppath = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        image.convert('RGB').save(tmppath, 'JPEG', quality=90)
+        os.replace(tmppath, path)
+
+        self._writes += 1
+        if self._writes % self.evictEvery == 0:
+            self.evict()
+
+    def get_or_create(self, img, size):
+        '''Returns the cached thumbnail of img, rendering and storing it on a miss'''
+        im = self.get(img, size)
+        if im is None:
+            with open_image(os.path.join(self.folder, img)) as src:
+                src.draft('RGB', size)
+                im = src.convert('RGB')
+            im.thumbnail(size)
+            self.put(img, size, im)
+        return im
+
+    def evict(self):
+        '''Deletes the least recently used entries until the cache fits in the budget'''
+        entries = []
+        total = 0
+        if not os.path.isdir(self.cacheDir):
+            return 0
+        for sub in os.scandir(self.cacheDir):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                # Leftovers of interrupted writes
+                if entry.name.endswith('.tmp') and time.time() - st.st_mtime > 3600:
+                    self._remove(entry.path)
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+
+        removed = 0
+        if total > self.budget:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.budget:
+                    break
+                self._remove(path)
+                total -= size
+                removed += 1
+            logging.info("ThumbnailCache - evicted {} entries".format(removed))
+        return removed
+
+    def warm(self, images, sizes, workers=None):
+        '''Renders images at all sizes in a process pool, returns the number of entries rendered'''
+        jobs = [(img, tuple(size)) for img in images for size in sizes]
+        rendered = 0
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            chunksize = max(1, len(jobs) // (8 * (workers or os.cpu_count() or 1)))
+            for ok in pool.map(_warm_one, [(self.folder, self.budget, img, size) for img, size in jobs],
+                               chunksize=chunksize):
+                rendered += ok
+        self.evict()
+        return rendered
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _warm_one(args):
+    folder, budget, img, size = args
+    cache = ThumbnailCache(folder, budget, evictEvery=10**9)
+    try:
+        if cache.get(img, size) is not None:
+            return 0
+        cache.get_or_create(img, size)
+        return 1
+    except (OSError, ValueError) as e:
+        logging.warning("Could not render {}: {}".format(img, e))
+        return 0
+
+
+def warm_cache(directory, sizes=((150, 110),), budget=512*1024**2, workers=None):
+    '''Pre-renders the thumbnails of all the images of a project'''
+    images = list_images(directory)
+    start = time.time()
+    rendered = ThumbnailCache(directory, budget).warm(images, sizes, workers)
+    print("Rendered {} thumbnails for {} images in {:.1f}s".format(rendered, len(images), time.time() - start))
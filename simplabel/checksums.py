@@ -0,0 +1,106 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .archives import iter_member, is_archive_key, stat_image
+from .project import image_path
+
+
+def file_digest(path, chunkSize=1024**2):
+    '''Returns the sha1 hex digest of the content of an image file or archive member'''
+    digest = hashlib.sha1()
+    if is_archive_key(path):
+        for chunk in iter_member(path, chunkSize):
+            digest.update(chunk)
+    else:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunkSize), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ChecksumCache(object):
+    '''
+    Content hashes of the images of a directory, cached by path, size and modification time.
+
+    The cache is saved to .simplabel_checksums.json in the directory as {image: [size, mtime_ns, sha1]} so only new
+    or modified images are hashed again. Images are hashed by a pool of threads (hashlib releases the GIL).
+
+    Parameters
+    ----------
+    directory : string
+        Directory containing the images
+    workers : int
+        Number of hashing threads
+    project : Project
+        Project whose roots contain the images when the directory only holds its labels
+    '''
+
+    filename = '.simplabel_checksums.json'
+
+    def __init__(self, directory, workers=8, project=None):
+        self.folder = directory
+        self.project = project
+        self.path = os.path.join(directory, self.filename)
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.entries = self._load()
+
+    def digests(self, images):
+        '''Returns {image: sha1} for images, hashing those not cached or modified since, None for missing images'''
+        stats = {}
+        stale = []
+        for img in images:
+            try:
+                st = stat_image(image_path(self.folder, img, self.project))
+            except OSError:
+                stats[img] = None
+                continue
+            stats[img] = (st.st_size, st.st_mtime_ns)
+            entry = self.entries.get(img)
+            if not entry or (entry[0], entry[1]) != stats[img]:
+                stale.append(img)
+
+        if stale:
+            logging.info("Hashing {} new or modified images".format(len(stale)))
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for img, digest in zip(stale, pool.map(self._hash, stale)):
+                    if digest is not None:
+                        with self.lock:
+                            self.entries[img] = list(stats[img]) + [digest]
+            self.save()
+
+        return {img: (self.entries[img][2] if stats[img] and img in self.entries else None) for img in images}
+
+    def save(self):
+        tmppath = '{}.{}.tmp'.format(self.path, os.getpid())
+        with self.lock:
+            with open(tmppath, 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(tmppath, self.path)
+
+    def _hash(self, img):
+        try:
+            return file_digest(image_path(self.folder, img, self.project))
+        except OSError as e:
+            logging.warning("Could not hash {}: {}".format(img, e))
+            return None
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+
+def find_duplicates(digests):
+    '''Returns {sha1: [image, ...]} for the contents found under more than one image name'''
+    groups = {}
+    for img, digest in digests.items():
+        if digest is not None:
+            groups.setdefault(digest, []).append(img)
+    return {digest: sorted(images) for digest, images in groups.items() if len(images) > 1}
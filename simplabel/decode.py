@@ -0,0 +1,162 @@
+import os
+import time
+import logging
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from .archives import open_image
+
+
+def _decode_to_shm(path, maxSize):
+    '''Decodes an image in a worker process and returns its pixels through a shared memory block'''
+    with open_image(path) as im:
+        if maxSize:
+            im.draft(im.mode, maxSize)
+        if im.mode not in ('RGB', 'RGBA', 'L'):
+            im = im.convert('RGBA' if 'A' in im.getbands() else 'RGB')
+        else:
+            im.load()
+        if maxSize:
+            im.thumbnail(maxSize)
+        data = im.tobytes()
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    shm.buf[:len(data)] = data
+    # The parent process owns the block and unlinks it once it has copied the pixels
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    shm.close()
+    return shm.name, im.mode, im.size, len(data)
+
+
+class Decoder(object):
+    '''
+    Decodes images either in the calling thread or in a pool of worker processes.
+
+    Small and common images are decoded in the calling thread. Large files in formats that are slow to decode
+    (TIFF, BMP, ICNS...) are sent to worker processes so they do not hold the GIL of the Tk process, and their
+    pixels are returned through shared memory instead of being pickled. The decode latency is measured per
+    format and backend, formats that turn out to be slow in-thread are moved out-of-process automatically.
+
+    Parameters
+    ----------
+    workers : int
+        Number of worker processes
+    sizeThreshold : int
+        File size in bytes above which heavy formats are decoded out-of-process
+    slowThreshold : float
+        Mean in-thread decode time in seconds above which a format is always decoded out-of-process
+    '''
+
+    heavyFormats = {'tif', 'tiff', 'bmp', 'icns', 'eps', 'spi'}
+
+    def __init__(self, workers=2, sizeThreshold=8*1024**2, slowThreshold=0.15):
+        self.workers = workers
+        self.sizeThreshold = sizeThreshold
+        self.slowThreshold = slowThreshold
+        self.pool = None
+        self.pending = {}
+        # {(format, backend): [count, total seconds]}
+        self.stats = {}
+
+    def use_process(self, path):
+        '''Returns True if path should be decoded out-of-process'''
+        ext = path.rsplit('.', 1)[-1].lower()
+        count, total = self.stats.get((ext, 'thread'), (0, 0.0))
+        if count >= 3 and total / count > self.slowThreshold:
+            return True
+        if ext not in self.heavyFormats:
+            return False
+        try:
+            return os.path.getsize(path) > self.sizeThreshold
+        except OSError:
+            return False
+
+    def decode(self, path, maxSize=None):
+        '''Returns the decoded image at path, shrunk to fit in maxSize if passed'''
+        start = time.time()
+        key = (path, maxSize)
+        if key in self.pending or self.use_process(path):
+            backend = 'process'
+            future = self.pending.pop(key, None) or self._submit(path, maxSize)
+            im = self._from_shm(*future.result())
+        else:
+            backend = 'thread'
+            im = open_image(path)
+            im.load()
+            if maxSize:
+                im.thumbnail(maxSize)
+        self._record(path, backend, time.time() - start)
+        return im
+
+    def prefetch(self, path, maxSize=None):
+        '''Starts decoding path in the background if it would be decoded out-of-process'''
+        key = (path, maxSize)
+        if key in self.pending or not self.use_process(path):
+            return
+        # Only keep a few images ahead, drop the oldest prefetches
+        while len(self.pending) >= 2 * self.workers:
+            oldKey = next(iter(self.pending))
+            self._discard(self.pending.pop(oldKey))
+        self.pending[key] = self._submit(path, maxSize)
+
+    def memory_usage(self):
+        '''Returns the bytes held by the prefetched images'''
+        return sum(self._pending_size(future) for future in self.pending.values())
+
+    def release(self, nbytes):
+        '''Drops the oldest prefetches until nbytes are freed, returns the bytes freed'''
+        freed = 0
+        while self.pending and freed < nbytes:
+            future = self.pending.pop(next(iter(self.pending)))
+            freed += self._pending_size(future)
+            self._discard(future)
+        return freed
+
+    def report(self):
+        '''Returns the measured latency: {format: {backend: (count, mean seconds)}}'''
+        report = {}
+        for (ext, backend), (count, total) in sorted(self.stats.items()):
+            report.setdefault(ext, {})[backend] = (count, total / count)
+        return report
+
+    def shutdown(self):
+        for future in self.pending.values():
+            self._discard(future)
+        self.pending = {}
+        if self.pool:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+
+    def _submit(self, path, maxSize):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self.pool.submit(_decode_to_shm, path, maxSize)
+
+    def _from_shm(self, name, mode, size, length):
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            return Image.frombytes(mode, size, bytes(shm.buf[:length]))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    @staticmethod
+    def _pending_size(future):
+        if not future.done() or future.cancelled() or future.exception() is not None:
+            return 0
+        return future.result()[3]
+
+    def _discard(self, future):
+        '''Frees the shared memory of a prefetch that will not be used'''
+        if not future.cancel():
+            future.add_done_callback(lambda f: f.exception() is None and self._from_shm(*f.result()))
+
+    def _record(self, path, backend, elapsed):
+        ext = path.rsplit('.', 1)[-1].lower()
+        stat = self.stats.setdefault((ext, backend), [0, 0.0])
+        stat[0] += 1
+        stat[1] += elapsed
+        logging.debug("Decoded {} ({}) in {:.1f} ms".format(os.path.basename(path), backend, 1000 * elapsed))
@@ -0,0 +1,211 @@
+import os
+import json
+import math
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from .archives import open_image, stat_image
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def dhash(image, hashSize=8):
+    '''Difference hash: compares the brightness of horizontally adjacent pixels of a downscaled image'''
+    im = image.convert('L').resize((hashSize + 1, hashSize), Image.BILINEAR)
+    if np is not None:
+        a = np.asarray(im, dtype=np.int16)
+        return _bits_to_int((a[:, 1:] > a[:, :-1]).ravel())
+    px = im.tobytes()
+    w = hashSize + 1
+    return _bits_to_int([px[r*w + c + 1] > px[r*w + c] for r in range(hashSize) for c in range(hashSize)])
+
+
+def phash(image, hashSize=8, highfreqFactor=4):
+    '''Perceptual hash: compares the low frequency DCT coefficients of a downscaled image to their median'''
+    n = hashSize * highfreqFactor
+    im = image.convert('L').resize((n, n), Image.BILINEAR)
+    # Only the first hashSize rows of the DCT matrix are needed
+    basis = [[math.cos(math.pi * (2*i + 1) * k / (2*n)) for i in range(n)] for k in range(hashSize)]
+    if np is not None:
+        c = np.array(basis)
+        dct = c @ np.asarray(im, dtype=np.float64) @ c.T
+        coeffs = dct.ravel()
+    else:
+        px = im.tobytes()
+        rows = [px[r*n:(r+1)*n] for r in range(n)]
+        # Transform the columns then the rows
+        tmp = [[sum(basis[k][i] * rows[i][j] for i in range(n)) for j in range(n)] for k in range(hashSize)]
+        coeffs = [sum(tmp[k][j] * basis[l][j] for j in range(n)) for k in range(hashSize) for l in range(hashSize)]
+    # Exclude the DC term from the median
+    median = sorted(coeffs[1:])[len(coeffs[1:]) // 2]
+    return _bits_to_int([v > median for v in coeffs])
+
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits:
+        value = (value << 1) | bool(bit)
+    return value
+
+
+def hamming(a, b):
+    '''Number of differing bits between two integer hashes'''
+    return bin(a ^ b).count('1')
+
+
+class DuplicateIndex(object):
+    '''
+    Groups near-duplicate images (burst shots, near identical frames) using perceptual hashes.
+
+    Hashes are cached on disk in .simplabel_hashes.json keyed by image path and mtime. Near neighbors are found
+    with multi-index hashing: the 64 bit hashes are split in maxDistance + 1 chunks so that, by the pigeonhole
+    principle, two hashes within maxDistance bits of each other share at least one identical chunk.
+
+    Parameters
+    ----------
+    directory : string
+        Directory containing the images
+    maxDistance : int
+        Maximum Hamming distance between the hashes of two images considered duplicates
+    method : string
+        Hash function, 'dhash' or 'phash'
+    '''
+
+    hashFunctions = {'dhash': dhash, 'phash': phash}
+    # Number of images hashed between two checks of the cancel token
+    chunkSize = 256
+
+    def __init__(self, directory, maxDistance=4, method='dhash'):
+        self.folder = directory
+        self.cachepath = os.path.join(directory, '.simplabel_hashes.json')
+        self.maxDistance = maxDistance
+        self.method = method
+        self.hashes = {}
+        self.tables = []
+        self.groups = {}
+        self.ready = threading.Event()
+
+    def build(self, images, workers=None, token=None):
+        '''Hashes images (reusing cached hashes) and groups near-duplicates, stopping if token is cancelled'''
+        cache = self._load_cache()
+        hashes = {}
+        toHash = []
+        for img in images:
+            try:
+                mtime = stat_image(os.path.join(self.folder, img)).st_mtime
+            except OSError:
+                continue
+            cached = cache.get(img)
+            if cached and cached[0] == mtime:
+                hashes[img] = cached[1]
+            else:
+                toHash.append((img, mtime))
+
+        if toHash:
+            logging.info("Computing perceptual hashes for {} images".format(len(toHash)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                # Hashed in chunks so a cancelled build stops early, the hashes computed so far are cached
+                for start in range(0, len(toHash), self.chunkSize):
+                    if token is not None and token.cancelled:
+                        self._dump_cache(cache)
+                        token.check()
+                    chunk = toHash[start:start+self.chunkSize]
+                    for (img, mtime), value in zip(chunk, pool.map(self._hash_file, [img for img, _ in chunk])):
+                        if value is not None:
+                            hashes[img] = value
+                            cache[img] = [mtime, value]
+            self._dump_cache(cache)
+
+        tables = self._build_tables(hashes)
+        self.hashes = hashes
+        self.tables = tables
+        self.groups = self._group(hashes, tables)
+        self.ready.set()
+        logging.info("Found {} groups of near-duplicate images".format(len(set(map(id, self.groups.values())))))
+        return self.groups
+
+    def group(self, img):
+        '''Returns the other images in the same group of near-duplicates as img'''
+        return [other for other in self.groups.get(img, ()) if other != img]
+
+    def neighbors(self, img):
+        '''Returns the images whose hash is within maxDistance of the hash of img'''
+        if img not in self.hashes:
+            return []
+        target = self.hashes[img]
+        return [other for other in self._candidates(target, self.tables)
+                if other != img and hamming(target, self.hashes[other]) <= self.maxDistance]
+
+    def _hash_file(self, img):
+        try:
+            with open_image(os.path.join(self.folder, img)) as im:
+                # Let the JPEG decoder downscale while decoding, only a tiny image is needed
+                im.draft('L', (64, 64))
+                return self.hashFunctions[self.method](im)
+        except (OSError, ValueError) as e:
+            logging.warning("Could not hash {}: {}".format(img, e))
+            return None
+
+    def _chunks(self, value):
+        nChunks = self.maxDistance + 1
+        width = int(math.ceil(64 / nChunks))
+        mask = (1 << width) - 1
+        return [(value >> (i * width)) & mask for i in range(nChunks)]
+
+    def _build_tables(self, hashes):
+        tables = [{} for _ in range(self.maxDistance + 1)]
+        for img, value in hashes.items():
+            for table, chunk in zip(tables, self._chunks(value)):
+                table.setdefault(chunk, []).append(img)
+        return tables
+
+    def _candidates(self, value, tables):
+        candidates = set()
+        for table, chunk in zip(tables, self._chunks(value)):
+            candidates.update(table.get(chunk, ()))
+        return candidates
+
+    def _group(self, hashes, tables):
+        '''Union-find over all pairs of images within maxDistance'''
+        parent = {img: img for img in hashes}
+
+        def find(img):
+            while parent[img] != img:
+                parent[img] = parent[parent[img]]
+                img = parent[img]
+            return img
+
+        for img, value in hashes.items():
+            for other in self._candidates(value, tables):
+                if other != img and hamming(value, hashes[other]) <= self.maxDistance:
+                    parent[find(other)] = find(img)
+
+        members = {}
+        for img in hashes:
+            members.setdefault(find(img), []).append(img)
+        return {img: group for group in members.values() if len(group) > 1 for img in group}
+
+    def _load_cache(self):
+        if not os.path.isfile(self.cachepath):
+            return {}
+        try:
+            with open(self.cachepath, 'r') as f:
+                cache = json.load(f)
+        except ValueError:
+            return {}
+        # Hashes computed with another method cannot be reused
+        if cache.get('method') != self.method:
+            return {}
+        return cache.get('hashes', {})
+
+    def _dump_cache(self, cache):
+        tmppath = self.cachepath + '.{}.tmp'.format(os.getpid())
+        with open(tmppath, 'w') as f:
+            json.dump({'method': self.method, 'hashes': cache}, f)
+        os.replace(tmppath, self.cachepath)
@@ -6,20 +6,25 @@ import sys
 import tkinter as tk
 import logging
 
-def flow_to_dict(rawDirectory, labelledDirectory=None):
+from .archives import split_key, copy_member
+from .labelsets import LabelSpace, separator
+from .manifest import export_manifest, iter_records
+from .shards import export_shards
+from .transform import ImageTransform, run_transforms
+from .checksums import ChecksumCache, find_duplicates
+from .project import Project, image_path
+
+def load_labels(rawDirectory):
     '''
-    Copies labelled images to discting directories by label
+    Loads the labels of the master dictionary, or of a user chosen interactively if there is no master
 
-    Arguments
-    --------
-    rawDirectory: string
-        Path to the directory containing raw images. It must also contain a labeled.json file created with simplabel containing the labels
-    labelledDirectory: string
-        Path to the output directory. A folder will be created for each label in the dictionary.
+    Returns a dictionary {image: [label, ...]}. Multi-label bitsets are decoded with the category list of the
+    project and hierarchical labels are returned with their full path, e.g. 'Animal/Cat'.
     '''
 
-    # Detected users
+    # Detected users, the pre-labels of the model are not labels to flow
     users = [f.split('_')[1].split('.')[0] for f in os.listdir(rawDirectory) if (f.endswith('.json') and f.startswith('labeled_'))]
+    users = [user for user in users if user != 'model']
 
     if not users:
         logging.warning("No label files found in directory.")
@@ -41,33 +46,149 @@ def flow_to_dict(rawDirectory, labelledDirectory=None):
     else:
         logging.warning("No dictionary found at: %s", dictPath)
         sys.exit()
-        
+
+    # Multi-label projects save bitsets over the category list
+    categories = []
+    labelFile = os.path.join(rawDirectory, '.labels.json')
+    if any(isinstance(label, int) for label in labelled_dict.values()) and os.path.isfile(labelFile):
+        with open(labelFile, 'r') as f:
+            categories = json.load(f)
+    labelSpace = LabelSpace(categories)
+
+    return {image: labelSpace.names(label) for image, label in labelled_dict.items()}
+
+
+def flow_to_dict(rawDirectory, labelledDirectory=None, transform=None, workers=None, dedupe=False, project=None):
+    '''
+    Copies labelled images to discting directories by label
+
+    Hierarchical labels are copied to nested directories ('Animal/Cat' to Animal/Cat/). In multi-label projects,
+    images are copied to the directory of each of their most specific labels.
+
+    Arguments
+    --------
+    rawDirectory: string
+        Path to the directory containing raw images. It must also contain a labeled.json file created with simplabel containing the labels
+    labelledDirectory: string
+        Path to the output directory. A folder will be created for each label in the dictionary.
+    transform: ImageTransform
+        When passed, images are resized and re-encoded in a process pool instead of being copied
+    workers: int
+        Number of processes used to transform the images
+    dedupe: bool
+        When true, images with the same content are copied once, see deduplicate
+    project: Project
+        Multi-root project whose labels are in rawDirectory, images are read from its roots
+    '''
+
+    labelled_dict = load_labels(rawDirectory)
+
+    # Keep only the most specific labels, parents are implied by the directory structure
+    for image, labels in labelled_dict.items():
+        labelled_dict[image] = [label for label in labels if not any(other.startswith(label + separator) for other in labels)]
+
     # Get all categories that exist in the dictionary
-    categories = set(labelled_dict.values())
+    categories = set(label for labels in labelled_dict.values() for label in labels)
     # If no output directory is passed, use the input directory
     if not labelledDirectory:
         labelledDirectory = rawDirectory
     # Check existence of output directory
     if not os.path.exists(labelledDirectory):
         os.mkdir(labelledDirectory)
+    # Only copy one of the images that have the same content
+    if dedupe:
+        labelled_dict = deduplicate(rawDirectory, labelled_dict, os.path.join(labelledDirectory, 'duplicates_report.json'),
+                                    project)
     # Check existence of sub folders, create if necessary
     for label in categories:
         labelDirect = os.path.join(labelledDirectory, label)
         if not os.path.exists(labelDirect):
-            os.mkdir(labelDirect)
+            os.makedirs(labelDirect)
     # For each file in dictionary, move it to corresponding directory
+    jobs = [(image, label) for image, labels in labelled_dict.items() for label in labels]
+    if transform:
+        done, elapsed = run_transforms(((image_path(rawDirectory, image, project), os.path.join(labelledDirectory, label), image)
+                                        for image, label in jobs), transform, workers)
+        print("Transformed {} images in {:.1f}s ({:.1f} images/s)".format(done, elapsed, done / max(elapsed, 1e-9)))
+        return
     try:
         import tqdm
-        for image, label in tqdm.tqdm(labelled_dict.items()):
+        for image, label in tqdm.tqdm(jobs):
             labelDirect = os.path.join(labelledDirectory, label)
             logging.debug("Copying %s to %s", image, labelDirect)
-            shutil.copy2(os.path.join(rawDirectory, image), labelDirect)
+            copy_image(rawDirectory, image, labelDirect, project)
 
     except ImportError:
-        for image, label in labelled_dict.items():
+        for image, label in jobs:
             labelDirect = os.path.join(labelledDirectory, label)
             logging.debug("Copying %s to %s", image, labelDirect)
-            shutil.copy2(os.path.join(rawDirectory, image), labelDirect)
+            copy_image(rawDirectory, image, labelDirect, project)
+
+
+def deduplicate(rawDirectory, labelled_dict, reportPath, project=None):
+    '''
+    Returns labelled_dict without the images whose content is the same as another labelled image
+
+    labelled_dict maps each image to its list of labels, see load_labels. Content hashes are cached in the raw
+    directory (see ChecksumCache), images are read from the roots of project if passed. The first image of each
+    group of duplicates (in name order) is kept and the groups are written to a json report. Exits with an error
+    if copies of the same image were given different labels.
+    '''
+
+    digests = ChecksumCache(rawDirectory, project=project).digests(list(labelled_dict))
+    duplicates = find_duplicates(digests)
+
+    report = {'duplicates': [], 'conflicts': []}
+    for digest, images in sorted(duplicates.items()):
+        labels = {img: labelled_dict[img] for img in images}
+        entry = {'sha1': digest, 'images': images, 'kept': images[0], 'labels': labels}
+        if len(set(frozenset(imgLabels) for imgLabels in labels.values())) > 1:
+            report['conflicts'].append(entry)
+        else:
+            report['duplicates'].append(entry)
+    with open(reportPath, 'w') as f:
+        json.dump(report, f, indent=1)
+
+    if report['conflicts']:
+        for entry in report['conflicts']:
+            logging.error("Copies of the same image have different labels: {}".format(entry['labels']))
+        logging.error("Found {} duplicated images with conflicting labels, see {}".format(len(report['conflicts']), reportPath))
+        sys.exit(1)
+
+    removed = 0
+    for entry in report['duplicates']:
+        for img in entry['images'][1:]:
+            del labelled_dict[img]
+            removed += 1
+    logging.info("Skipped {} duplicated images, see {}".format(removed, reportPath))
+    return labelled_dict
+
+
+def export_json(rawDirectory, outputPath):
+    '''
+    Writes the labels to a json file {image: [label, ...]} that does not depend on the category list
+
+    Arguments
+    --------
+    rawDirectory: string
+        Path to the directory containing raw images and the label files
+    outputPath: string
+        Path of the json file to write
+    '''
+
+    labelled_dict = load_labels(rawDirectory)
+    with open(outputPath, 'w') as f:
+        json.dump(labelled_dict, f, indent=1)
+    logging.info("Exported the labels of %d images to %s", len(labelled_dict), outputPath)
+
+
+def copy_image(rawDirectory, image, labelDirect, project=None):
+    '''Copies an image to labelDirect, images inside archives are streamed out of the archive'''
+    parts = split_key(image)
+    if parts:
+        copy_member(image_path(rawDirectory, image, project), os.path.join(labelDirect, os.path.basename(parts[1])))
+    else:
+        shutil.copy2(image_path(rawDirectory, image, project), labelDirect)
 
 
 def main():
@@ -75,6 +196,22 @@ def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("-i", "--input-directory", default=os.getcwd(), help="Path of the directory containing the raw images and labeled.json file. Defaults to current directory")
     ap.add_argument("-o", "--output-directory", help="Path of the output directory, will be created if it does not exist. Defaults to same as input directory.")
+    ap.add_argument("-p", "--project", default=None, help="Project file of a multi-root project, labels are read from its labels directory and images from its roots (replaces -i)")
+    ap.add_argument("-j", "--json", help="Write the labels to this json file instead of copying the images")
+    ap.add_argument("-m", "--manifest", help="Write a csv or jsonl manifest (path, label, labelers, agreement, split) to this file instead of copying the images")
+    ap.add_argument("--dedupe", action='store_true', help="Export images with the same content only once (copies, --manifest or --shards) and write a duplicates report, fails if duplicates have different labels")
+    ap.add_argument("--max-side", type=int, default=None, help="Shrink the copied images to this size on their longest side")
+    ap.add_argument("--format", choices=['jpeg', 'png', 'webp'], default=None, help="Re-encode the copied images to this format")
+    ap.add_argument("--quality", type=int, default=90, help="With --format jpeg or webp, encoding quality")
+    ap.add_argument("--keep-orientation", action='store_true', help="With --max-side or --format, do not apply the EXIF orientation to the pixels")
+    ap.add_argument("-s", "--shards", help="Pack the images and their labels into tar shards (WebDataset style) in this directory instead of copying them")
+    ap.add_argument("--shard-count", type=int, default=10000, help="With --shards, maximum number of images per shard")
+    ap.add_argument("--shard-size", type=int, default=1024, help="With --shards, maximum size of a shard in MB")
+    ap.add_argument("--workers", type=int, default=None, help="Number of processes transforming images or writing shards")
+    ap.add_argument("-u", "--user", default=None, help="With --manifest or --shards, labels to export (master or a username). Defaults to master if it exists, else to the majority label")
+    ap.add_argument("--splits", nargs='*', type=float, default=[0.8, 0.1, 0.1], help="With --manifest or --shards, shares of the train, val and test splits (none to leave the split out)")
+    ap.add_argument("--seed", type=int, default=0, help="With --manifest or --shards, seed of the split assignment and shuffle")
+    ap.add_argument("--group-by-directory", action='store_true', help="With --manifest or --shards, keep the images of a subdirectory in the same split")
     ap.add_argument("-v", "--verbose", action='count', default=0, help="Enable verbose mode")
 
     args = ap.parse_args()
@@ -90,6 +227,40 @@ def main():
     # Get the variables from parser
     raw_directory = args.input_directory
     out_directory = args.output_directory
+    project = None
+    if args.project:
+        project = Project(args.project)
+        raw_directory = project.folder
+
+    # Images with the same content are exported once, the duplicates report is written next to the export
+    images = None
+    if args.dedupe and args.json:
+        logging.error("--dedupe is not available with --json, which exports labels only")
+        sys.exit(1)
+    if args.dedupe and (args.shards or args.manifest):
+        reportDirectory = args.shards or os.path.dirname(os.path.abspath(args.manifest))
+        os.makedirs(reportDirectory, exist_ok=True)
+        # deduplicate expects lists of labels like load_labels, single-label records hold a plain string
+        labels = {record['path']: record['label'] if isinstance(record['label'], list) else [record['label']]
+                  for record in iter_records(raw_directory, args.user)}
+        images = set(deduplicate(raw_directory, labels, os.path.join(reportDirectory, 'duplicates_report.json'), project))
 
-    flow_to_dict(raw_directory, out_directory)
+    if args.shards:
+        index = export_shards(raw_directory, args.shards, user=args.user, splits=args.splits, seed=args.seed,
+                              groupByDirectory=args.group_by_directory, maxCount=args.shard_count,
+                              maxBytes=args.shard_size*1024**2, workers=args.workers, project=project, images=images)
+        print("Wrote {} images to {} shards in {}".format(index['samples'], len(index['shards']), args.shards))
+    elif args.manifest:
+        counts = export_manifest(raw_directory, args.manifest, user=args.user, splits=args.splits, seed=args.seed,
+                                 groupByDirectory=args.group_by_directory, project=project, images=images)
+        print("Wrote manifest to {}: {}".format(args.manifest, counts))
+    elif args.json:
+        export_json(raw_directory, args.json)
+    else:
+        transform = None
+        if args.max_side or args.format:
+            transform = ImageTransform(maxSide=args.max_side, format=args.format, quality=args.quality,
+                                       exifTranspose=not args.keep_orientation)
+        flow_to_dict(raw_directory, out_directory, transform=transform, workers=args.workers, dedupe=args.dedupe,
+                     project=project)
     
\ No newline at end of file
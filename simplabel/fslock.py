@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+import logging
+
+
+class FsLock(object):
+    '''
+    A simple filesystem based lock mechanism to avoid multiple users logging in with the same username at once.
+
+    The lock is held for as long as the lock file exists. It is created atomically (exclusive create) and
+    its modification time acts as a lease that is refreshed by a heartbeat timer while the lock is held.
+    A lock file whose lease has not been refreshed for more than leaseTimeout seconds is considered stale
+    (e.g. left behind by a crashed session) and is broken automatically. Stale locks are broken by renaming
+    them to a name unique to the session and checking the renamed file again, so that two sessions breaking
+    the same stale lock cannot remove a lock the other one just took. The lock file holds a token unique to the
+    session that created it: the heartbeat and release() leave the file alone once another session took it over.
+
+    Parameters
+    ----------
+    directory : string
+        Directory containing the images (and the lock files)
+    username : str
+        Username the lock is taken for
+    leaseTimeout : float
+        Time in seconds after which a lock that has not been refreshed is considered stale
+    '''
+
+    suffix = '_lock.txt'
+
+    def __init__(self, directory, username, leaseTimeout=30):
+        self.filename = directory + '/.' + username + self.suffix
+        self.leaseTimeout = leaseTimeout
+        self.heartbeatInterval = leaseTimeout / 3
+        self._timer = None
+        self._owned = False
+        self.token = None
+
+    def acquire(self):
+        '''Creates the lock file, raises an Exception if a live lock is already held'''
+        for _ in range(2):
+            try:
+                fd = os.open(self.filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                # Break the lock if it is stale or left over from an older version, then retry once
+                if self.is_locked():
+                    raise Exception("Lock is already acquired.")
+                if not self._break_stale():
+                    raise Exception("Lock is already acquired.")
+                continue
+            token = uuid.uuid4().hex
+            with os.fdopen(fd, 'w') as f:
+                f.write(json.dumps({'host': socket.gethostname(), 'pid': os.getpid(), 'token': token}))
+            self.token = token
+            self._owned = True
+            self._schedule_heartbeat()
+            return
+        raise Exception("Lock is already acquired.")
+
+    def release(self, force=False):
+        '''
+        Stops the heartbeat and removes the lock file if this session created it
+
+        With force, the lock file is removed whoever holds it (e.g. to override the lock of a crashed session).
+        '''
+        self._cancel_heartbeat()
+        self._owned = False
+        if force:
+            self._remove()
+        elif self.token is not None:
+            self._remove_owned()
+        self.token = None
+
+    def owns_file(self):
+        '''Returns True if the lock file exists and was created by this session'''
+        try:
+            with open(self.filename, 'r') as f:
+                content = f.read()
+        except FileNotFoundError:
+            return False
+        return self.token is not None and self._token(content) == self.token
+
+    def is_locked(self):
+        '''Returns True if the lock file exists and its lease has not expired'''
+        try:
+            with open(self.filename, 'r') as f:
+                mtime = os.fstat(f.fileno()).st_mtime
+                content = f.read()
+        except FileNotFoundError:
+            return False
+        return self._is_live(content, mtime, self.leaseTimeout)
+
+    @classmethod
+    def locked_users(cls, directory, leaseTimeout=30):
+        '''Returns the set of users holding a live lock in directory using a single directory scan'''
+        users = set()
+        now = time.time()
+        with os.scandir(directory) as it:
+            for entry in it:
+                if not (entry.name.startswith('.') and entry.name.endswith(cls.suffix)):
+                    continue
+                try:
+                    mtime = entry.stat().st_mtime
+                    # Only read the content of locks that are fresh enough to matter
+                    if now - mtime > leaseTimeout:
+                        continue
+                    with open(entry.path, 'r') as f:
+                        content = f.read()
+                except FileNotFoundError:
+                    continue
+                if cls._is_live(content, mtime, leaseTimeout, now):
+                    users.add(entry.name[1:-len(cls.suffix)])
+        return users
+
+    @staticmethod
+    def _is_live(content, mtime, leaseTimeout, now=None):
+        # Lock files written by older versions contain 'locked' or 'unlocked'
+        if content == 'unlocked':
+            return False
+        if now is None:
+            now = time.time()
+        return now - mtime <= leaseTimeout
+
+    @staticmethod
+    def _token(content):
+        # Lock files written by older versions hold no token
+        try:
+            return json.loads(content).get('token')
+        except (ValueError, AttributeError):
+            return None
+
+    def _moved_name(self):
+        '''Returns a name for the lock file unique to this session, to check it after moving it atomically'''
+        return '{}.{}.{}.stale'.format(self.filename, os.getpid(), threading.get_ident())
+
+    def _restore(self, moved):
+        '''Puts back a lock file moved by mistake, unless another session created a new one since'''
+        try:
+            os.link(moved, self.filename)
+        except OSError:
+            logging.warning("Could not restore the lock file %s", self.filename)
+
+    def _break_stale(self):
+        '''Removes the lock file if it is stale, returns False if it turned out to be live'''
+        stale = self._moved_name()
+        try:
+            os.rename(self.filename, stale)
+        except FileNotFoundError:
+            # Broken by another session
+            return True
+        try:
+            with open(stale, 'r') as f:
+                mtime = os.fstat(f.fileno()).st_mtime
+                content = f.read()
+            if self._is_live(content, mtime, self.leaseTimeout):
+                # Another session took the lock after it was found stale, give it back
+                self._restore(stale)
+                return False
+            logging.info("Breaking stale lock: %s", self.filename)
+            return True
+        finally:
+            os.remove(stale)
+
+    def _remove_owned(self):
+        '''Removes the lock file only if it holds the token of this session'''
+        moved = self._moved_name()
+        try:
+            os.rename(self.filename, moved)
+        except FileNotFoundError:
+            return
+        try:
+            with open(moved, 'r') as f:
+                content = f.read()
+            if self._token(content) != self.token:
+                logging.warning("Lock file %s was taken over by another session, leaving it in place.", self.filename)
+                self._restore(moved)
+        finally:
+            os.remove(moved)
+
+    def _remove(self):
+        try:
+            os.remove(self.filename)
+        except FileNotFoundError:
+            pass
+
+    def _schedule_heartbeat(self):
+        self._timer = threading.Timer(self.heartbeatInterval, self._heartbeat)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _cancel_heartbeat(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+    def _heartbeat(self):
+        '''Refreshes the lease by touching the lock file, unless another session took it over'''
+        if not self._owned:
+            return
+        touched = False
+        if self.owns_file():
+            try:
+                os.utime(self.filename)
+                touched = True
+            except FileNotFoundError:
+                pass
+        if not touched:
+            logging.warning("Lock file %s was removed or taken over by another process, the lock is lost.", self.filename)
+            self._owned = False
+            return
+        self._schedule_heartbeat()
@@ -0,0 +1,238 @@
+import tkinter as tk
+from functools import partial
+from PIL import ImageTk
+import logging
+
+from .thumbnails import ThumbnailLoader
+from .palette import LabelPalette, NumberEntry
+
+
+class GridView(tk.Toplevel):
+    """
+    Batch labeling window showing a page of thumbnails.
+
+    Click thumbnails to select them (or press 'a' to select the whole page), then click a label button or type
+    its number to label the whole selection at once. Large taxonomies get the searchable label palette of the
+    main window instead of one button per label. Thumbnails are generated in a process pool and the next
+    page is prefetched while the current one is displayed.
+
+    Parameters
+    ----------
+    classifier : ImageClassifier
+        App whose image list is displayed and labeled
+    columns : int
+        Number of thumbnails per row
+    rows : int
+        Number of rows per page
+    thumbSize : (int, int)
+        Maximum thumbnail width and height
+    """
+
+    def __init__(self, classifier, columns=5, rows=4, thumbSize=(150, 110), *args, **kwargs):
+
+        tk.Toplevel.__init__(self, classifier.root, *args, **kwargs)
+        self.wm_title("Simplabel - Grid")
+        self.protocol('WM_DELETE_WINDOW', self.close)
+
+        self.classifier = classifier
+        self.columns = columns
+        self.rows = rows
+        self.pageSize = columns * rows
+        self.thumbSize = thumbSize
+        self.cellWidth = thumbSize[0] + 10
+        self.cellHeight = thumbSize[1] + 25
+
+        self.loader = ThumbnailLoader(classifier.folder, size=thumbSize, maxItems=4*self.pageSize,
+                                      cacheBudget=classifier.cacheBudget)
+        classifier.memory.register('grid thumbnails', self.loader)
+
+        # Start on the page containing the current image
+        self.page = classifier.counter // self.pageSize
+        self.selected = set()
+        self.photos = {}
+        self.polling = None
+
+        self.initialize_ui()
+        self.show_page()
+
+    def initialize_ui(self):
+        '''Creates the thumbnail canvas, the navigation and the label buttons'''
+
+        self.navFrame = tk.Frame(self, height=10, bd=2)
+        self.navFrame.pack(side=tk.TOP, fill=tk.X)
+        self.prevButton = tk.Button(self, text='<', height=2, width=3, command=self.previous_page)
+        self.prevButton.pack(in_=self.navFrame, side=tk.LEFT)
+        self.nextButton = tk.Button(self, text='>', height=2, width=3, command=self.next_page)
+        self.nextButton.pack(in_=self.navFrame, side=tk.LEFT)
+        tk.Button(self, text='Select page', height=2, width=10, command=self.select_all).pack(in_=self.navFrame, side=tk.LEFT)
+        tk.Button(self, text='Close', height=2, width=8, command=self.close).pack(in_=self.navFrame, side=tk.RIGHT)
+        self.pageLabel = tk.Label(self, text='')
+        self.pageLabel.pack(in_=self.navFrame)
+
+        self.cv = tk.Canvas(self, background="white", highlightthickness=0,
+                            width=self.columns*self.cellWidth, height=self.rows*self.cellHeight)
+        self.cv.pack(side=tk.TOP, fill=tk.BOTH, expand=tk.YES)
+        self.cv.bind("<Button-1>", self.click_handler)
+
+        self.labelFrame = tk.Frame(self, height=10, bd=2)
+        self.labelFrame.pack(side=tk.BOTTOM, fill=tk.X)
+        self.catButton = []
+        self.palette = None
+        categories = self.classifier.categories
+        if len(categories) > self.classifier.paletteThreshold:
+            self.palette = LabelPalette(self.labelFrame, self.classifier, command=self.apply_label)
+            self.palette.pack(side=tk.TOP, fill=tk.X)
+        else:
+            for idx, category in enumerate(categories):
+                button = tk.Button(self, text="{} ({})".format(category, idx+1), height=2, width=8,
+                                   command=partial(self.apply_label, category))
+                button.pack(in_=self.labelFrame, fill=tk.X, expand=True, side=tk.LEFT)
+                self.catButton.append(button)
+
+        # Label numbers typed with several digits
+        self.numberEntry = NumberEntry(self, lambda: len(self.classifier.categories),
+                                       lambda idx: self.apply_label(self.classifier.categories[idx]),
+                                       self.classifier.numberTimeout)
+
+        self.bind("<Key>", self.keypress_handler)
+        self.bind("<Left>", self.previous_page)
+        self.bind("<Right>", self.next_page)
+
+    def page_images(self, page):
+        return self.classifier.image_list[page*self.pageSize:(page+1)*self.pageSize]
+
+    @property
+    def max_page(self):
+        return max(0, (len(self.classifier.image_list) - 1) // self.pageSize)
+
+    def show_page(self):
+        '''Draws the current page and prefetches the next one'''
+
+        images = self.page_images(self.page)
+        self.loader.request(images)
+        self.loader.request(self.page_images(self.page + 1))
+
+        self.selected = set()
+        self.photos = {}
+        self.cv.delete("all")
+        for idx, img in enumerate(images):
+            self.draw_cell(idx, img)
+
+        self.pageLabel.config(text="Page {}/{}".format(self.page+1, self.max_page+1))
+        self.prevButton.config(state=tk.NORMAL if self.page > 0 else tk.DISABLED)
+        self.nextButton.config(state=tk.NORMAL if self.page < self.max_page else tk.DISABLED)
+
+        self.poll_thumbnails()
+
+    def draw_cell(self, idx, img):
+        '''Draws the selection frame and caption of a cell, the thumbnail is added when ready'''
+        x0 = (idx % self.columns) * self.cellWidth
+        y0 = (idx // self.columns) * self.cellHeight
+        tag = "cell{}".format(idx)
+        self.cv.delete(tag)
+        outline = '#3E4149' if img in self.selected else ''
+        self.cv.create_rectangle(x0+2, y0+2, x0+self.cellWidth-2, y0+self.cellHeight-2, outline=outline, width=3, tags=tag)
+        if img in self.photos:
+            self.cv.create_image(x0 + self.cellWidth//2, y0 + 5 + self.thumbSize[1]//2, image=self.photos[img], tags=tag)
+        label = self.current_label(img)
+        color = self.classifier.userColor if label else 'black'
+        self.cv.create_text(x0 + self.cellWidth//2, y0 + self.cellHeight - 12, text=label or '', fill=color, tags=tag)
+
+    def current_label(self, img):
+        if self.classifier.reconciledLabelsDict and img in self.classifier.reconciledLabelsDict:
+            label = self.classifier.reconciledLabelsDict[img]
+        else:
+            label = self.classifier.labeled.get(img)
+        if label is None:
+            return None
+        return ', '.join(self.classifier.label_names(label))
+
+    def poll_thumbnails(self):
+        '''Adds the thumbnails that are ready and reschedules itself until the page is complete'''
+        self.polling = None
+        pending = []
+        for idx, img in enumerate(self.page_images(self.page)):
+            if img in self.photos:
+                continue
+            thumb = self.loader.get(img)
+            if thumb is None:
+                pending.append(img)
+                continue
+            self.photos[img] = ImageTk.PhotoImage(thumb)
+            self.draw_cell(idx, img)
+        if pending:
+            # Thumbnails released by the memory budget before they were shown are generated again
+            self.loader.request(pending)
+            self.polling = self.after(30, self.poll_thumbnails)
+
+    def click_handler(self, event):
+        '''Toggles the selection of the thumbnail under the cursor'''
+        col = event.x // self.cellWidth
+        row = event.y // self.cellHeight
+        images = self.page_images(self.page)
+        idx = row * self.columns + col
+        if col >= self.columns or idx >= len(images):
+            return
+        img = images[idx]
+        if img in self.selected:
+            self.selected.remove(img)
+        else:
+            self.selected.add(img)
+        self.draw_cell(idx, img)
+
+    def select_all(self, *args):
+        images = self.page_images(self.page)
+        self.selected = set(images)
+        for idx, img in enumerate(images):
+            self.draw_cell(idx, img)
+
+    def apply_label(self, category):
+        '''Labels all selected images with category'''
+        if not self.selected:
+            logging.info("No image selected")
+            return
+        images = [img for img in self.page_images(self.page) if img in self.selected]
+        self.classifier.classify_many(images, category)
+        self.selected = set()
+        for idx, img in enumerate(self.page_images(self.page)):
+            self.draw_cell(idx, img)
+
+    def in_palette(self, args):
+        '''Returns True for the key events of the label search field, whose keys are not shortcuts'''
+        return bool(args) and self.palette is not None and getattr(args[0], 'widget', None) is self.palette.entry
+
+    def previous_page(self, *args):
+        if self.in_palette(args):
+            return
+        if self.page > 0:
+            self.page -= 1
+            self.show_page()
+
+    def next_page(self, *args):
+        if self.in_palette(args):
+            return
+        if self.page < self.max_page:
+            self.page += 1
+            self.show_page()
+
+    def keypress_handler(self, e):
+        if self.in_palette([e]):
+            return
+        if e.char and e.char in '0123456789':
+            self.numberEntry.key(e.char)
+        elif e.char == 'a':
+            self.select_all()
+        elif e.char == 'q':
+            self.close()
+        elif e.char == '/' and self.palette:
+            self.palette.focus_search()
+
+    def close(self):
+        '''Stops thumbnail generation and closes the window'''
+        if self.polling:
+            self.after_cancel(self.polling)
+        self.numberEntry.cancel()
+        self.loader.shutdown()
+        self.classifier.memory.unregister(self.loader)
+        self.classifier.gridView = None
+        self.destroy()
@@ -0,0 +1,186 @@
+import os
+import gzip
+import json
+import time
+import logging
+from bisect import bisect_right
+
+
+class LabelHistory(object):
+    '''
+    Append-only log of the label changes of a user, with snapshots to rebuild the labels at any point in time.
+
+    Events {t, user, img, old, new, action} are buffered in memory and appended to the current segment of the log
+    by flush(). Each segment starts with a snapshot of the labels at its start time. When a segment holds
+    segmentEvents events, it is compacted (gzipped) and a new segment is started with a snapshot of the labels
+    at that time, so rebuilding the labels at a given time only replays the events of one segment.
+
+    Files are stored in .simplabel_history/<user>/: <seq>.snapshot.json, <seq>.jsonl (or .jsonl.gz once
+    compacted) and index.json listing [seq, start time, number of events] of each segment.
+
+    Parameters
+    ----------
+    directory : string
+        Directory containing the label files
+    username : string
+        User whose history is recorded
+    segmentEvents : int
+        Number of events per segment
+    '''
+
+    dirname = '.simplabel_history'
+
+    def __init__(self, directory, username, segmentEvents=10000):
+        self.username = username
+        self.userDir = os.path.join(directory, self.dirname, username)
+        self.segmentEvents = segmentEvents
+        self.buffer = []
+        self.index = self._load_index()
+
+    def start(self, labels, timestamp=None):
+        '''Starts the history with a snapshot of the current labels if there is none yet'''
+        if not self.index['segments']:
+            self._new_segment(1, labels, time.time() if timestamp is None else timestamp)
+
+    def record(self, img, old, new, action='classify', timestamp=None):
+        '''Buffers a change of the label of img from old to new (None when there is no label)'''
+        if old == new and action != 'add_label':
+            return
+        self.buffer.append({'t': time.time() if timestamp is None else timestamp, 'user': self.username, 'img': img,
+                            'old': old, 'new': new, 'action': action})
+
+    def take(self):
+        '''Returns the buffered events and empties the buffer, to append them with flush() in a worker thread'''
+        (events, self.buffer) = (self.buffer, [])
+        return events
+
+    def flush(self, events=None):
+        '''Appends the buffered events (or events returned by take()) to the log'''
+        pending = self.take() if events is None else events
+        if not pending:
+            return
+        if not self.index['segments']:
+            self.start({}, pending[0]['t'])
+
+        while pending:
+            seq, start, count = self.index['segments'][-1]
+            room = self.segmentEvents - count
+            if room <= 0:
+                self._roll_over()
+                continue
+            events, pending = pending[:room], pending[room:]
+            with open(self._segment_path(seq), 'a') as f:
+                f.write(''.join(json.dumps(event) + '\n' for event in events))
+            self.index['segments'][-1][2] += len(events)
+            self._save_index()
+
+    def state_at(self, timestamp=None):
+        '''Returns the labels {img: label} as they were at timestamp (now if None)'''
+        self.flush()
+        segments = self.index['segments']
+        if not segments:
+            return {}
+        timestamp = time.time() if timestamp is None else timestamp
+        pos = max(0, bisect_right([start for (_, start, _) in segments], timestamp) - 1)
+        seq, start, _ = segments[pos]
+        if timestamp < start:
+            return {}
+        labels = self._load_snapshot(seq)
+        for event in self.events(seq):
+            if event['t'] > timestamp:
+                break
+            self._apply(labels, event)
+        return labels
+
+    def events(self, seq=None):
+        '''Yields the events of segment seq, or of all segments'''
+        for (segment, _, _) in self.index['segments']:
+            if seq is not None and segment != seq:
+                continue
+            path = self._segment_path(segment)
+            if os.path.isfile(path + '.gz'):
+                f = gzip.open(path + '.gz', 'rt')
+            elif os.path.isfile(path):
+                f = open(path, 'r')
+            else:
+                continue
+            with f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+    def _roll_over(self):
+        '''Snapshots the labels at the end of the current segment, compacts it and starts a new one'''
+        seq, _, _ = self.index['segments'][-1]
+        labels = self._load_snapshot(seq)
+        last = None
+        for event in self.events(seq):
+            self._apply(labels, event)
+            last = event['t']
+        path = self._segment_path(seq)
+        with open(path, 'rb') as src, gzip.open(path + '.gz', 'wb') as dst:
+            dst.write(src.read())
+        os.remove(path)
+        self._new_segment(seq + 1, labels, time.time() if last is None else last)
+        logging.info("History of {} - compacted segment {}".format(self.username, seq))
+
+    def _new_segment(self, seq, labels, start):
+        os.makedirs(self.userDir, exist_ok=True)
+        self._write_json(os.path.join(self.userDir, '{:08d}.snapshot.json'.format(seq)), labels)
+        open(self._segment_path(seq), 'a').close()
+        self.index['segments'].append([seq, start, 0])
+        self._save_index()
+
+    @staticmethod
+    def _apply(labels, event):
+        if event['img'] is None:
+            return
+        if event['new'] is None:
+            labels.pop(event['img'], None)
+        else:
+            labels[event['img']] = event['new']
+
+    def _segment_path(self, seq):
+        return os.path.join(self.userDir, '{:08d}.jsonl'.format(seq))
+
+    def _load_snapshot(self, seq):
+        with open(os.path.join(self.userDir, '{:08d}.snapshot.json'.format(seq)), 'r') as f:
+            return json.load(f)
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.userDir, 'index.json'), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'segments': []}
+
+    def _save_index(self):
+        self._write_json(os.path.join(self.userDir, 'index.json'), self.index)
+
+    @staticmethod
+    def _write_json(path, data):
+        tmppath = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmppath, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmppath, path)
+
+
+def parse_time(value):
+    '''Parses a unix timestamp or an ISO date ('2024-05-01' or '2024-05-01 18:30') into a timestamp'''
+    from datetime import datetime
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def materialize(directory, username, at=None, output=None):
+    '''Writes (or prints) the labels of username as they were at the time at'''
+    labels = LabelHistory(directory, username).state_at(parse_time(at) if at else None)
+    if output:
+        with open(output, 'w') as f:
+            json.dump(labels, f)
+        print("Saved {} labels of {} to {}".format(len(labels), username, output))
+    else:
+        print(json.dumps(labels, indent=1))
+    return labels
@@ -0,0 +1,132 @@
+import logging
+from functools import reduce
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Separator between a parent label and its children, e.g. 'Animal/Cat' is a child of 'Animal'
+separator = '/'
+
+
+def ancestors(label):
+    '''Returns the ancestors of a hierarchical label, closest first'''
+    parts = label.split(separator)
+    return [separator.join(parts[:i]) for i in range(len(parts) - 1, 0, -1)]
+
+
+class LabelSpace(object):
+    '''
+    Encodes the set of labels of an image as a bitset over the category list.
+
+    Bit i of a mask is set when categories[i] applies to the image. Python integers are used as bitsets so there
+    is no limit on the number of categories. Categories can form a hierarchy through their names: 'Animal/Cat'
+    is a child of 'Animal'. Adding a label to a mask also adds its ancestors and removing a label also removes
+    its descendants, so masks are always consistent with the hierarchy.
+
+    Parameters
+    ----------
+    categories : list[string]
+        Category list, the position of a category is its bit
+    '''
+
+    def __init__(self, categories):
+        self.categories = list(categories)
+        self.bits = {category: idx for idx, category in enumerate(self.categories)}
+
+        # Mask of each category with its ancestors, and with its descendants
+        self.upMasks = []
+        self.downMasks = [1 << idx for idx in range(len(self.categories))]
+        for idx, category in enumerate(self.categories):
+            mask = 1 << idx
+            for parent in ancestors(category):
+                if parent in self.bits:
+                    mask |= 1 << self.bits[parent]
+                    self.downMasks[self.bits[parent]] |= 1 << idx
+            self.upMasks.append(mask)
+
+    def encode(self, labels):
+        '''Returns the mask of a list of labels, including their ancestors'''
+        mask = 0
+        for label in labels:
+            if label in self.bits:
+                mask |= self.upMasks[self.bits[label]]
+            else:
+                logging.warning("Unknown label {} ignored".format(label))
+        return mask
+
+    def decode(self, mask):
+        '''Returns the labels set in mask, in category order'''
+        return [category for idx, category in enumerate(self.categories) if mask >> idx & 1]
+
+    def leaves(self, mask):
+        '''Returns the most specific labels set in mask (labels none of whose children are set)'''
+        return [category for idx, category in enumerate(self.categories)
+                if mask >> idx & 1 and not mask & self.downMasks[idx] & ~(1 << idx)]
+
+    def add(self, mask, label):
+        return mask | self.upMasks[self.bits[label]]
+
+    def remove(self, mask, label):
+        return mask & ~self.downMasks[self.bits[label]]
+
+    def toggle(self, mask, label):
+        '''Adds label to mask if it is not set, removes it otherwise'''
+        if mask >> self.bits[label] & 1:
+            return self.remove(mask, label)
+        return self.add(mask, label)
+
+    def as_mask(self, label):
+        '''Converts a saved label (single label name or mask) to a mask'''
+        if isinstance(label, int):
+            return label
+        if label is None:
+            return 0
+        return self.encode([label])
+
+    def names(self, label):
+        '''Returns the label names of a saved label (single label name or mask)'''
+        if isinstance(label, int):
+            return self.decode(label)
+        return [label]
+
+    def names_used(self, labels):
+        '''Returns the set of label names used by a collection of saved labels'''
+        used = set()
+        for label in labels:
+            used.update(self.names(label))
+        return used
+
+    def agreement(self, masksByImage):
+        '''
+        Returns {img: (intersection, union)} of the masks given by each user for each image.
+
+        The users agree on an image when the intersection equals the union. With numpy and at most 63
+        categories, the reductions are computed for all images at once on uint64 arrays.
+        '''
+        images = list(masksByImage)
+        if not images:
+            return {}
+
+        if np is not None and len(self.categories) < 64:
+            nUsers = max(len(masks) for masks in masksByImage.values())
+            full = (1 << 63) - 1
+            # Missing users are padded with the neutral element of each reduction
+            andArray = np.full((len(images), nUsers), full, dtype=np.uint64)
+            orArray = np.zeros((len(images), nUsers), dtype=np.uint64)
+            for row, img in enumerate(images):
+                masks = masksByImage[img]
+                andArray[row, :len(masks)] = masks
+                orArray[row, :len(masks)] = masks
+            intersections = np.bitwise_and.reduce(andArray, axis=1)
+            unions = np.bitwise_or.reduce(orArray, axis=1)
+            return {img: (int(intersections[row]), int(unions[row])) for row, img in enumerate(images)}
+
+        return {img: (reduce(lambda a, b: a & b, masks), reduce(lambda a, b: a | b, masks))
+                for img, masks in masksByImage.items()}
+
+    @staticmethod
+    def drop_bit(mask, idx):
+        '''Returns mask with bit idx removed and the higher bits shifted down (after removing a category)'''
+        return (mask & ((1 << idx) - 1)) | (mask >> (idx + 1) << idx)
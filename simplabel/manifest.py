@@ -0,0 +1,196 @@
+import os
+import csv
+import json
+import math
+import hashlib
+import logging
+from bisect import bisect_right
+from collections import Counter
+
+from .labelsets import LabelSpace
+
+
+class StratifiedSplitter(object):
+    '''
+    Assigns entries to train/val/test splits in a single pass, deterministically for a given seed.
+
+    Each entry draws a split from a seeded hash of its key. Counts are kept per stratum (label) and a draw that
+    would put a split more than one entry above its target share of the stratum is redirected to the split
+    furthest below its target, so every stratum is split in the requested proportions. Memory only depends on
+    the number of strata (and of groups when entries are grouped).
+
+    Parameters
+    ----------
+    fractions : list[float]
+        Share of each split, normalized to sum to 1
+    seed : int
+        Seed of the hash used to draw the splits
+    names : list[string]
+        Names of the splits
+    '''
+
+    def __init__(self, fractions=(0.8, 0.1, 0.1), seed=0, names=('train', 'val', 'test')):
+        total = float(sum(fractions))
+        self.fractions = [fraction / total for fraction in fractions]
+        self.names = list(names)[:len(self.fractions)]
+        self.cumulative = []
+        acc = 0.0
+        for fraction in self.fractions[:-1]:
+            acc += fraction
+            self.cumulative.append(acc)
+        self.seed = seed
+        self.counts = {}
+        self.groups = {}
+
+    def uniform(self, key):
+        '''Returns a number in [0, 1) derived from the seed and key'''
+        digest = hashlib.blake2b("{}:{}".format(self.seed, key).encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') / 2**64
+
+    def assign(self, key, stratum):
+        '''Returns the split of the entry key in stratum'''
+        counts = self.counts.setdefault(stratum, [0] * len(self.fractions))
+        seen = sum(counts) + 1
+        choice = bisect_right(self.cumulative, self.uniform(key))
+        if counts[choice] + 1 > math.ceil(self.fractions[choice] * seen):
+            choice = max(range(len(self.fractions)), key=lambda i: self.fractions[i] * seen - counts[i])
+        counts[choice] += 1
+        return self.names[choice]
+
+    def assign_group(self, group, key, stratum):
+        '''Returns the split of the entry key, all the entries of a group go to the split of its first entry'''
+        if group not in self.groups:
+            self.groups[group] = self.assign(group, stratum)
+        else:
+            counts = self.counts.setdefault(stratum, [0] * len(self.fractions))
+            counts[self.names.index(self.groups[group])] += 1
+        return self.groups[group]
+
+
+def image_group(img):
+    '''Returns the subdirectory (or archive directory) of an image'''
+    return img.rsplit('/', 1)[0] if '/' in img else ''
+
+
+def iter_records(directory, user=None):
+    '''
+    Yields a record {'path', 'label', 'labelers', 'agreement'} per labeled image, without copying the dictionaries.
+
+    The label is taken from the master dictionary, or from user's dictionary if passed. Without either, the label
+    is the one chosen by most labelers, not counting the pre-labels of the 'model' user. Agreement is the fraction
+    of labelers who chose that label. Multi-label bitsets are decoded to the list of their labels.
+    '''
+    users = sorted(f[len('labeled_'):-len('.json')] for f in os.listdir(directory)
+                   if f.startswith('labeled_') and f.endswith('.json'))
+    userDicts = {}
+    for name in users:
+        if name != 'master' and (name != 'model' or name == user):
+            with open(os.path.join(directory, 'labeled_{}.json'.format(name)), 'r') as f:
+                userDicts[name] = json.load(f)
+
+    if user is None and 'master' in users:
+        user = 'master'
+    if user == 'master':
+        with open(os.path.join(directory, 'labeled_master.json'), 'r') as f:
+            reference = json.load(f)
+    elif user is not None:
+        if user not in userDicts:
+            raise ValueError("No labels found for user {}".format(user))
+        reference = userDicts[user]
+    else:
+        reference = None
+
+    # Bitsets of multi-label projects are decoded with the category list
+    labelSpace = LabelSpace([])
+    labelFile = os.path.join(directory, '.labels.json')
+    if os.path.isfile(labelFile):
+        with open(labelFile, 'r') as f:
+            labelSpace = LabelSpace(json.load(f))
+
+    def images():
+        if reference is not None:
+            yield from reference
+        else:
+            previous = []
+            for labels in userDicts.values():
+                yield from (img for img in labels if not any(img in other for other in previous))
+                previous.append(labels)
+
+    for img in images():
+        votes = {name: labels[img] for (name, labels) in userDicts.items() if img in labels}
+        if reference is not None:
+            label = reference[img]
+        else:
+            label = Counter(votes.values()).most_common(1)[0][0]
+        # Single labels saved before the project became multi-label count as the equivalent bitset
+        if isinstance(label, int):
+            votes = {name: labelSpace.as_mask(vote) for (name, vote) in votes.items()}
+        agreeing = sum(1 for vote in votes.values() if vote == label)
+        yield {'path': img,
+               'label': labelSpace.decode(label) if isinstance(label, int) else label,
+               'labelers': sorted(votes),
+               'agreement': round(agreeing / len(votes), 4) if votes else 1.0}
+
+
+def export_manifest(directory, outputPath, user=None, splits=(0.8, 0.1, 0.1), seed=0, groupByDirectory=False,
+                    project=None, images=None):
+    '''
+    Writes a csv or jsonl (depending on the extension of outputPath) manifest of the labeled images
+
+    Records are written as they are read with their split, see iter_records and StratifiedSplitter. Returns
+    the number of records written to each split.
+
+    Arguments
+    --------
+    directory: string
+        Path to the directory containing the label files
+    outputPath: string
+        Path of the manifest to write (.csv or .jsonl)
+    user: string
+        Labels to export ('master' or a username), defaults to master if it exists else to the majority label
+    splits: list[float]
+        Share of the train, val and test splits (pass an empty list to leave the split out)
+    seed: int
+        Seed of the split assignment
+    groupByDirectory: bool
+        Keep all the images of a subdirectory in the same split
+    project: Project
+        Multi-root project whose labels are in directory, paths are then written as the paths of the images in
+        its roots
+    images: set[string]
+        Images to export if passed (e.g. without duplicates), the other labeled images are left out
+    '''
+
+    splitter = StratifiedSplitter(splits, seed) if splits else None
+    counts = Counter()
+    jsonl = outputPath.lower().endswith(('.jsonl', '.ndjson'))
+
+    with open(outputPath, 'w', newline='') as f:
+        if not jsonl:
+            writer = csv.writer(f)
+            writer.writerow(['path', 'label', 'labelers', 'agreement'] + (['split'] if splitter else []))
+
+        for record in iter_records(directory, user):
+            if images is not None and record['path'] not in images:
+                continue
+            if splitter:
+                stratum = tuple(record['label']) if isinstance(record['label'], list) else record['label']
+                if groupByDirectory:
+                    record['split'] = splitter.assign_group(image_group(record['path']), record['path'], stratum)
+                else:
+                    record['split'] = splitter.assign(record['path'], stratum)
+                counts[record['split']] += 1
+            else:
+                counts['all'] += 1
+            if project is not None:
+                record['path'] = project.image_path(record['path'])
+
+            if jsonl:
+                f.write(json.dumps(record) + '\n')
+            else:
+                label = '|'.join(record['label']) if isinstance(record['label'], list) else record['label']
+                row = [record['path'], label, '|'.join(record['labelers']), record['agreement']]
+                writer.writerow(row + ([record['split']] if splitter else []))
+
+    logging.info("Wrote manifest of {} images to {}: {}".format(sum(counts.values()), outputPath, dict(counts)))
+    return dict(counts)
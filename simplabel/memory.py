@@ -0,0 +1,81 @@
+import os
+import sys
+import logging
+
+
+def current_rss():
+    '''Returns the resident set size of this process in bytes, None if it cannot be measured'''
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # Peak rather than current RSS, in bytes on macOS and kB elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        return None
+
+
+class MemoryGovernor(object):
+    '''
+    Single memory budget shared by the image buffers held by the app (display, prefetches and caches).
+
+    Consumers are objects with memory_usage() returning the bytes they hold and release(nbytes) freeing at least
+    nbytes if they can and returning the number of bytes freed. enforce() asks consumers to release memory, in
+    the order they were registered, until the total is within the budget: register what is cheapest to
+    rebuild first.
+
+    Parameters
+    ----------
+    budget : int
+        Memory budget in bytes (0 to disable)
+    '''
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.consumers = []
+
+    def register(self, name, consumer):
+        if all(registered is not consumer for (_, registered) in self.consumers):
+            self.consumers.append((name, consumer))
+
+    def unregister(self, consumer):
+        self.consumers = [(name, registered) for (name, registered) in self.consumers if registered is not consumer]
+
+    def usage(self):
+        '''Returns {consumer name: bytes held}'''
+        usage = {}
+        for (name, consumer) in self.consumers:
+            usage[name] = usage.get(name, 0) + consumer.memory_usage()
+        return usage
+
+    def enforce(self):
+        '''Releases memory until the consumers fit in the budget, returns the bytes they still hold'''
+        total = sum(self.usage().values())
+        if not self.budget:
+            return total
+        for (name, consumer) in self.consumers:
+            if total <= self.budget:
+                break
+            freed = consumer.release(total - self.budget)
+            if freed:
+                logging.debug("Memory budget - released {:.1f} MB of {}".format(freed / 1024**2, name))
+            total -= freed
+        return total
+
+    def report(self):
+        '''Returns a one-line summary of the memory in use'''
+        rss = current_rss()
+        parts = ["RSS {}".format("{:.0f} MB".format(rss / 1024**2) if rss is not None else "unknown")]
+        if self.budget:
+            parts.append("budget {:.0f} MB".format(self.budget / 1024**2))
+        parts.extend("{} {:.1f} MB".format(name, size / 1024**2) for (name, size) in self.usage().items())
+        return " - ".join(parts)
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import logging
+
+
+class SessionMetrics(object):
+    '''
+    Records the labeling activity of a user: when images are shown, labeled or skipped and how long they were looked at.
+
+    Events {t, session, event, img, dwell, label} are buffered in memory and appended to
+    .simplabel_metrics/<user>.jsonl every flushEvery events and by flush(). event is 'start' and 'end' for the
+    session, 'classify' when the image shown is labeled and 'navigate' when the user moves away from an image
+    without labeling it. dwell is the time in seconds since the image was shown.
+
+    Parameters
+    ----------
+    directory : string
+        Directory containing the label files
+    username : string
+        User whose activity is recorded
+    flushEvery : int
+        Number of events buffered before they are written
+    '''
+
+    dirname = '.simplabel_metrics'
+
+    def __init__(self, directory, username, flushEvery=100):
+        self.path = metrics_path(directory, username)
+        self.flushEvery = flushEvery
+        self.session = int(time.time() * 1000)
+        self.buffer = []
+        self.current = None
+        self.shownAt = None
+        self.labeledCurrent = False
+        self.record('start')
+
+    def record(self, event, img=None, dwell=None, label=None):
+        self.buffer.append({'t': time.time(), 'session': self.session, 'event': event, 'img': img,
+                            'dwell': dwell, 'label': label})
+        if len(self.buffer) >= self.flushEvery:
+            self.flush()
+
+    def shown(self, img):
+        '''Called when img is displayed, records a navigation event if the previous image was left unlabeled'''
+        if img == self.current:
+            return
+        now = time.time()
+        if self.current is not None and not self.labeledCurrent:
+            self.record('navigate', self.current, round(now - self.shownAt, 3))
+        self.current = img
+        self.shownAt = now
+        self.labeledCurrent = False
+
+    def classified(self, img, label):
+        '''Called when img is labeled'''
+        dwell = round(time.time() - self.shownAt, 3) if img == self.current and self.shownAt else None
+        self.record('classify', img, dwell, label)
+        if img == self.current:
+            self.labeledCurrent = True
+
+    def flush(self):
+        '''Appends the buffered events to the metrics file of the user'''
+        if not self.buffer:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a') as f:
+                f.write(''.join(json.dumps(event) + '\n' for event in self.buffer))
+        except OSError as e:
+            logging.warning("Could not save the session metrics: {}".format(e))
+        self.buffer = []
+
+    def close(self):
+        # Leaving the app leaves the current image
+        self.shown(None)
+        self.record('end')
+        self.flush()
+
+
+def metrics_path(directory, username):
+    return os.path.join(directory, SessionMetrics.dirname, username + '.jsonl')
+
+
+def iter_events(directory, users=None):
+    '''Yields (user, event) for the recorded events of users (all users if None)'''
+    folder = os.path.join(directory, SessionMetrics.dirname)
+    if not os.path.isdir(folder):
+        return
+    for f in sorted(os.listdir(folder)):
+        user = f[:-len('.jsonl')]
+        if not f.endswith('.jsonl') or (users and user not in users):
+            continue
+        with open(os.path.join(folder, f), 'r') as fd:
+            for line in fd:
+                try:
+                    yield user, json.loads(line)
+                except ValueError:
+                    # Line cut short by a crash
+                    continue
+
+
+def percentile(values, q):
+    '''Returns the q-th percentile (0-100) of a sorted list'''
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def aggregate(directory, users=None, idleGap=120):
+    '''
+    Returns the activity of each user and day as {(user, day): stats}
+
+    Gaps of more than idleGap seconds between two events of a session count as idle time. stats holds the number
+    of labels, of skipped images and of sessions, the active and idle minutes, the labels per active minute and
+    the median and 90th percentile of the time to decision (dwell of labeled images).
+    '''
+    groups = {}
+    lastEvent = {}
+    for user, event in iter_events(directory, users):
+        day = time.strftime('%Y-%m-%d', time.localtime(event['t']))
+        stats = groups.setdefault((user, day), {'labels': 0, 'skipped': 0, 'sessions': set(), 'active': 0.0,
+                                                'idle': 0.0, 'dwells': []})
+        stats['sessions'].add(event['session'])
+        previous = lastEvent.get((user, event['session']))
+        if previous is not None:
+            gap = max(0.0, event['t'] - previous)
+            if gap > idleGap:
+                stats['idle'] += gap
+            else:
+                stats['active'] += gap
+        lastEvent[(user, event['session'])] = event['t']
+
+        if event['event'] == 'classify':
+            stats['labels'] += 1
+            if event['dwell'] is not None:
+                stats['dwells'].append(event['dwell'])
+        elif event['event'] == 'navigate':
+            stats['skipped'] += 1
+
+    report = {}
+    for key, stats in groups.items():
+        dwells = sorted(stats['dwells'])
+        active = stats['active'] / 60
+        report[key] = {'labels': stats['labels'], 'skipped': stats['skipped'], 'sessions': len(stats['sessions']),
+                       'active_min': round(active, 1), 'idle_min': round(stats['idle'] / 60, 1),
+                       'labels_per_min': round(stats['labels'] / active, 2) if active else None,
+                       'dwell_median': percentile(dwells, 50), 'dwell_p90': percentile(dwells, 90)}
+    return report
+
+
+def print_report(directory, users=None, idleGap=120):
+    '''Prints the throughput and latency of each user and day'''
+    report = aggregate(directory, users, idleGap)
+    if not report:
+        print("No metrics recorded in {}".format(directory))
+        return report
+    columns = ['labels', 'skipped', 'sessions', 'active_min', 'idle_min', 'labels_per_min', 'dwell_median', 'dwell_p90']
+    print(("{:<16}{:<12}" + "{:>15}" * len(columns)).format('user', 'day', *columns))
+    for (user, day), stats in sorted(report.items()):
+        values = ['-' if stats[c] is None else stats[c] for c in columns]
+        print(("{:<16}{:<12}" + "{:>15}" * len(columns)).format(user, day, *values))
+    return report
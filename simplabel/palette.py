@@ -0,0 +1,270 @@
+import tkinter as tk
+from bisect import bisect_left
+from functools import partial
+
+from .render import WidgetStyler
+
+
+class LabelIndex(object):
+    '''
+    Prefix and fuzzy search over a list of labels.
+
+    Matches are ranked: labels starting with the query first, then labels with a word starting with the query,
+    then labels containing the characters of the query in order (the more compact the better). Prefix lookups use
+    sorted lists and bisection. Searches are incremental: when the query extends the previous one, only the
+    previous matches are considered.
+
+    Parameters
+    ----------
+    labels : list[string]
+        Labels to search
+    '''
+
+    def __init__(self, labels):
+        self.names = [label.lower() for label in labels]
+        self.sortedNames = sorted((name, idx) for idx, name in enumerate(self.names))
+        self.sortedWords = sorted((word, idx) for idx, name in enumerate(self.names) for word in name.split())
+        self.lastQuery = None
+        self.lastMatches = None
+
+    def search(self, query):
+        '''Returns the indexes of the labels matching query, best matches first'''
+        query = query.strip().lower()
+        if not query:
+            return list(range(len(self.names)))
+
+        if self.lastQuery and query.startswith(self.lastQuery):
+            candidates = self.lastMatches
+        else:
+            candidates = range(len(self.names))
+
+        prefix = sorted(self._prefix(self.sortedNames, query))
+        wordPrefix = sorted(set(self._prefix(self.sortedWords, query)) - set(prefix))
+        ranked = set(prefix) | set(wordPrefix)
+
+        fuzzy = []
+        for idx in candidates:
+            if idx in ranked:
+                continue
+            gaps = self._subsequence_gaps(query, self.names[idx])
+            if gaps is not None:
+                fuzzy.append((gaps, idx))
+        fuzzy.sort()
+
+        matches = prefix + wordPrefix + [idx for _, idx in fuzzy]
+        self.lastQuery = query
+        self.lastMatches = matches
+        return matches
+
+    @staticmethod
+    def _prefix(sortedList, query):
+        matches = []
+        for (name, idx) in sortedList[bisect_left(sortedList, (query, -1)):]:
+            if not name.startswith(query):
+                break
+            matches.append(idx)
+        return matches
+
+    @staticmethod
+    def _subsequence_gaps(query, name):
+        '''Number of skipped characters when matching query as a subsequence of name, None if it does not match'''
+        pos = -1
+        gaps = 0
+        for char in query:
+            found = name.find(char, pos + 1)
+            if found == -1:
+                return None
+            if pos != -1:
+                gaps += found - pos - 1
+            pos = found
+        return gaps
+
+
+class NumberEntry(object):
+    '''
+    Label numbers typed with the number keys, with more than 9 labels.
+
+    Digits are accumulated until no longer label number can start with them (then the label is applied at once),
+    or until no key is typed for timeout ms. With 12 labels, '2' applies label 2 immediately while '1' waits for
+    a second digit to tell label 1 from labels 10 to 12.
+
+    Parameters
+    ----------
+    widget : tkinter widget
+        Widget used to schedule the timeout
+    count : callable
+        Returns the number of labels
+    callback : callable
+        Called with the index of the label typed
+    timeout : int
+        Delay in ms after which the digits typed so far are applied
+    '''
+
+    def __init__(self, widget, count, callback, timeout=700):
+        self.widget = widget
+        self.count = count
+        self.callback = callback
+        self.timeout = timeout
+        self.buffer = ''
+        self.job = None
+
+    def key(self, digit):
+        '''Adds a digit, applies the number if it cannot be the start of a longer label number'''
+        self.cancel()
+        self.buffer += digit
+        if self.complete():
+            self.apply()
+        else:
+            self.job = self.widget.after(self.timeout, self.apply)
+
+    def complete(self):
+        '''Returns True if no label number longer than the digits typed starts with them'''
+        return self.buffer.startswith('0') or int(self.buffer) * 10 > self.count()
+
+    def apply(self):
+        '''Calls the callback with the label typed, if it exists, and clears the digits'''
+        self.job = None
+        idx = int(self.buffer) - 1 if self.buffer else -1
+        self.buffer = ''
+        if idx in range(self.count()):
+            self.callback(idx)
+
+    def cancel(self):
+        '''Stops the timeout, the digits are kept'''
+        if self.job:
+            self.widget.after_cancel(self.job)
+            self.job = None
+
+
+class LabelPalette(tk.Frame):
+    """
+    Label buttons for taxonomies too large to show one button per label.
+
+    Only a fixed number of buttons (slots) exist as widgets. They show a page of the labels matching the search
+    field and are reconfigured in place when the filter or the page changes. Type in the search field (focus it
+    with '/') to filter incrementally, Enter applies the best match and Escape clears the search.
+
+    Parameters
+    ----------
+    parent : tkinter widget
+        Parent of the palette
+    classifier : ImageClassifier
+        App whose categories are displayed
+    slots : int
+        Number of label buttons
+    columns : int
+        Number of buttons per row
+    command : callable
+        Called with the category of the button clicked, classifier.classify by default
+    """
+
+    def __init__(self, parent, classifier, slots=12, columns=4, command=None, *args, **kwargs):
+
+        tk.Frame.__init__(self, parent, *args, **kwargs)
+
+        self.classifier = classifier
+        self.command = command or classifier.classify
+        self.slots = slots
+        self.columns = columns
+        self.styler = WidgetStyler()
+        self.colors = {}
+        self.page = 0
+        self.index = LabelIndex(classifier.categories)
+        self.results = list(range(len(classifier.categories)))
+
+        # Search field and page buttons
+        searchFrame = tk.Frame(self, height=10, bd=2)
+        searchFrame.pack(side=tk.TOP, fill=tk.X)
+        tk.Label(searchFrame, text='Search (/):').pack(side=tk.LEFT)
+        self.entry = tk.Entry(searchFrame)
+        self.entry.pack(side=tk.LEFT, fill=tk.X, expand=tk.YES)
+        self.entry.bind("<KeyRelease>", self.search_handler)
+        self.entry.bind("<Return>", self.apply_best_match)
+        self.entry.bind("<Escape>", self.clear)
+        self.prevButton = tk.Button(searchFrame, text='<', width=3, command=self.previous_page)
+        self.prevButton.pack(side=tk.LEFT)
+        self.nextButton = tk.Button(searchFrame, text='>', width=3, command=self.next_page)
+        self.nextButton.pack(side=tk.LEFT)
+        self.addCatButton = tk.Button(searchFrame, text='+', width=3, command=classifier.add_label)
+        self.addCatButton.pack(side=tk.LEFT)
+
+        # Fixed set of label buttons
+        self.buttons = []
+        rowFrame = None
+        for slot in range(slots):
+            if slot % columns == 0:
+                rowFrame = tk.Frame(self, height=10, bd=2)
+                rowFrame.pack(side=tk.TOP, fill=tk.X)
+            button = tk.Button(rowFrame, text='', height=2, width=8, command=partial(self.invoke_slot, slot))
+            button.pack(fill=tk.X, expand=True, side=tk.LEFT)
+            self.buttons.append(button)
+
+        self.render()
+
+    def visible(self):
+        '''Indexes of the categories currently shown, in slot order'''
+        return self.results[self.page*self.slots:(self.page+1)*self.slots]
+
+    def render(self):
+        '''Updates the text, state and color of the slots, only changed options are sent to Tk'''
+        categories = self.classifier.categories
+        visible = self.visible()
+        for slot, button in enumerate(self.buttons):
+            if slot < len(visible):
+                idx = visible[slot]
+                color = self.colors.get(idx)
+                self.styler.apply(button, text="{} ({})".format(categories[idx], idx+1), state=tk.NORMAL,
+                                  highlightbackground=color or self.classifier.buttonOrigColor,
+                                  bg=color or self.classifier.buttonBgOrigColor)
+            else:
+                self.styler.apply(button, text='', state=tk.DISABLED,
+                                  highlightbackground=self.classifier.buttonOrigColor,
+                                  bg=self.classifier.buttonBgOrigColor)
+        nPages = max(1, (len(self.results) + self.slots - 1) // self.slots)
+        self.styler.apply(self.prevButton, state=tk.NORMAL if self.page > 0 else tk.DISABLED)
+        self.styler.apply(self.nextButton, state=tk.NORMAL if self.page < nPages - 1 else tk.DISABLED)
+
+    def set_colors(self, colors):
+        '''Sets the button colors as {category index: color}'''
+        self.colors = colors
+        self.render()
+
+    def filter(self, query):
+        self.results = self.index.search(query)
+        self.page = 0
+        self.render()
+
+    def invoke_slot(self, slot):
+        visible = self.visible()
+        if slot < len(visible):
+            self.command(self.classifier.categories[visible[slot]])
+
+    def search_handler(self, event):
+        if event.keysym not in ('Return', 'Escape'):
+            self.filter(self.entry.get())
+
+    def apply_best_match(self, *args):
+        if self.entry.get().strip() and self.results:
+            category = self.classifier.categories[self.results[0]]
+            self.clear()
+            self.command(category)
+        return 'break'
+
+    def focus_search(self, *args):
+        self.entry.focus_set()
+
+    def clear(self, *args):
+        self.entry.delete(0, tk.END)
+        self.filter('')
+        self.winfo_toplevel().focus_set()
+        return 'break'
+
+    def previous_page(self):
+        if self.page > 0:
+            self.page -= 1
+            self.render()
+
+    def next_page(self):
+        if (self.page + 1) * self.slots < len(self.results):
+            self.page += 1
+            self.render()
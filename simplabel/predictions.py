@@ -0,0 +1,141 @@
+import os
+import csv
+import json
+import logging
+
+from .store import LabelStore
+from .fslock import FsLock
+
+
+pathFields = ('path', 'image', 'img', 'file', 'filename')
+labelFields = ('label', 'class', 'category', 'prediction')
+confidenceFields = ('confidence', 'score', 'probability', 'prob')
+
+
+def _field(record, names, default=None):
+    for name in names:
+        if name in record:
+            return record[name]
+    return default
+
+
+def iter_predictions(path):
+    '''
+    Yields (image, label, confidence) from a csv or jsonl file of predictions, one line at a time
+
+    Csv files have a path, label and (optional) confidence column, either in this order or named in a header
+    (e.g. image,class,score). Jsonl files have one object per line with the same keys. A missing confidence is 1.
+    '''
+    if path.lower().endswith(('.jsonl', '.ndjson')):
+        with open(path, 'r') as f:
+            for (num, line) in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                img = _field(record, pathFields)
+                label = _field(record, labelFields)
+                if img is None or label is None:
+                    raise ValueError("Line {} of {} has no path or label".format(num, path))
+                yield img, label, float(_field(record, confidenceFields, 1.0))
+        return
+
+    with open(path, 'r', newline='') as f:
+        reader = csv.reader(f)
+        columns = (0, 1, 2)
+        for (num, row) in enumerate(reader, 1):
+            if not row:
+                continue
+            if num == 1:
+                header = [name.strip().lower() for name in row]
+                named = [next((header.index(name) for name in names if name in header), None)
+                         for names in (pathFields, labelFields, confidenceFields)]
+                if named[0] is not None and named[1] is not None:
+                    columns = tuple(named)
+                    continue
+            img = row[columns[0]].strip()
+            label = row[columns[1]].strip()
+            confidence = row[columns[2]].strip() if columns[2] is not None and columns[2] < len(row) else ''
+            yield img, label, float(confidence) if confidence else 1.0
+
+
+def import_predictions(directory, path, threshold=0.0, addLabels=False, historyEvery=100000):
+    '''
+    Merges the predictions of a model into the pre-labels of the 'model' user of directory
+
+    Predictions are streamed from path (see iter_predictions) and the label file of the model user is written once
+    at the end, so the import time grows linearly with the number of predictions. Predictions with a confidence
+    below threshold are skipped. When an image has several predictions, the most confident one is kept (all of
+    those above threshold in multi-label projects). Labels that are not in the label list are skipped unless
+    addLabels is true. Returns counts of the predictions read, imported and skipped. Raises RuntimeError if
+    another import into directory is running.
+
+    Arguments
+    --------
+    directory: string
+        Path to the directory containing the images and label files
+    path: string
+        Csv or jsonl file of (path, label, confidence)
+    threshold: float
+        Minimum confidence of the predictions imported
+    addLabels: bool
+        Adds the labels not in the label list instead of skipping them
+    historyEvery: int
+        Number of predictions after which the changes are written to the label history
+    '''
+    # Two imports at once would overwrite each other's predictions
+    user = LabelStore.modelUser
+    lock = FsLock(directory, user)
+    try:
+        lock.acquire()
+    except Exception:
+        raise RuntimeError("Predictions are already being imported in {}".format(directory))
+    try:
+        store = LabelStore(directory)
+        store.own(user)
+        root = os.path.abspath(directory)
+
+        counts = {'read': 0, 'imported': 0, 'below_threshold': 0, 'unknown_label': 0}
+        unknown = set()
+        confidences = {}
+        for (img, label, confidence) in iter_predictions(path):
+            counts['read'] += 1
+            if counts['read'] % historyEvery == 0:
+                store.history(user).flush()
+                logging.info("Read {} predictions".format(counts['read']))
+
+            if confidence < threshold:
+                counts['below_threshold'] += 1
+                continue
+
+            # Paths are stored relative to the directory with '/' separators
+            if os.path.isabs(img) and os.path.abspath(img).startswith(root + os.sep):
+                img = os.path.relpath(os.path.abspath(img), root)
+            img = img.replace(os.sep, '/')
+
+            label = store.sanitize_label_name(str(label))
+            if label not in store.categories:
+                if not addLabels:
+                    counts['unknown_label'] += 1
+                    unknown.add(label)
+                    continue
+                store.add_label(label)
+
+            if store.multiLabel:
+                # The first prediction of an image replaces the labels of an earlier import
+                mask = store.labelSpace.as_mask(store.get(user, img)) if img in confidences else 0
+                store.set(user, img, store.labelSpace.add(mask, label), action='import')
+                confidences[img] = max(confidence, confidences.get(img, confidence))
+                counts['imported'] += 1
+            elif confidence >= confidences.get(img, float('-inf')):
+                store.set(user, img, label, action='import')
+                confidences[img] = confidence
+                counts['imported'] += 1
+
+        store.flush()
+        if unknown:
+            logging.warning("Skipped {} predictions of labels not in the label list: {}".format(
+                counts['unknown_label'], sorted(unknown)[:10]))
+        logging.info("Imported {imported} of {read} predictions ({below_threshold} below threshold)".format(**counts))
+    finally:
+        lock.release()
+    return counts
@@ -0,0 +1,98 @@
+import os
+import csv
+import json
+import logging
+
+
+class ImagePrioritizer(object):
+    '''
+    Orders the images left to label by decreasing priority score (e.g. model uncertainty or class-balance deficit).
+
+    Scores come either from a file or from a python callable. A scores file is re-read lazily, only when its
+    modification time changes, so an external process can update the scores while the app is running.
+    A callable is only asked for the images it has not scored yet, in batches. Images whose score is outdated
+    (e.g. after their labels changed) can be scored again with score() in a worker thread, then update().
+
+    Parameters
+    ----------
+    source : string or callable
+        Path to a scores file (.json containing {image: score} or .csv with image,score rows) or a callable
+        taking a list of images and returning a list of scores
+    batchSize : int
+        Maximum number of images passed to the callable at once
+    '''
+
+    def __init__(self, source, batchSize=256):
+        self.source = source
+        self.batchSize = batchSize
+        self.scores = {}
+        self._mtime = None
+
+    def order(self, images):
+        '''Returns images sorted by decreasing score, unscored images keep their relative order at the end'''
+        self.refresh(images)
+        scores = self.scores
+        scored = [img for img in images if img in scores]
+        unscored = [img for img in images if img not in scores]
+        # sorted is stable so images with equal scores keep their (shuffled) order
+        return sorted(scored, key=lambda img: -scores[img]) + unscored
+
+    def refresh(self, images=()):
+        '''Reloads the scores file if it changed or scores the images that are missing a score'''
+        if callable(self.source):
+            missing = [img for img in images if img not in self.scores]
+            self.scores.update(self.score(missing))
+            if missing:
+                logging.debug("ImagePrioritizer - scored {} images".format(len(missing)))
+        else:
+            try:
+                mtime = os.stat(self.source).st_mtime
+            except FileNotFoundError:
+                logging.warning("Scores file not found: %s", self.source)
+                return
+            if mtime != self._mtime:
+                self.scores = self.load_scores(self.source)
+                self._mtime = mtime
+                logging.info("Loaded {} scores from {}".format(len(self.scores), self.source))
+
+    @property
+    def rescorable(self):
+        '''True if scores come from a callable, which can be asked again for outdated scores'''
+        return callable(self.source)
+
+    def score(self, images, token=None):
+        '''
+        Returns {image: score} from the callable, asked in batches, stopping if token is cancelled
+
+        The cached scores are left unchanged so it can run in a worker thread, see update().
+        '''
+        scores = {}
+        for start in range(0, len(images), self.batchSize):
+            if token is not None:
+                token.check()
+            batch = images[start:start + self.batchSize]
+            scores.update(zip(batch, map(float, self.source(batch))))
+        return scores
+
+    def update(self, scores):
+        '''Replaces the cached scores of the images in scores {image: score}'''
+        self.scores.update(scores)
+
+    @staticmethod
+    def load_scores(path):
+        '''Reads a scores file, either json {image: score} or csv with image,score rows'''
+        if path.lower().endswith('.json'):
+            with open(path, 'r') as f:
+                return {img: float(score) for img, score in json.load(f).items()}
+
+        scores = {}
+        with open(path, 'r', newline='') as f:
+            for row in csv.reader(f):
+                if len(row) < 2:
+                    continue
+                try:
+                    scores[row[0]] = float(row[1])
+                except ValueError:
+                    # Skip the header and malformed rows
+                    continue
+        return scores
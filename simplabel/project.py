@@ -0,0 +1,77 @@
+import os
+import json
+import logging
+
+
+class Project(object):
+    '''
+    Labeling project spanning several image directories (roots), e.g. on different disks or mounts.
+
+    The project file is a json file listing the roots, by name or as a list of paths (named after their last
+    directory), and optionally the directory where the labels of all the roots are saved (the directory of the
+    project file by default). Relative paths are relative to the project file.
+
+        {"roots": {"disk1": "/mnt/disk1/images", "nas": "/Volumes/nas/images"}, "labels": "labels"}
+
+    Images are identified across roots by keys qualified with the name of their root: 'disk1/img1.jpg'.
+
+    Parameters
+    ----------
+    path : string
+        Path of the project file
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        base = os.path.dirname(os.path.abspath(path))
+        with open(path, 'r') as f:
+            config = json.load(f)
+
+        roots = config.get('roots')
+        if not roots:
+            raise ValueError("Project file {} does not list any root".format(path))
+        if not isinstance(roots, dict):
+            roots = self.name_roots(roots)
+
+        # {name: absolute path} in the order of the project file
+        self.roots = {}
+        for (name, root) in roots.items():
+            if not name or '/' in name or name.startswith('.'):
+                raise ValueError("Invalid root name '{}' in {}".format(name, path))
+            self.roots[name] = os.path.normpath(os.path.join(base, os.path.expanduser(root)))
+
+        # Directory the labels are saved in
+        self.folder = os.path.normpath(os.path.join(base, os.path.expanduser(config.get('labels', '.'))))
+        os.makedirs(self.folder, exist_ok=True)
+        logging.info("Project {} - roots: {}, labels saved in {}".format(path, list(self.roots), self.folder))
+
+    @staticmethod
+    def name_roots(paths):
+        '''Returns {name: path} naming each root after its last directory, with a suffix for repeated names'''
+        roots = {}
+        for path in paths:
+            name = os.path.basename(os.path.normpath(os.path.expanduser(path)))
+            unique = name
+            count = 1
+            while unique in roots:
+                count += 1
+                unique = '{}_{}'.format(name, count)
+            roots[unique] = path
+        return roots
+
+    def split(self, img):
+        '''Returns the (root name, path relative to the root) of an image key'''
+        (name, _, relpath) = img.partition('/')
+        return (name, relpath)
+
+    def image_path(self, img):
+        '''Returns the path of an image from its key'''
+        (name, relpath) = self.split(img)
+        return os.path.join(self.roots[name], relpath)
+
+
+def image_path(directory, img, project=None):
+    '''Returns the path of an image key, in the roots of project if passed else in directory'''
+    if project is not None:
+        return project.image_path(img)
+    return os.path.join(directory, img)
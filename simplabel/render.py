@@ -0,0 +1,82 @@
+from PIL import Image, ImageTk
+
+
+class ImageRenderer(object):
+    '''
+    Displays images on a canvas through a single canvas item and a single PhotoImage.
+
+    The image is composed onto a reusable frame buffer of the canvas size which is then pasted into the
+    PhotoImage in place, so changing image does not create canvas items nor Tk images. The buffers are only
+    rebuilt when the canvas size changes.
+
+    Parameters
+    ----------
+    canvas : tkinter.Canvas
+        Canvas to draw on
+    background : string
+        Color of the canvas around the image
+    '''
+
+    def __init__(self, canvas, background='white'):
+        self.canvas = canvas
+        self.background = background
+        self.size = None
+        self.frame = None
+        self.photo = None
+        self.item = None
+
+    def show(self, im, size):
+        '''Displays im centered in a canvas area of size (width, height)'''
+        size = (max(1, int(size[0])), max(1, int(size[1])))
+        if size != self.size:
+            self._allocate(size)
+
+        # Clear the frame buffer and paste the image in its center
+        self.frame.paste(self.background, (0, 0) + size)
+        offset = ((size[0] - im.size[0]) // 2, (size[1] - im.size[1]) // 2)
+        if im.mode in ('RGBA', 'LA') or (im.mode == 'P' and 'transparency' in im.info):
+            im = im.convert('RGBA')
+            self.frame.paste(im, offset, im)
+        else:
+            self.frame.paste(im if im.mode in ('RGB', 'L') else im.convert('RGB'), offset)
+        self.photo.paste(self.frame)
+
+    def memory_usage(self):
+        '''Returns the bytes held by the frame buffer and the PhotoImage'''
+        return 2 * 3 * self.size[0] * self.size[1] if self.size else 0
+
+    def release(self, nbytes):
+        # The buffers are reused for every image and cannot be released
+        return 0
+
+    def _allocate(self, size):
+        self.size = size
+        self.frame = Image.new('RGB', size, self.background)
+        self.photo = ImageTk.PhotoImage(self.frame)
+        if self.item is None:
+            self.item = self.canvas.create_image(size[0] // 2, size[1] // 2, image=self.photo)
+        else:
+            self.canvas.coords(self.item, size[0] // 2, size[1] // 2)
+            self.canvas.itemconfig(self.item, image=self.photo)
+
+
+class WidgetStyler(object):
+    '''Remembers the options last applied to each widget and only sends the ones that changed to Tk'''
+
+    def __init__(self):
+        self.applied = {}
+
+    def apply(self, widget, **options):
+        previous = self.applied.setdefault(widget, {})
+        changed = {key: value for key, value in options.items() if previous.get(key) != value}
+        if changed:
+            widget.config(**changed)
+            previous.update(changed)
+        return bool(changed)
+
+    def forget(self, widget=None):
+        '''Forgets the state of widget (or of all widgets), e.g. after it has been recreated'''
+        if widget is None:
+            self.applied = {}
+        else:
+            self.applied.pop(widget, None)
@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import logging
+
+from .fslock import FsLock
+
+
+class WorkScheduler(object):
+    '''
+    Leases disjoint batches of unlabeled images to concurrent labelers.
+
+    Leases are stored in a shared file in the image directory as {image: {user: expiry}} and guarded
+    by a short-lived FsLock. Expired leases are dropped on every access so batches abandoned by a crashed
+    session are reclaimed automatically.
+
+    Parameters
+    ----------
+    directory : string
+        Directory containing the images (the lease file is stored there)
+    batchSize : int
+        Number of images leased to a user at once
+    redundancy : int
+        Number of distinct users an image can be leased to (1 for disjoint batches, >1 to deliberately
+        overlap labelers and measure agreement)
+    leaseDuration : float
+        Time in seconds after which a lease that has not been renewed is reclaimed
+    '''
+
+    def __init__(self, directory, batchSize=50, redundancy=1, leaseDuration=1800):
+        self.leasepath = os.path.join(directory, '.leases.json')
+        self.mutex = FsLock(directory, '_leases', leaseTimeout=10)
+        self.batchSize = batchSize
+        self.redundancy = max(1, redundancy)
+        self.leaseDuration = leaseDuration
+
+    def lease(self, user, candidates, labelCounts=None):
+        '''
+        Renews the leases held by user and tops them up to batchSize images from candidates.
+
+        Arguments
+        --------
+        user: str
+            Username requesting work
+        candidates: list[string]
+            Images that still need a label from this user, in preferred order
+        labelCounts: dict(string: int)
+            Number of labels already recorded for each image, those count towards the redundancy
+
+        Returns the list of images leased to user, in the order of candidates.
+        '''
+        labelCounts = labelCounts or {}
+        candidateSet = set(candidates)
+
+        with self._locked():
+            leases = self._load()
+            now = time.time()
+            expiry = now + self.leaseDuration
+
+            # Keep and renew the user's leases on images that still need work
+            mine = []
+            for img, holders in leases.items():
+                if user in holders:
+                    if img in candidateSet:
+                        holders[user] = expiry
+                        mine.append(img)
+                    else:
+                        del holders[user]
+
+            # Top up the batch with images that have spare capacity
+            if len(mine) < self.batchSize:
+                for img in candidates:
+                    holders = leases.setdefault(img, {})
+                    if user in holders:
+                        continue
+                    if len(holders) + labelCounts.get(img, 0) < self.redundancy:
+                        holders[user] = expiry
+                        mine.append(img)
+                        if len(mine) >= self.batchSize:
+                            break
+
+            self._dump(leases)
+
+        logging.debug("WorkScheduler - leased {} images to {}".format(len(mine), user))
+        order = {img: idx for idx, img in enumerate(candidates)}
+        return sorted(mine, key=order.__getitem__)
+
+    def leased_by_others(self, user):
+        '''Returns the set of images currently leased to users other than user'''
+        leases = self._load(dropExpired=True)
+        return {img for img, holders in leases.items() if any(u != user for u in holders)}
+
+    def release(self, user):
+        '''Releases all leases held by user'''
+        with self._locked():
+            leases = self._load()
+            for holders in leases.values():
+                holders.pop(user, None)
+            self._dump(leases)
+
+    def _load(self, dropExpired=True):
+        if not os.path.isfile(self.leasepath):
+            return {}
+        try:
+            with open(self.leasepath, 'r') as f:
+                leases = json.load(f)
+        except ValueError:
+            logging.warning("Lease file is corrupted, resetting it.")
+            return {}
+        if dropExpired:
+            now = time.time()
+            leases = {img: {u: exp for u, exp in holders.items() if exp > now} for img, holders in leases.items()}
+        return leases
+
+    def _dump(self, leases):
+        # Only store images that still have live leases, written atomically
+        leases = {img: holders for img, holders in leases.items() if holders}
+        tmppath = self.leasepath + '.{}.tmp'.format(os.getpid())
+        with open(tmppath, 'w') as f:
+            json.dump(leases, f)
+        os.replace(tmppath, self.leasepath)
+
+    def _locked(self):
+        return _MutexContext(self.mutex)
+
+
+class _MutexContext(object):
+    '''Acquires an FsLock with retries for the duration of a with block'''
+
+    def __init__(self, lock, timeout=10, interval=0.05):
+        self.lock = lock
+        self.timeout = timeout
+        self.interval = interval
+
+    def __enter__(self):
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                self.lock.acquire()
+                return self.lock
+            except Exception:
+                if time.time() > deadline:
+                    raise
+                time.sleep(self.interval)
+
+    def __exit__(self, *exc):
+        self.lock.release()
@@ -0,0 +1,474 @@
+import io
+import os
+import json
+import time
+import asyncio
+import logging
+import mimetypes
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from .fslock import FsLock
+from .archives import is_archive_key, read_member, stat_image, open_image
+from .cache import ThumbnailCache
+from .store import LabelStore
+from .sources import list_images
+
+
+class LabelState(LabelStore):
+    '''
+    Labels of all the users of a directory, held in memory by a single process (see LabelStore).
+
+    The labels are read from and written to the usual labeled_<user>.json files, so the Tk app, Make Master and
+    flow_to_directory keep working on the same directory. Changes are only marked dirty and written in batches by
+    flush(). Images handed out to a user are reserved for reserveTimeout seconds so concurrent users get different
+    images. Label files of users that are not served by this process (e.g. using the Tk app) are reloaded when
+    they change on disk. Users idle for some time are released with release_idle() so they can label elsewhere.
+
+    Parameters
+    ----------
+    directory : string
+        Directory containing the images and the label files
+    categories : list[string]
+        Labels to use when the directory does not have a label file yet
+    reserveTimeout : float
+        Time in seconds after which images handed out but not labeled can be handed out to another user
+
+    Raises a ValueError for multi-label directories, which the browser client cannot label.
+    '''
+
+    def __init__(self, directory, categories=None, reserveTimeout=300):
+        LabelStore.__init__(self, directory, categories)
+        if self.multiLabel:
+            raise ValueError("{} is a multi-label directory, which cannot be served yet".format(directory))
+        self.reserveTimeout = reserveTimeout
+
+        self.images = sorted(list_images(directory))
+        self.imageSet = set(self.images)
+
+        self.reserved = {}
+        self.cursors = {}
+        # Locks of the users labeling through this process and the time of their last request
+        self.locks = {}
+        self.lastSeen = {}
+
+    def join(self, user):
+        '''Takes the lock of user, raises an Exception if the user is already labeling in another session'''
+        user = self.sanitize_user_name(user)
+        if user in (self.masterUser, self.modelUser) or not user:
+            raise ValueError("Invalid username")
+        if user not in self.locks:
+            lock = FsLock(self.folder, user)
+            lock.acquire()
+            self.locks[user] = lock
+            # The user may have labeled elsewhere since being released
+            if user in self.labels and os.path.isfile(self.label_path(user)):
+                self._replace(user, self._read(user))
+            self.own(user)
+        self.lastSeen[user] = time.time()
+        return user
+
+    def release_idle(self, timeout, now=None):
+        '''Releases the locks of the users without requests for timeout seconds whose labels are saved'''
+        now = time.time() if now is None else now
+        released = [user for (user, seen) in self.lastSeen.items()
+                    if now - seen > timeout and user in self.locks and user not in self.dirty]
+        for user in released:
+            self.locks.pop(user).release()
+            del self.lastSeen[user]
+            self.owned.discard(user)
+            self.histories.pop(user, None)
+            # Reloaded like the other users when their file changes
+            self.mtimes.pop(user, None)
+            for img in [img for (img, (owner, _)) in self.reserved.items() if owner == user]:
+                del self.reserved[img]
+        if released:
+            logging.info("Released the idle users {}".format(released))
+        return released
+
+    def is_labeled(self, img):
+        return img in self.byImage
+
+    def next_images(self, user, count=10):
+        '''Returns up to count images for user to label, reserving them'''
+        now = time.time()
+        # Release the images previously reserved by the user that were not labeled
+        for img in [img for (img, (owner, _)) in self.reserved.items() if owner == user]:
+            del self.reserved[img]
+
+        selected = []
+        start = self.cursors.get(user, 0)
+        for offset in range(len(self.images)):
+            img = self.images[(start + offset) % len(self.images)]
+            if self.is_labeled(img):
+                continue
+            owner = self.reserved.get(img)
+            if owner and owner[1] > now:
+                continue
+            selected.append(img)
+            self.reserved[img] = (user, now + self.reserveTimeout)
+            if len(selected) >= count:
+                self.cursors[user] = (start + offset) % len(self.images)
+                break
+        return selected
+
+    def classify(self, user, img, label):
+        if img not in self.imageSet:
+            raise KeyError(img)
+        if label is not None and label not in self.categories:
+            raise ValueError("Unknown label {}".format(label))
+        self.set(user, img, label)
+        self.reserved.pop(img, None)
+
+    def summary(self, user=None):
+        return {'categories': self.categories,
+                'images': len(self.images),
+                'labeled': sum(1 for img in self.byImage if img in self.imageSet),
+                'users': {name: len(labels) for (name, labels) in sorted(self.labels.items())},
+                'user': user}
+
+    def close(self):
+        self.flush()
+        for lock in self.locks.values():
+            lock.release()
+        self.locks = {}
+
+
+class LabelServer(object):
+    '''
+    Serves a LabelState over HTTP with asyncio, along with the images and a browser client.
+
+    API (json):
+        GET  /api/state?user=<name>                  categories and progress
+        GET  /api/next?user=<name>&count=N&size=WxH  next images to label, prepared in the background at size
+        POST /api/label {user, image, label}         labels an image (label null to remove it)
+        POST /api/labels {label}                     adds a label
+        GET  /image/<image>?size=WxH                 image, shrunk to fit in size if passed
+
+    Images are served with an ETag and Cache-Control headers so browsers do not download them twice, and
+    resized images go through the shared thumbnail cache.
+
+    Parameters
+    ----------
+    state : LabelState
+        Labels to serve
+    host : string
+        Address to listen on
+    port : int
+        Port to listen on
+    flushInterval : float
+        Interval in seconds between writes of the label files
+    lockTimeout : float
+        Time in seconds without requests after which the lock of a user is released
+    cacheBudget : int
+        Disk budget in bytes of the thumbnail cache (0 to disable)
+    workers : int
+        Number of threads reading and resizing images
+    '''
+
+    def __init__(self, state, host='127.0.0.1', port=8080, flushInterval=2, lockTimeout=600, cacheBudget=512*1024**2,
+                 workers=8):
+        self.state = state
+        self.host = host
+        self.port = port
+        self.flushInterval = flushInterval
+        self.lockTimeout = lockTimeout
+        self.cache = ThumbnailCache(state.folder, cacheBudget) if cacheBudget else None
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        # Renders in progress by (image, size), shared by the requests of the same image
+        self.rendering = {}
+
+    async def run(self):
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        logging.warning("Serving {} on http://{}:{}/".format(self.state.folder, self.host, self.port))
+        flusher = asyncio.ensure_future(self.flush_periodically())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            flusher.cancel()
+            self.state.close()
+            self.executor.shutdown(wait=False)
+
+    async def flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flushInterval)
+            await self.flush()
+
+    async def flush(self):
+        '''Writes and reloads the label files in the executor, then releases the idle users'''
+        loop = asyncio.get_event_loop()
+        state = self.state
+        # Copies are taken on the event loop, the files are read and written in the executor
+        snapshot = state.snapshot()
+        history = state.take_history()
+        try:
+            state.mtimes.update(await loop.run_in_executor(self.executor, state.write, snapshot))
+        except OSError as e:
+            # Written again at the next flush
+            state.dirty.update(snapshot)
+            logging.error("Could not save the labels: {}".format(e))
+        try:
+            await loop.run_in_executor(self.executor, state.write_history, history)
+        except OSError as e:
+            logging.error("Could not save the label history: {}".format(e))
+        changes = await loop.run_in_executor(self.executor, state.read_changes, dict(state.mtimes), set(state.owned))
+        state.apply_changes(changes)
+        state.release_idle(self.lockTimeout)
+
+    async def handle(self, reader, writer):
+        '''Serves the requests of a (keep-alive) connection'''
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target, version = line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    name, value = header.decode('latin-1').split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                try:
+                    status, responseHeaders, payload = await self.dispatch(method, target, headers, body)
+                except Exception as e:
+                    logging.exception("Error while serving {}".format(target))
+                    status, responseHeaders, payload = self.json_response({'error': str(e)}, 500)
+
+                keepAlive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                responseHeaders['Content-Length'] = str(len(payload))
+                responseHeaders['Connection'] = 'keep-alive' if keepAlive else 'close'
+                head = "HTTP/1.1 {} {}\r\n".format(status, self.reasons.get(status, ''))
+                head += ''.join("{}: {}\r\n".format(name, value) for (name, value) in responseHeaders.items())
+                writer.write(head.encode('latin-1') + b'\r\n' + (payload if method != 'HEAD' else b''))
+                await writer.drain()
+                if not keepAlive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    reasons = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               409: 'Conflict', 500: 'Internal Server Error'}
+
+    async def dispatch(self, method, target, headers, body):
+        parts = urllib.parse.urlsplit(target)
+        path = urllib.parse.unquote(parts.path)
+        query = {key: values[-1] for (key, values) in urllib.parse.parse_qs(parts.query).items()}
+
+        if path == '/' and method in ('GET', 'HEAD'):
+            return 200, {'Content-Type': 'text/html; charset=utf-8'}, client_html.encode('utf-8')
+        if path.startswith('/image/') and method in ('GET', 'HEAD'):
+            return await self.serve_image(path[len('/image/'):], query, headers)
+        if path == '/api/state' and method == 'GET':
+            return self.json_response(self.state.summary(query.get('user')))
+        if path == '/api/next' and method == 'GET':
+            return self.next_images(query)
+        if path == '/api/label' and method == 'POST':
+            return self.label(json.loads(body.decode('utf-8') or '{}'))
+        if path == '/api/labels' and method == 'POST':
+            label = self.state.add_label(json.loads(body.decode('utf-8') or '{}').get('label', ''))
+            return self.json_response({'label': label, 'categories': self.state.categories})
+        return self.json_response({'error': 'Not found'}, 404)
+
+    def json_response(self, data, status=200):
+        return status, {'Content-Type': 'application/json', 'Cache-Control': 'no-store'}, json.dumps(data).encode('utf-8')
+
+    def join(self, user):
+        try:
+            return self.state.join(user or '')
+        except ValueError as e:
+            raise UserError(400, str(e))
+        except Exception:
+            raise UserError(409, "{} is already labeling in another session".format(user))
+
+    def next_images(self, query):
+        try:
+            user = self.join(query.get('user'))
+        except UserError as e:
+            return self.json_response({'error': e.message}, e.status)
+        images = self.state.next_images(user, int(query.get('count', 10)))
+        size = parse_size(query.get('size'))
+        # Prepare the resized images while the user labels the first one
+        if size and self.cache:
+            for img in images:
+                self.prepare(img, size)
+        return self.json_response({'user': user, 'images': images})
+
+    def label(self, data):
+        try:
+            user = self.join(data.get('user'))
+            self.state.classify(user, data.get('image'), data.get('label'))
+        except UserError as e:
+            return self.json_response({'error': e.message}, e.status)
+        except (KeyError, ValueError) as e:
+            return self.json_response({'error': str(e)}, 400)
+        return self.json_response({'ok': True})
+
+    async def serve_image(self, img, query, headers):
+        if img not in self.state.imageSet:
+            return self.json_response({'error': 'Not found'}, 404)
+        path = os.path.join(self.state.folder, img)
+        st = stat_image(path)
+        size = parse_size(query.get('size'))
+        etag = '"{:x}-{:x}-{}"'.format(st.st_mtime_ns, st.st_size, 'x'.join(map(str, size)) if size else 'full')
+        cacheHeaders = {'ETag': etag, 'Cache-Control': 'private, max-age=86400'}
+        if headers.get('if-none-match') == etag:
+            return 304, cacheHeaders, b''
+
+        loop = asyncio.get_event_loop()
+        if size:
+            data = await self.prepare(img, size)
+            contentType = 'image/jpeg'
+        else:
+            data = await loop.run_in_executor(self.executor, self.read, path)
+            contentType = mimetypes.guess_type(img.rsplit('!', 1)[-1])[0] or 'application/octet-stream'
+        cacheHeaders['Content-Type'] = contentType
+        return 200, cacheHeaders, data
+
+    def prepare(self, img, size):
+        '''Returns a future of the JPEG bytes of img at size, rendered once however many requests ask for it'''
+        key = (img, size)
+        future = self.rendering.get(key)
+        if future is None:
+            future = asyncio.get_event_loop().run_in_executor(self.executor, self.render, img, size)
+            self.rendering[key] = future
+            future.add_done_callback(lambda done: self.rendered(key, done))
+        return future
+
+    def rendered(self, key, future):
+        del self.rendering[key]
+        # Renders prepared ahead of time are not awaited, their errors are logged here
+        if not future.cancelled() and future.exception() is not None:
+            logging.error("Could not render {}: {}".format(key[0], future.exception()))
+
+    def read(self, path):
+        if is_archive_key(path):
+            return read_member(path)
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def render(self, img, size):
+        '''Returns the JPEG bytes of img shrunk to fit in size'''
+        if self.cache:
+            im = self.cache.get_or_create(img, size)
+        else:
+            with open_image(os.path.join(self.state.folder, img)) as src:
+                src.draft('RGB', size)
+                im = src.convert('RGB')
+            im.thumbnail(size)
+        buffer = io.BytesIO()
+        im.convert('RGB').save(buffer, 'JPEG', quality=90)
+        return buffer.getvalue()
+
+
+class UserError(Exception):
+
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+        self.message = message
+
+
+def parse_size(value):
+    '''Parses 'WxH' into (W, H), None if value is empty'''
+    if not value:
+        return None
+    width, height = value.lower().split('x')
+    return (max(1, min(int(width), 4096)), max(1, min(int(height), 4096)))
+
+
+def serve(directory, categories=None, host='127.0.0.1', port=8080, cacheBudget=512*1024**2):
+    '''Serves the labeling of directory to browsers until interrupted'''
+    state = LabelState(directory, categories)
+    server = LabelServer(state, host, port, cacheBudget=cacheBudget)
+    try:
+        asyncio.run(server.run())
+    except KeyboardInterrupt:
+        pass
+
+
+client_html = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Simplabel</title>
+<style>
+body { font-family: sans-serif; margin: 0; display: flex; flex-direction: column; height: 100vh; }
+#bar { padding: 6px; background: #eee; }
+#view { flex: 1; display: flex; align-items: center; justify-content: center; overflow: hidden; }
+#view img { max-width: 100%; max-height: 100%; }
+#labels { padding: 6px; display: flex; flex-wrap: wrap; gap: 4px; }
+#labels button { flex: 1 0 20%; height: 3em; }
+</style>
+</head>
+<body>
+<div id="bar"><span id="info"></span></div>
+<div id="view"><img id="image"></div>
+<div id="labels"></div>
+<script>
+var user = localStorage.getItem('simplabelUser') || prompt('Username');
+localStorage.setItem('simplabelUser', user);
+var size = Math.round(window.innerWidth * 0.9) + 'x' + Math.round(window.innerHeight * 0.75);
+var categories = [], queue = [], preloaded = [];
+
+function api(path, options) {
+    return fetch(path, options).then(function (r) {
+        return r.json().then(function (data) { if (!r.ok) { throw new Error(data.error); } return data; });
+    });
+}
+
+function imageUrl(img) { return '/image/' + encodeURIComponent(img) + '?size=' + size; }
+
+function refill() {
+    return api('/api/next?user=' + encodeURIComponent(user) + '&count=10&size=' + size).then(function (data) {
+        queue = data.images;
+        // Let the browser download the next images while the user labels the current one
+        preloaded = queue.slice(1, 6).map(function (img) { var i = new Image(); i.src = imageUrl(img); return i; });
+        show();
+    });
+}
+
+function show() {
+    api('/api/state?user=' + encodeURIComponent(user)).then(function (state) {
+        document.getElementById('info').textContent = user + ' - ' + state.labeled + '/' + state.images + ' images labeled' +
+            (queue.length ? ' - ' + queue[0] : ' - nothing left to label');
+        if (state.categories.join('|') !== categories.join('|')) { categories = state.categories; drawButtons(); }
+    });
+    document.getElementById('image').src = queue.length ? imageUrl(queue[0]) : '';
+}
+
+function drawButtons() {
+    var div = document.getElementById('labels');
+    div.innerHTML = '';
+    categories.forEach(function (category, idx) {
+        var b = document.createElement('button');
+        b.textContent = category + ' (' + (idx + 1) + ')';
+        b.onclick = function () { classify(category); };
+        div.appendChild(b);
+    });
+}
+
+function classify(category) {
+    if (!queue.length) { return; }
+    var img = queue.shift();
+    api('/api/label', {method: 'POST', body: JSON.stringify({user: user, image: img, label: category})})
+        .catch(function (e) { alert(e.message); });
+    if (queue.length) { show(); } else { refill(); }
+}
+
+document.addEventListener('keydown', function (e) {
+    var idx = parseInt(e.key, 10) - 1;
+    if (idx >= 0 && idx < categories.length) { classify(categories[idx]); }
+});
+
+refill().catch(function (e) { document.getElementById('info').textContent = e.message; });
+</script>
+</body>
+</html>
+'''
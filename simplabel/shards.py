@@ -0,0 +1,135 @@
+import io
+import os
+import json
+import time
+import random
+import logging
+import tarfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from .archives import is_archive_key, read_member, stat_image
+from .manifest import StratifiedSplitter, iter_records, image_group
+from .project import image_path
+
+
+def sample_key(idx, img):
+    '''Returns the key of a sample in a shard: a unique prefix followed by the image name without extension'''
+    name = os.path.splitext(img.replace('!', '/').rsplit('/', 1)[-1])[0].replace('.', '_')
+    return "{:09d}_{}".format(idx, name)
+
+
+def plan_shards(samples, maxCount=10000, maxBytes=1024**3):
+    '''Cuts a list of (key, img, record, size, ...) samples into consecutive shards of at most maxCount samples and maxBytes'''
+    shards = []
+    current = []
+    currentBytes = 0
+    for sample in samples:
+        if current and (len(current) >= maxCount or currentBytes + sample[3] > maxBytes):
+            shards.append(current)
+            current = []
+            currentBytes = 0
+        current.append(sample)
+        currentBytes += sample[3]
+    if current:
+        shards.append(current)
+    return shards
+
+
+def _write_shard(args):
+    '''Writes the samples of a shard to a tar file in WebDataset layout (key.ext and key.json per sample)'''
+    path, samples = args
+    tmppath = path + '.tmp'
+    mtime = time.time()
+    with tarfile.open(tmppath, 'w') as tar:
+        for key, img, record, _, source in samples:
+            ext = img.rsplit('.', 1)[-1].lower()
+            if is_archive_key(img):
+                data = read_member(source)
+                info = tarfile.TarInfo("{}.{}".format(key, ext))
+                info.size = len(data)
+                info.mtime = mtime
+                tar.addfile(info, io.BytesIO(data))
+            else:
+                with open(source, 'rb') as f:
+                    info = tarfile.TarInfo("{}.{}".format(key, ext))
+                    info.size = os.fstat(f.fileno()).st_size
+                    info.mtime = mtime
+                    tar.addfile(info, f)
+            data = json.dumps(record).encode('utf-8')
+            info = tarfile.TarInfo("{}.json".format(key))
+            info.size = len(data)
+            info.mtime = mtime
+            tar.addfile(info, io.BytesIO(data))
+    os.replace(tmppath, path)
+    return os.path.getsize(path)
+
+
+def export_shards(directory, outputDirectory, user=None, splits=(0.8, 0.1, 0.1), seed=0, groupByDirectory=False,
+                  maxCount=10000, maxBytes=1024**3, workers=None, project=None, images=None):
+    '''
+    Packs the labeled images and their label records into tar shards for training pipelines
+
+    Each sample is stored as '<key>.<ext>' (the image) and '<key>.json' (the manifest record) in WebDataset style.
+    Samples are shuffled across shards with seed, split like export_manifest (one series of shards per split) and
+    the shards are written in parallel by a pool of processes. An index.json listing the shards, their number of
+    samples and size is written last. Returns the index.
+
+    Arguments
+    --------
+    directory: string
+        Path to the directory containing the images and label files
+    outputDirectory: string
+        Path of the directory to write the shards to, created if it does not exist
+    user, splits, seed, groupByDirectory, images:
+        Same as export_manifest
+    maxCount: int
+        Maximum number of samples per shard
+    maxBytes: int
+        Maximum size of the images of a shard in bytes
+    workers: int
+        Number of shard writer processes
+    project: Project
+        Multi-root project whose labels are in directory, images are read from its roots
+    '''
+
+    splitter = StratifiedSplitter(splits, seed) if splits else None
+    samplesBySplit = {}
+    for (idx, record) in enumerate(iter_records(directory, user)):
+        img = record['path']
+        if images is not None and img not in images:
+            continue
+        source = image_path(directory, img, project)
+        try:
+            size = stat_image(source).st_size
+        except OSError:
+            logging.warning("Image {} not found, skipped".format(img))
+            continue
+        if splitter:
+            stratum = tuple(record['label']) if isinstance(record['label'], list) else record['label']
+            if groupByDirectory:
+                record['split'] = splitter.assign_group(image_group(img), img, stratum)
+            else:
+                record['split'] = splitter.assign(img, stratum)
+        samplesBySplit.setdefault(record.get('split', 'shard'), []).append((sample_key(idx, img), img, record, size, source))
+
+    os.makedirs(outputDirectory, exist_ok=True)
+    rng = random.Random(seed)
+    jobs = []
+    for (split, samples) in sorted(samplesBySplit.items()):
+        rng.shuffle(samples)
+        for (num, shard) in enumerate(plan_shards(samples, maxCount, maxBytes)):
+            jobs.append((split, "{}-{:06d}.tar".format(split, num), shard))
+
+    index = {'samples': 0, 'shards': []}
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        sizes = pool.map(_write_shard, [(os.path.join(outputDirectory, name), shard)
+                                        for (_, name, shard) in jobs])
+        for ((split, name, shard), size) in zip(jobs, sizes):
+            index['shards'].append({'name': name, 'split': split, 'samples': len(shard), 'bytes': size})
+            index['samples'] += len(shard)
+            logging.info("Wrote shard {} ({} samples)".format(name, len(shard)))
+
+    with open(os.path.join(outputDirectory, 'index.json'), 'w') as f:
+        json.dump(index, f, indent=1)
+    return index
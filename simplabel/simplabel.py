@@ -1,8 +1,8 @@
 import argparse
 import tkinter as tk
-from tkinter.messagebox import askquestion, askokcancel, showwarning
+from tkinter.messagebox import askquestion, askokcancel, showwarning, showinfo
 from tkinter import simpledialog, filedialog
-from PIL import Image, ImageTk
+from PIL import Image
 import os
 from functools import partial
 import json
@@ -12,6 +12,28 @@ import logging
 import random
 import getpass
 import math
+import shutil
+
+from .fslock import FsLock
+from .scheduler import WorkScheduler
+from .priority import ImagePrioritizer
+from .duplicates import DuplicateIndex
+from .grid import GridView
+from .cache import ThumbnailCache, warm_cache
+from .decode import Decoder
+from .sources import ImageSource, LocalSource, ProjectSource, get_source, supported_extensions
+from .project import Project
+from .render import ImageRenderer, WidgetStyler
+from .palette import LabelPalette, NumberEntry
+from .labelsets import LabelSpace
+from .checksums import ChecksumCache
+from .history import LabelHistory, materialize
+from .store import LabelStore
+from .predictions import import_predictions
+from .metrics import SessionMetrics, print_report
+from .server import serve
+from .memory import MemoryGovernor
+from .background import BackgroundTasks
 
 
 class ImageClassifier(tk.Frame):
@@ -36,6 +58,31 @@ class ImageClassifier(tk.Frame):
         When true, resets the lock that prevents multiple users from using the same username
     bRedundant: bool
         When true, other labeler's selections are not displayed.
+    batchSize : int
+        Number of unlabeled images leased to this user at once so that concurrent labelers work on
+        disjoint batches (0 to disable)
+    redundancy : int
+        Number of distinct users each image should be labeled by when batches are leased
+    priority : string or callable
+        Scores file (.json or .csv) or callable used to label the highest scoring images first (e.g. model
+        uncertainty). The file is reloaded on refresh when it changes.
+    duplicates : string
+        Handling of near-duplicate images when one of them is labeled: 'propagate' applies the label to the
+        whole group, 'confirm' queues the group next with the label suggested (Enter to accept). None to disable.
+    cacheBudget : int
+        Disk budget in MB of the thumbnail cache shared by all labelers in .simplabel_cache (0 to disable)
+    source : ImageSource or string
+        Where to read the images from when they are not stored in directory, e.g. the url of an http file server
+        serving a manifest.json or a project file listing several image directories (see Project). Labels are
+        still saved in directory, which defaults to the labels directory of the project.
+    multiLabel : bool
+        When true, several labels can be selected per image (label keys toggle them). Labels are saved as bitsets
+        over the category list. Labels named 'Parent/Child' form a hierarchy: selecting a child also selects its parent.
+    memoryBudget : int
+        Memory budget in MB shared by the displayed image, the prefetched images and the in-memory caches (0 to disable)
+    backgroundWorkers : int
+        Number of threads running the directory scans, auto-saves and auto-refreshes off the Tk thread (0 to run
+        them inline)
 
     Notable outputs
     -------
@@ -44,8 +91,15 @@ class ImageClassifier(tk.Frame):
         This dict is saved to disk by the 'Save' button
     """
 
+    # Above this number of labels, buttons are replaced by a searchable palette
+    paletteThreshold = 12
+    # Delay in ms after which a multi-digit label number typed on the keyboard is applied
+    numberTimeout = 700
+
     def __init__(self, parent, directory=None, categories=None, verbose=0, username=None,
-                 autoRefresh=60, bResetLock=False, bRedundant=False, *args, **kwargs):
+                 autoRefresh=60, bResetLock=False, bRedundant=False, batchSize=0, redundancy=1,
+                 priority=None, duplicates=None, cacheBudget=512, source=None, multiLabel=False, memoryBudget=1024,
+                 backgroundWorkers=2, *args, **kwargs):
 
         # Initialize frame
         tk.Frame.__init__(self, parent, *args, **kwargs)
@@ -64,8 +118,7 @@ class ImageClassifier(tk.Frame):
         self.gotLock = False
 
         # Supported image file formats (all extensions supported by PIL should work)
-        self.supported_extensions = ['jpg', 'png', 'gif', 'jpeg ', 'eps', 'bmp', 'tiff', 'bmp',
-                                     'icns', 'ico', 'spi',]
+        self.supported_extensions = supported_extensions
 
         # Define colors to be used for users
         self.colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2',
@@ -85,6 +138,11 @@ class ImageClassifier(tk.Frame):
         #  Directory containing the raw images
         if directory:
             self.folder = directory
+        elif isinstance(source, ProjectSource):
+            self.folder = source.folder
+        elif isinstance(source, str) and os.path.isfile(source):
+            # The labels of a multi-root project are saved in its labels directory
+            self.folder = Project(source).folder
         else:
             logging.info("No directory passed. Please select a directory...")
             response = filedialog.askdirectory(title="Select image directory",
@@ -99,6 +157,36 @@ class ImageClassifier(tk.Frame):
         # Directory containing the labels
         self.labelpath = self.folder + "/.labels.json"
 
+        # Disk budget of the shared thumbnail cache
+        self.cacheBudget = cacheBudget * 1024**2
+
+        # Memory budget shared by the image buffers of the app, press 'm' to show the memory in use
+        self.memory = MemoryGovernor(memoryBudget * 1024**2)
+
+        # Decoder sending large images in slow formats to worker processes
+        self.decoder = Decoder()
+
+        # Source the images are listed and read from
+        if isinstance(source, ImageSource):
+            self.source = source
+        elif source:
+            self.source = get_source(source, self.decoder)
+        else:
+            self.source = LocalSource(self.folder, self.decoder)
+        self.localSource = isinstance(self.source, LocalSource)
+        self.memory.register('prefetched images', self.decoder)
+        self.memory.register('source cache', self.source)
+
+        # Worker threads running slow work off the Tk thread, results are delivered back to it (see BackgroundTasks)
+        self.tasks = BackgroundTasks(self, workers=backgroundWorkers)
+
+        # The images are listed while the labels are loaded
+        self.scanning = self.tasks.submit(lambda token: self.source.list_images(self.supported_extensions),
+                                          name='Scanning')
+
+        # Content hashes of the images, used to detect images modified after they were labeled
+        self.checksums = ChecksumCache(self.source.folder) if self.localSource else None
+
         # Initialize state variables
         self.saved = True
         self.reconcileMode = False
@@ -113,6 +201,9 @@ class ImageClassifier(tk.Frame):
         self.refreshTimestamp = time.time()
         self.refreshInterval = autoRefresh
 
+        # Labels of all the users, read from and written to the label files of the directory
+        self.store = LabelStore(self.folder, categories, multiLabel=multiLabel)
+
         # Find all labelers (other users)
         self.users = self.get_all_users()
         logging.info("Existing users: {}".format(self.users))
@@ -128,8 +219,8 @@ class ImageClassifier(tk.Frame):
             # Sanitize: lowercase and remove spaces
             sanName = self.sanitize_user_name(username)
             # Check that username is not reserved
-            if sanName == 'master':
-                logging.error("Username 'master' is reserved.")
+            if sanName in (LabelStore.masterUser, LabelStore.modelUser):
+                logging.error("Username '{}' is reserved.".format(sanName))
                 newName = input("Please choose another name: ")
                 sanName = self.sanitize_user_name(newName)
             self.username = sanName
@@ -160,7 +251,7 @@ class ImageClassifier(tk.Frame):
             if bResetLock:
                 logging.warning("Overriding the lock, this should only be used if you are certain \
                                 no other user is using the same username.")
-                self.lock.release()
+                self.lock.release(force=True)
                 self.lock.acquire()
             else:
                 logging.warning("The app is already in use with this username ({}). Please choose \
@@ -173,24 +264,54 @@ class ImageClassifier(tk.Frame):
 
         # Directory containing the saved labeled dictionary
         self.savepath = self.folder + "/labeled_" + self.username +".json"
+        # Labeling activity of the session (time to decision, skipped images)
+        self.metrics = SessionMetrics(self.folder, self.username)
+
+        # Work scheduler leasing batches of unlabeled images to concurrent users
+        self.leased = []
+        if batchSize > 0:
+            self.scheduler = WorkScheduler(self.folder, batchSize=batchSize, redundancy=redundancy)
+        else:
+            self.scheduler = None
+
+        # Priority ordering of the images to label
+        self.prioritizer = ImagePrioritizer(priority) if priority else None
 
         # Initialize UI
         self.initialize_ui()
 
         # Categories for the labelling task
-        self.labels_from_file = False
-        self.categories = categories
         self.initialize_labels()
 
         # Initialize data
         self.initialize_data()
 
+        # Index near-duplicate images in the background
+        self.duplicatesMode = duplicates
+        self.suggestedLabels = {}
+        if duplicates and self.multiLabel:
+            logging.warning("Near-duplicate handling is not available in multi-label mode.")
+            self.duplicateIndex = None
+        elif duplicates and not self.localSource:
+            logging.warning("Near-duplicate detection is only available for images stored in a local directory.")
+            self.duplicateIndex = None
+        elif duplicates:
+            self.duplicateIndex = DuplicateIndex(self.folder)
+            images = list(self.image_list)
+            self.tasks.submit(lambda token: self.duplicateIndex.build(images, token=token),
+                              name='Indexing duplicates', key='duplicates')
+        else:
+            self.duplicateIndex = None
+
         # Create a button for each of the categories
         self.draw_label_buttons()
 
         # Display the first image
         self.display_image()
 
+        # Images modified since they were labeled go back to the images to label
+        self.check_labels()
+
     ##############################
     ### Initializing methods #####
     ##############################
@@ -210,14 +331,26 @@ class ImageClassifier(tk.Frame):
         # Create a canvas for the image
         self.cv1 = tk.Canvas(self.frame1, background="white", relief=tk.RAISED, highlightthickness=0)
         self.cv1.pack(in_=self.frame1, fill=tk.BOTH, expand=tk.YES)
+        self.renderer = ImageRenderer(self.cv1)
+        self.memory.register('display', self.renderer)
+
+        # Keeps track of the widget options last set to only send changes to Tk
+        self.styler = WidgetStyler()
+        self.coloredButtons = set()
 
         # Placeholder for the label button frame
         self.labelFrameList = None
+        self.palette = None
+
+        # Label numbers typed with several digits
+        self.numberEntry = NumberEntry(self.root, lambda: len(self.categories),
+                                       lambda idx: self.classify(self.categories[idx]), self.numberTimeout)
 
         # Create the key bindings
         self.root.bind("<Key>", self.keypress_handler)
         self.root.bind("<Left>", self.previous_image)
         self.root.bind("<Right>", self.next_image)
+        self.root.bind("<Return>", self.accept_suggestion)
 
         # Create the navigation buttons
         self.firstButton = tk.Button(self.root, text='|<<', height=2, width=3, command=self.goto_first_image)
@@ -232,6 +365,9 @@ class ImageClassifier(tk.Frame):
         self.buttonBgOrigColor = self.firstButton.config()['background'][-1]
         self.lastButton = tk.Button(self.root, text='>>|', height=2, width=3, command=self.goto_last_image)
         self.lastButton.pack(in_=self.frame0, side=tk.LEFT)
+        self.gridButton = tk.Button(self.root, text='Grid', height=2, width=3, command=self.open_grid)
+        self.gridButton.pack(in_=self.frame0, side=tk.LEFT)
+        self.gridView = None
 
         # Create the user action buttons
         self.saveButton = tk.Button(self.root, text='Save', height=2, width=8, command=self.save)
@@ -242,6 +378,11 @@ class ImageClassifier(tk.Frame):
         self.reconcileButton = tk.Button(self.root, text='Reconcile', wraplength=80, height=2, width=8, command=self.reconcile)
         self.reconcileButton.pack(in_=self.frame0, side=tk.RIGHT)
 
+        # Shows the work running in the background
+        self.busyLabel = tk.Label(self.root, text='', width=12, fg='#7f7f7f')
+        self.busyLabel.pack(in_=self.frame0, side=tk.RIGHT)
+        self.tasks.onBusy = self.show_busy
+
         # Disable Reconcile and Make Master in Redundant mode
         if self.redundantMode:
             self.reconcileButton.config(state=tk.DISABLED)
@@ -262,87 +403,39 @@ class ImageClassifier(tk.Frame):
         self.update_users_displayed()
 
     def initialize_labels(self):
-        '''Loads labels from file if it exists else loads labels passed as argument.'''
-
-        # If a label file is found, use that and issue a warning that passed categories are ignored
-        if os.path.isfile(self.labelpath):
-            if self.categories:
-                logging.warning("Found label file, ignoring labels passed as argument.")
-            with open(self.labelpath, 'r') as f:
-                loadedLabels = json.load(f)
-            # Sanitize loaded labels
-            sanLabels = [self.sanitize_label_name(label) for label in loadedLabels]
-            # Remove duplicates
-            self.categories = list(dict.fromkeys(sanLabels))
-            logging.info("Loaded labels from file: {}".format(self.categories))
-
-        # If no file is found and there are passed arguments, sanitize and use them
-        elif self.categories:
-            sanCategories = []
-            for category in self.categories:
-                sanCategories.append(self.sanitize_label_name(category))
-            self.categories = sanCategories
-            logging.info("Using labels passed as argument: {}".format(self.categories))
-
-            # Save labels to file
-            if not self.labels_from_file:
-                with open(self.labelpath, 'w') as f:
-                    json.dump(self.categories, f)
-
-        # If no file and no categories passed, leave categories as an empty list
-        else:
-            self.categories = []
+        '''Uses the labels of the label file if it exists else the labels passed as argument (see LabelStore).'''
+        self.categories = self.store.categories
+        self.multiLabel = self.store.multiLabel
+        self.labelSpace = self.store.labelSpace
 
     def initialize_data(self):
         '''Loads existing data from disk if it exists and loads a list of unlabelled images found in the directory'''
         # Initialize current user's dictionary (Note: it might not exist yet)
         if os.path.isfile(self.savepath):
-            self.labeled = self.load_dict(self.savepath)
             logging.info("Loaded existing dictionary from disk")
         else:
-            self.labeled = {}
             logging.info("No dictionary found, initializing a new one")
+        self.store.own(self.username)
 
         # Load data from all users
         self.update_all_dict()
 
+        # Content hashes of the images when the current user labeled them (see check_labels)
+        self.store.check_digests({}, self.store.read_checksums([self.username]))
+
         # Build list of images to classify
         self.image_list = []
 
-        ## If the directory contains at least 1 image, process only this directory
-        list_image_files = [d for d in os.listdir(self.folder) if
-                            d.split('.')[-1].lower() in self.supported_extensions]
-        if len(list_image_files) > 0:
-            labeledByCurrentUser = []
-            labeledByOtherUser = []
-            toLabel = []
-            for img in list_image_files:
-                if img in self.labeled:
-                    labeledByCurrentUser.append(img)
-                elif img in self.allLabeledDict:
-                    labeledByOtherUser.append(img)
-                else:
-                    toLabel.append(img)
-        ## Otherwise, list and check subdirectories
-        else:
-            logging.info("No image files in main directory, searching sub-directories...")
-            labeledByCurrentUser = []
-            labeledByOtherUser = []
-            toLabel = []
-            sub_folder_list = [dirName for dirName in next(os.walk(self.folder))[1]
-                               if not dirName.startswith('.')]
-            for dirName in sub_folder_list:
-                dir_path = os.path.join(self.folder, dirName)
-                list_image_files = [d for d in os.listdir(dir_path)
-                                    if d.split('.')[-1].lower() in self.supported_extensions]
-                for img in list_image_files:
-                    imgPath = dirName + '/' + img
-                    if imgPath in self.labeled:
-                        labeledByCurrentUser.append(imgPath)
-                    elif imgPath in self.allLabeledDict:
-                        labeledByOtherUser.append(imgPath)
-                    else:
-                        toLabel.append(imgPath)
+        labeledByCurrentUser = []
+        labeledByOtherUser = []
+        toLabel = []
+        for img in self.tasks.result(self.scanning):
+            if img in self.labeled:
+                labeledByCurrentUser.append(img)
+            elif self.is_labeled_by_others(img):
+                labeledByOtherUser.append(img)
+            else:
+                toLabel.append(img)
 
         # Images that are already labeled are concatenated with the ones labeled by the current user
         #  last to enable them to review their own labelling
@@ -354,7 +447,7 @@ class ImageClassifier(tk.Frame):
         # Add already labeled images first, images to label are shuffled
         random.seed() # Reset the random seed
         random.shuffle(toLabel) # Shuffle the list in place
-        self.image_list = alreadyLabeled + toLabel
+        self.image_list = alreadyLabeled + self.schedule_to_label(self.prioritize(toLabel))
 
         # Check that there is at least one image
         if len(self.image_list) == 0:
@@ -375,11 +468,16 @@ class ImageClassifier(tk.Frame):
     def classify(self, category):
         '''Adds a directory entry with the name of the image and the label selected'''
 
-        if self.reconcileMode:
+        self.metrics.classified(self.image_list[self.counter], category)
+
+        if self.multiLabel:
+            self.toggle_label(category)
+
+        elif self.reconcileMode:
 
             img = self.image_list[self.counter]
 
-            # Update reconciledLabelsDict
+            # Update reconciledLabelsDict (changes are logged to the history of each user when saved)
             self.reconciledLabelsDict[img] = category
 
             if self.saved:
@@ -388,21 +486,113 @@ class ImageClassifier(tk.Frame):
             self.next_image()
 
         else:
-            self.labeled[self.image_list[self.counter]] = category
+            self.store.set(self.username, self.image_list[self.counter], category)
             logging.info('Label {} selected for image {}'.format(category, self.image_list[self.counter]))
             if self.saved: # Reset saved status
                 self.saved = False
 
+            # Propagate or suggest the label to near-duplicates of the image
+            self.handle_duplicates(self.image_list[self.counter], category)
+
             # If it is time to refresh the master and not in reconcile mode, do that
-            # Note: after the refresh, the counter will be at the next unlabeled position
-            if self.refreshInterval != 0 and (time.time() - self.refreshTimestamp > self.refreshInterval):
+            # Note: the refresh lands in the background and keeps the image displayed
+            if (self.refreshInterval != 0 and (time.time() - self.refreshTimestamp > self.refreshInterval)) \
+                    or self.batch_completed():
                 logging.debug("classify - Triggered auto-refresh")
                 self.refreshTimestamp = time.time()
-                self.refresh_all_dict()
-                self.display_image()
+                self.next_image()
+                self.refresh_async()
             else:
                 self.next_image()
 
+    def toggle_label(self, category):
+        '''Adds or removes category from the labels of the current image (multi-label mode)'''
+
+        img = self.image_list[self.counter]
+        if self.reconcileMode:
+            labels = self.reconciledLabelsDict
+            if img in labels:
+                mask = labels[img]
+            elif img in self.allLabeledDict:
+                # Start from the labels all users agree on
+                mask = self.labelSpace.agreement({img: list(self.allLabeledDict[img].values())})[img][0]
+            else:
+                mask = 0
+        else:
+            labels = self.labeled
+            mask = labels.get(img, 0)
+
+        mask = self.labelSpace.toggle(mask, category)
+        if self.reconcileMode:
+            labels[img] = mask
+        else:
+            self.store.set(self.username, img, mask or None)
+        logging.info('Labels {} selected for image {}'.format(self.labelSpace.decode(mask), img))
+
+        if self.saved:
+            self.saved = False
+
+        # Stay on the image so more labels can be selected
+        self.display_image()
+
+    def classify_many(self, images, category):
+        '''Labels several images at once with the same category (used by the grid view)'''
+
+        labels = self.reconciledLabelsDict if self.reconcileMode else self.labeled
+        for img in images:
+            label = self.labelSpace.add(self.labelSpace.as_mask(labels.get(img)), category) if self.multiLabel else category
+            if self.reconcileMode:
+                labels[img] = label
+            else:
+                self.store.set(self.username, img, label)
+            self.metrics.classified(img, category)
+        logging.info('Label {} selected for {} images'.format(category, len(images)))
+
+        if self.saved:
+            self.saved = False
+
+        # The current image might be part of the selection
+        self.display_image()
+
+    def handle_duplicates(self, img, category):
+        '''Labels or queues for confirmation the unlabeled near-duplicates of img'''
+
+        if not self.duplicateIndex or not self.duplicateIndex.ready.is_set():
+            return
+
+        group = set(other for other in self.duplicateIndex.group(img) if other not in self.labeled)
+        if not group:
+            return
+
+        # Pull the group members that are still ahead in the list next to the current image
+        ahead = [other for other in self.image_list[self.counter+1:] if other in group]
+        if not ahead:
+            return
+        rest = [other for other in self.image_list[self.counter+1:] if other not in group]
+
+        if self.duplicatesMode == 'propagate':
+            for other in ahead:
+                self.store.set(self.username, other, category, action='duplicate')
+            # Labeled duplicates go before the current image so the next image is unlabeled
+            self.image_list = self.image_list[:self.counter] + ahead + [img] + rest
+            self.counter += len(ahead)
+            logging.info("Propagated label {} to {} near-duplicates of {}".format(category, len(ahead), img))
+        else:
+            for other in ahead:
+                self.suggestedLabels[other] = category
+            self.image_list = self.image_list[:self.counter+1] + ahead + rest
+            logging.info("Queued {} near-duplicates of {} for confirmation".format(len(ahead), img))
+
+    def accept_suggestion(self, *args):
+        '''Labels the current image with the label suggested from one of its near-duplicates, or predicted by a model'''
+        if self.in_palette(args):
+            return
+        img = self.image_list[self.counter]
+        if img in self.suggestedLabels and self.suggestedLabels[img] in self.categories:
+            self.classify(self.suggestedLabels.pop(img))
+        elif self.store.get(LabelStore.modelUser, img) in self.categories and not self.multiLabel:
+            self.classify(self.store.get(LabelStore.modelUser, img))
+
     def make_master(self):
         '''Reconcile conflicting labels and make a master dictionary'''
 
@@ -430,18 +620,16 @@ class ImageClassifier(tk.Frame):
             if response == 'no':
                 return
 
-        # Make a master dictionary
-        masterDict = {}
-
-        for img in self.allLabeledDict:
-            masterDict[img] = next(iter(self.allLabeledDict[img].values())) # any value will do since they all agree
-
-        # Save the master dictionary to disk
-        logging.info('Saved the master dictionary to disk.')
-        self.dump_dict(masterDict, self.folder + '/labeled_master.json')
+        # Make a master dictionary and save it to disk
+        try:
+            self.store.make_master()
+        except ValueError as e:
+            # Conflicts on images that are no longer in the directory
+            showwarning("Reconciliation needed", str(e))
+            return
 
         # Change the button color
-        self.masterButton.config(highlightbackground='#3E4149', bg='#3E4149')
+        self.styler.apply(self.masterButton, highlightbackground='#3E4149', bg='#3E4149')
 
     def reconcile(self):
         '''Display images with disagreed labels for reconciliation'''
@@ -450,13 +638,12 @@ class ImageClassifier(tk.Frame):
         if self.reconcileMode == False:
 
             # Check locks and return if a lock a asserted.
+            lockedUsers = FsLock.locked_users(self.folder)
+            logging.debug("reconcile - users holding a lock: {}".format(lockedUsers))
             for user in self.users:
-                if user != self.username:
-                    logging.debug("reconcile - checking lock for user {}".format(user))
-                    lock = FsLock(self.folder, user)
-                    if lock.is_locked():
-                        logging.warning("{} is logged in the app, cannot reconcile unless all users have closed the app.".format(user))
-                        return
+                if user != self.username and user in lockedUsers:
+                    logging.warning("{} is logged in the app, cannot reconcile unless all users have closed the app.".format(user))
+                    return
 
             # Must save before starting reconcile mode
             if not self.saved:
@@ -468,6 +655,7 @@ class ImageClassifier(tk.Frame):
 
             # Enable recondile Mode (autoRefresh off)
             self.reconcileMode = True
+            self.tasks.cancel('refresh')
 
             # Change button text and status
             self.reconcileButton.config(text="Back", highlightbackground='#3E4149', bg='#3E4149')
@@ -505,7 +693,6 @@ class ImageClassifier(tk.Frame):
             self.reconciledLabelsDict = None
 
             # Update user list and master dict and go back to next unlabeled image
-            self.labeled = self.load_dict(self.savepath)
             self.refresh_all_dict()
             logging.info("Labeling Mode")
             self.display_image()
@@ -521,9 +708,26 @@ class ImageClassifier(tk.Frame):
         if self.labelFrameList:
             for frame in self.labelFrameList:
                 frame.destroy()
+            self.labelFrameList = None
+        if self.palette:
+            self.palette.destroy()
+            self.palette = None
+
+        # Forget the state of the destroyed buttons
+        for button in getattr(self, 'catButton', []):
+            self.styler.forget(button)
+        self.coloredButtons = set()
+        self.categoryIndex = {category: idx for idx, category in enumerate(self.categories)}
+
+        # Large taxonomies get a fixed set of buttons showing the results of a search field
+        if self.categories and len(self.categories) > self.paletteThreshold:
+            self.catButton = []
+            self.palette = LabelPalette(self.root, self, bd=2)
+            self.palette.pack(side = tk.BOTTOM, fill=tk.X)
+            self.addCatButton = self.palette.addCatButton
 
         # Create frames to pack the label buttons
-        if self.categories:
+        elif self.categories:
             n_labels = len(self.categories)
             n_rows = (n_labels) // 4 + 1 # Each row can contain up to 4 labels
         
@@ -592,53 +796,50 @@ class ImageClassifier(tk.Frame):
             self.errorClose()
         else:
             img = self.image_list[self.counter] # Name of current image
-            self.im = Image.open("{}{}".format(self.folder + '/', img))
+            self.metrics.shown(img)
+            im = self.source.open(img, (self.imwidth, self.imheight))
 
             #Resize the image to fit nicely in the frame
-            if (self.im.size[0] > self.imwidth) or (self.im.size[1] > self.imheight):
+            if (im.size[0] > self.imwidth) or (im.size[1] > self.imheight):
                 # If the image is larger than the frame, rescale it to fit
-                if (self.imwidth / self.imheight) < (self.im.size[0] / self.im.size[1]):
+                if (self.imwidth / self.imheight) < (im.size[0] / im.size[1]):
                     # Image sticks out more in width than in height, set the width and scale the height
                     width = int(self.imwidth)
-                    height = int(width*self.im.size[1]/self.im.size[0])
+                    height = int(width*im.size[1]/im.size[0])
                 else:
                     height = int(self.imheight)
-                    width = int(height*self.im.size[0]/self.im.size[1])
+                    width = int(height*im.size[0]/im.size[1])
 
-                self.im.thumbnail((width, height), Image.ANTIALIAS)
+                im.thumbnail((width, height), Image.ANTIALIAS)
             
-            elif (self.im.size[0] * 2 > self.imwidth) or (self.im.size[1] * 2 > self.imheight):
+            elif (im.size[0] * 2 > self.imwidth) or (im.size[1] * 2 > self.imheight):
                 logging.debug("Resizing - Image is within 50% of frame size, resizing to full frame size")
                 # If the image is within 50% of the frame size, resize it to fill the frame
-                if (self.imwidth / self.imheight) < (self.im.size[0] / self.im.size[1]):
+                if (self.imwidth / self.imheight) < (im.size[0] / im.size[1]):
                     # Image aspect ratio smaller than frame, set the width and scale the height
                     width = int(self.imwidth)
-                    height = int(width*self.im.size[1]/self.im.size[0])
+                    height = int(width*im.size[1]/im.size[0])
                 else:
                     height = int(self.imheight)
-                    width = int(height*self.im.size[0]/self.im.size[1])
+                    width = int(height*im.size[0]/im.size[1])
                 
-                self.im = self.im.resize((width, height), resample = Image.BICUBIC)
+                im = im.resize((width, height), resample = Image.BICUBIC)
 
-            elif (self.im.size[0] * 2 < self.imwidth) and (self.im.size[1] * 2 < self.imheight):
+            elif (im.size[0] * 2 < self.imwidth) and (im.size[1] * 2 < self.imheight):
                 logging.debug("Resizing - Image is smaller than 50% of frame size, resizing")
                 # If the image is very small, resize it up to 2x
-                width = int(self.im.size[0] * 2)
-                height = int(self.im.size[1] * 2)
+                width = int(im.size[0] * 2)
+                height = int(im.size[1] * 2)
 
-                self.im = self.im.resize((width, height), resample = Image.BICUBIC)
+                im = im.resize((width, height), resample = Image.BICUBIC)
                 
             
-            self.photo = ImageTk.PhotoImage(self.im)
-
-            if self.counter == 0:
-                self.cv1.create_image(self.imwidth // 2, self.imheight // 2, image = self.photo)
+            # Update the image in place
+            self.renderer.show(im, (self.imwidth, self.imheight))
+            # The pixels were copied to the display buffer, free the decoded image right away
+            im.close()
+            del im
 
-            else:
-                self.cv1.delete("all")
-                self.cv1.create_image(self.imwidth // 2, self.imheight // 2, image = self.photo)
-
-            
             # Truncate the image name to keep it short
             if len(img) > 18:
                 if '/' in img:
@@ -656,66 +857,93 @@ class ImageClassifier(tk.Frame):
             self.infoText.insert('1.0',"Image {}/{} - Filename: {}".format(self.counter+1,self.max_count+1,img_name), 'c')
             self.infoText.config(state=tk.DISABLED)
 
-            # Reset all button styles (colors and outline)
-            self.saveButton.config(highlightbackground = self.buttonOrigColor, bg = self.buttonBgOrigColor)
-            self.masterButton.config(highlightbackground= self.buttonOrigColor, bg = self.buttonBgOrigColor)
-            if self.catButton:
-                for i in range(len(self.catButton)):
-                    self.catButton[i].config(highlightbackground = self.buttonOrigColor, bg = self.buttonBgOrigColor)
+            # Reset the save and master button styles
+            self.styler.apply(self.saveButton, highlightbackground = self.buttonOrigColor, bg = self.buttonBgOrigColor)
+            self.styler.apply(self.masterButton, highlightbackground= self.buttonOrigColor, bg = self.buttonBgOrigColor)
 
             # Display the associated label(s) from any user as colored background for the label button
+            buttonColors = {}
             ## If in reconcileMode, display the chosen label in grey
             if self.reconciledLabelsDict and img in self.reconciledLabelsDict:
-                label = self.reconciledLabelsDict[img]
-                idxLabel = self.categories.index(label)
-                self.catButton[idxLabel].config(highlightbackground='#3E4149', bg = '#3E4149')
+                for label in self.label_names(self.reconciledLabelsDict[img]):
+                    buttonColors[self.categoryIndex[label]] = '#3E4149'
             else:
                 labelDict = {}
                 ## In normal mode, check allLabeledDict for other user's labels
                 if img in self.allLabeledDict:
-                    for (user, label) in self.allLabeledDict[img].items():
+                    for (user, labels) in self.allLabeledDict[img].items():
                         ### Current user's data might not be up to date in allLabeledDict, will user self.labeled
                         if user != self.username:
-                            if label in labelDict:
-                                labelDict[label].append(self.userColors[user])
-                            else:
-                                labelDict[label] = [self.userColors[user]]
+                            for label in self.label_names(labels):
+                                if label in labelDict:
+                                    labelDict[label].append(self.userColors[user])
+                                else:
+                                    labelDict[label] = [self.userColors[user]]
+                ## Pre-labels imported from a model are shown like the labels of another user
+                prediction = self.store.get(LabelStore.modelUser, img)
+                if prediction is not None and not self.redundantMode:
+                    if LabelStore.modelUser not in self.userColors:
+                        self.userColors[LabelStore.modelUser] = self.user_color_helper(LabelStore.modelUser)
+                    for label in self.label_names(prediction):
+                        labelDict.setdefault(label, []).append(self.userColors[LabelStore.modelUser])
                 ## Get curent user's label from self.labeled
                 if img in self.labeled:
-                    label = self.labeled[img]
-                    if label in labelDict and self.userColor not in labelDict[label]:
-                        labelDict[label].append(self.userColor)
-                    elif label not in labelDict:
-                        labelDict[label] = [self.userColor]
-                ## Finally, change the button color accordingly
+                    for label in self.label_names(self.labeled[img]):
+                        if label in labelDict and self.userColor not in labelDict[label]:
+                            labelDict[label].append(self.userColor)
+                        elif label not in labelDict:
+                            labelDict[label] = [self.userColor]
+                ## Finally, pick the button color accordingly
                 for label in labelDict:
-                    idxLabel = self.categories.index(label)
                     if len(labelDict[label]) == 1:
-                        self.catButton[idxLabel].config(highlightbackground=labelDict[label][0], bg = labelDict[label][0])
+                        buttonColors[self.categoryIndex[label]] = labelDict[label][0]
                     else:
-                        self.catButton[idxLabel].config(highlightbackground='#3E4149', bg = '#3E4149')
+                        buttonColors[self.categoryIndex[label]] = '#3E4149'
+                ## Show the label suggested from a near-duplicate, if any
+                if img not in self.labeled and self.suggestedLabels.get(img) in self.categoryIndex:
+                    label = self.suggestedLabels[img]
+                    if label not in labelDict:
+                        buttonColors[self.categoryIndex[label]] = '#A9A9A9'
+
+            ## Only reconfigure the buttons whose color changed since the previous image
+            if self.palette:
+                self.palette.set_colors(buttonColors)
+            else:
+                for idxLabel in self.coloredButtons - set(buttonColors):
+                    self.styler.apply(self.catButton[idxLabel], highlightbackground = self.buttonOrigColor, bg = self.buttonBgOrigColor)
+                for (idxLabel, color) in buttonColors.items():
+                    self.styler.apply(self.catButton[idxLabel], highlightbackground = color, bg = color)
+                self.coloredButtons = set(buttonColors)
 
             # Disable back button if on first image
-            if self.counter == 0:
-                self.prevButton.config(state = tk.DISABLED)
-                self.firstButton.config(state = tk.DISABLED)
-            else:
-                self.prevButton.config(state = tk.NORMAL)
-                self.firstButton.config(state = tk.NORMAL)
+            navState = tk.DISABLED if self.counter == 0 else tk.NORMAL
+            self.styler.apply(self.prevButton, state = navState)
+            self.styler.apply(self.firstButton, state = navState)
 
             # Disable next button on last image
-            if self.counter == self.max_count:
-                self.nextButton.config(state = tk.DISABLED)
-                self.lastButton.config(state = tk.DISABLED)
-            else:
-                self.nextButton.config(state = tk.NORMAL)
-                self.lastButton.config(state = tk.NORMAL)
+            navState = tk.DISABLED if self.counter == self.max_count else tk.NORMAL
+            self.styler.apply(self.nextButton, state = navState)
+            self.styler.apply(self.lastButton, state = navState)
+
+            # Start reading the next images ahead
+            if self.counter < self.max_count:
+                self.source.prefetch(self.image_list[self.counter+1:self.counter+9], (self.imwidth, self.imheight))
+            self.memory.enforce()
 
             # Auto-save and auto-refresh
             if self.saveInterval != 0 and (time.time() - self.saveTimestamp) > self.saveInterval:
                 logging.debug("display_image - Auto-save triggered")
                 self.saveTimestamp = time.time()
-                self.save()
+                self.save(background=True)
+
+    def open_grid(self):
+        '''Opens the grid view to label pages of thumbnails at once'''
+        if not self.localSource:
+            logging.warning("Grid mode is only available for images stored in a local directory.")
+        elif self.gridView:
+            self.gridView.lift()
+        else:
+            self.gridView = GridView(self)
 
     def responsiveCanvas(self, event):
         logging.debug("Redrawing frame1 following a size change event. New size: {}".format((event.width, event.height)))
@@ -745,60 +973,40 @@ class ImageClassifier(tk.Frame):
             logging.warning("This label already exists")
             return
 
-        # Add to category list
-        self.categories.append(sanLabel)
-
-        # Save labels to file
-        if not self.labels_from_file:
-            with open(self.labelpath,'w') as f:
-                json.dump(self.categories, f)
+        # Add to category list, after the parents of a hierarchical label that do not exist yet, and save it
+        self.store.add_label(sanLabel)
+        self.labelSpace = self.store.labelSpace
 
         # Redraw label buttons
         self.draw_label_buttons()
 
     def sanitize_label_name(self, rawString):
-        '''Removes leading and trailing spaces, makes label lowercase and capitalize the first word'''
-        return rawString.strip().lower().capitalize()
+        '''Removes leading and trailing spaces, makes label lowercase and capitalize the first word (of each level)'''
+        return LabelStore.sanitize_label_name(rawString)
 
     def sanitize_user_name(self, rawString):
         '''Removes all spaces and makes lowercase'''
-        return ''.join(rawString.strip().lower().split())
+        return LabelStore.sanitize_user_name(rawString)
             
     def get_all_users(self):
-        '''Returns a list of all users detected in the directory'''
-        return [f.split('_')[1].split('.')[0] for f in os.listdir(self.folder) if (f.endswith('.json') and f.startswith('labeled_') and 'master' not in f)]
+        '''Returns a list of all users detected in the directory when the labels were last loaded'''
+        return self.store.users()
     
     def update_all_dict(self):
-        '''Loads the labeling data from all detected users into a master dictionary.
+        '''Takes a snapshot of the labels of all users, reload the store first to get the latest labels.
 
         self.allLabeledDict: {picName: {user: label}}
         '''
 
         logging.debug("update_all_dict - Refreshing master dictionary")
 
-        self.allLabeledDict = {}
-
-        # If redundantMode is enabled, do not load other user's dictionaries
+        # If redundantMode is enabled, do not show other user's labels
         if self.redundantMode:
+            self.allLabeledDict = {}
             return
 
-        for user in self.users:
-            # Current user is treated separately because dict is already loaded and might not exist on disk
-            if user == self.username:
-                for (imageName, label) in self.labeled.items():
-                    if imageName in self.allLabeledDict:
-                        self.allLabeledDict[imageName][user] = label
-                    else:
-                        self.allLabeledDict[imageName] = {user: label}
-            # For other users, load their dict and dump data into the allLabeledDict dictionary
-            else:
-                dictPath = self.folder + "/labeled_" + user +".json"
-                userDict = self.load_dict(dictPath)
-                for (imageName, label) in userDict.items():
-                    if imageName in self.allLabeledDict:
-                        self.allLabeledDict[imageName][user] = label
-                    else:
-                        self.allLabeledDict[imageName] = {user: label}
+        # Labels of the current user made after the snapshot are read from self.labeled
+        self.allLabeledDict = {img: dict(users) for (img, users) in self.store.byImage.items()}
 
     def update_user_list(self):
 
@@ -811,8 +1019,65 @@ class ImageClassifier(tk.Frame):
             self.users = newUsers
             self.update_users_displayed()
 
-    def refresh_all_dict(self):
-        '''Updates the list of users and master dictionary then refreshes the img_list accordingly. Does not re-explore the directory.'''
+    def refresh_async(self):
+        '''Reads the label files of the other users and hashes their new images in the background, then refreshes the image list'''
+        self.tasks.cancel('refresh')
+        mtimes = dict(self.store.mtimes)
+        skip = set(self.store.owned)
+        known = set(self.store.digests) if self.checksums else set()
+
+        def refresh(token):
+            changes = self.store.read_changes(mtimes, skip)
+            if not self.checksums:
+                return (changes, {}, {})
+            token.check()
+            images = set(img for (user, (_, labels)) in changes.items() if user != LabelStore.modelUser for img in labels)
+            return (changes, self.checksums.digests(sorted(images - known)), self.store.read_checksums(list(changes)))
+
+        self.tasks.submit(refresh, name='Refreshing', key='refresh', callback=self.apply_refresh)
+
+    def apply_refresh(self, result):
+        '''Applies the label files and hashes read by refresh_async() unless a reconciliation started since'''
+        if self.reconcileMode:
+            return
+        (changes, digests, checksums) = result
+        changed = self.store.changed_images(changes) if self.prioritizer and self.prioritizer.rescorable else ()
+        self.store.apply_changes(changes)
+        if self.checksums:
+            self.apply_checksums((digests, checksums), refresh=False)
+        self.refresh_all_dict(reload=False, keepImage=True)
+        self.display_image()
+        self.rescore_async(changed)
+
+    def rescore_async(self, images):
+        '''Asks the priority callable again in the background for the scores of images whose labels changed
+
+        Scores may depend on the labels (e.g. class-balance deficit). Only the images scored before, i.e. that
+        were still to label, are scored again, then the image list is reordered.
+        '''
+        images = [img for img in images if img in self.prioritizer.scores] if images else []
+        if not images:
+            return
+        self.tasks.submit(lambda token: self.prioritizer.score(images, token), name='Scoring', key='scores',
+                          callback=self.apply_scores)
+
+    def apply_scores(self, scores):
+        '''Applies the scores computed by rescore_async() and reorders the images to label'''
+        self.prioritizer.update(scores)
+        if self.reconcileMode:
+            return
+        self.refresh_all_dict(reload=False, keepImage=True)
+        self.display_image()
+
+    def refresh_all_dict(self, reload=True, keepImage=False):
+        '''Updates the list of users and master dictionary then refreshes the img_list accordingly. Does not re-explore the directory.
+
+        The label files are reloaded unless reload is False (e.g. when they were read in the background). The
+        counter moves to the first image to label, or stays on the current image if keepImage is True.
+        '''
+        current = self.image_list[self.counter] if keepImage and self.counter < len(self.image_list) else None
+        if reload:
+            self.store.reload()
 
         #Update the list of users
         self.update_user_list()
@@ -827,17 +1092,21 @@ class ImageClassifier(tk.Frame):
         for img in self.image_list:
             if img in self.labeled:
                 labeledByCurrentUser.append(img)
-            elif img in self.allLabeledDict:
+            elif self.is_labeled_by_others(img):
                 labeledByOtherUser.append(img)
             else:
                 toLabel.append(img)
         
         alreadyLabeled = labeledByOtherUser + labeledByCurrentUser
         self.counter = len(alreadyLabeled)
-        self.image_list =  alreadyLabeled + toLabel
+        self.image_list =  alreadyLabeled + self.schedule_to_label(self.prioritize(toLabel))
+        if current is not None and current in self.image_list:
+            self.counter = self.image_list.index(current)
 
     def previous_image(self, *args):
         '''Displays the previous image'''
+        if self.in_palette(args):
+            return
         if self.counter > 0:
             self.counter += -1
             self.display_image()
@@ -846,6 +1115,8 @@ class ImageClassifier(tk.Frame):
     
     def next_image(self, *args):
         '''Displays the next image'''
+        if self.in_palette(args):
+            return
         if self.counter <= self.max_count:
             self.counter += 1
             self.display_image()
@@ -868,59 +1139,85 @@ class ImageClassifier(tk.Frame):
             self.counter = len(self.sort_conflicting_imgs()[0])
         else:
             for idx, img in enumerate(self.image_list):
-                if img not in self.labeled and img not in self.allLabeledDict:
+                if img not in self.labeled and not self.is_labeled_by_others(img):
                     self.counter = idx
                     break
         self.display_image()
 
+    def is_labeled_by_others(self, img):
+        '''Returns True if img has enough labels from other users that the current user does not need to label it'''
+        if img not in self.allLabeledDict:
+            return False
+        if self.scheduler:
+            nOthers = sum(1 for user in self.allLabeledDict[img] if user != self.username)
+            return nOthers >= self.scheduler.redundancy
+        return True
+
+    def prioritize(self, toLabel):
+        '''Orders images to label by decreasing priority score if a priority source was passed'''
+        if not self.prioritizer:
+            return toLabel
+        return self.prioritizer.order(toLabel)
+
+    def schedule_to_label(self, toLabel):
+        '''Orders images to label: batch leased to the current user, then unleased images, then images leased to others'''
+        if not self.scheduler:
+            return toLabel
+
+        labelCounts = {img: len(self.allLabeledDict[img]) for img in toLabel if img in self.allLabeledDict}
+        self.leased = self.scheduler.lease(self.username, toLabel, labelCounts)
+        leasedSet = set(self.leased)
+        leasedByOthers = self.scheduler.leased_by_others(self.username)
+        free = [img for img in toLabel if img not in leasedSet and img not in leasedByOthers]
+        taken = [img for img in toLabel if img not in leasedSet and img in leasedByOthers]
+        logging.info("Leased {} images, {} images are leased to other users".format(len(self.leased), len(taken)))
+        return self.leased + free + taken
+
+    def batch_completed(self):
+        '''Returns True when the current user has labeled every image of their leased batch'''
+        return bool(self.scheduler and self.leased and all(img in self.labeled for img in self.leased))
+
     def sort_conflicting_imgs(self):
         '''Returns sub-lists of images: (labeledAgreed, labeledDisagreed, toLabel)'''
 
-        labeledAgreed = []
-        labeledDisagreed = []
-        toLabel = []
-
         # Update master dict to have a common reference
+        self.store.reload()
         self.update_user_list()
+        self.check_labels(background=False)
         self.update_all_dict()
-        
-        for img in self.image_list:
-            if img in self.allLabeledDict:
-                labelList = self.allLabeledDict[img]
-                # If only one user labeled the image, it is not disagreed
-                if len(labelList) == 1:
-                    labeledAgreed.append(img)
-                # If multiple labels are found, compare the labels
-                elif len(labelList) > 1:
-                    selectedLabel = None
-                    for (_, label) in labelList.items():
-                        if not selectedLabel:
-                            selectedLabel = label
-                        elif label != selectedLabel:
-                            labeledDisagreed.append(img)
-                            break
-                    if img not in labeledDisagreed:
-                        labeledAgreed.append(img)
-            else:
-                toLabel.append(img)
 
-        return (labeledAgreed, labeledDisagreed, toLabel)
+        # In multi-label mode, users agree when the intersection of their label sets equals the union
+        return self.store.sort(self.image_list)
+
+    def in_palette(self, args):
+        '''Returns True for the key events of the label search field, whose keys are not shortcuts'''
+        return bool(args) and self.palette is not None and getattr(args[0], 'widget', None) is self.palette.entry
 
     def keypress_handler(self,e):
-        try:
-            cat = int(e.char) - 1
-            if cat in range(len(self.categories)):
-                self.classify(self.categories[cat])
-        except ValueError:
+        if self.in_palette([e]):
+            return
+        if e.char and e.char in '0123456789':
+            self.numberEntry.key(e.char)
+        else:
             if e.char == 's':
                 self.save()
             elif e.char == 'q':
                 self.exit()
+            elif e.char == '/' and self.palette:
+                self.palette.focus_search()
+            elif e.char == 'm':
+                self.show_memory()
             #elif e.char == 'd': # For debug only
             #    self.debug_prints()
             else:
                 pass
 
+    def show_memory(self):
+        '''Shows the memory used by the app'''
+        report = self.memory.report()
+        logging.info(report)
+        showinfo("Memory", report)
+
     def debug_prints(self):
         print("----- allLabeledDict Dict entry -----")
         if self.image_list[self.counter] in self.allLabeledDict:
@@ -938,36 +1235,109 @@ class ImageClassifier(tk.Frame):
         else:
             print("Not found")
 
-    def save(self):
-        '''Save the labeled dictionary to disk'''
+    def save(self, background=False):
+        '''Save the labeled dictionary to disk, writing the files in a worker thread if background'''
+
+        if background and not self.reconcileMode:
+            # The changes made while a save is still running are written by the next one
+            if self.tasks.running('save'):
+                return
+        else:
+            background = False
+            self.tasks.wait(key='save')
 
         if self.reconcileMode:
-            # Load all user's dictionaries in memory
-            userDicts = {}
-            for user in self.users:
-                userDicts[user] = self.load_dict(self.folder + "/labeled_" + user +".json")
+            # Load the latest labels of all users
+            self.store.reload()
 
             # For each image, save master label if it exists, otherwise, save user's original label or nothing.
-            for img in self.reconciledLabelsDict:
-                for (_, userDict) in userDicts.items():
-                    userDict[img] = self.reconciledLabelsDict[img]
-            
-            for (user, userDict) in userDicts.items():
-                self.dump_dict(userDict, self.folder + '/labeled_' + user + '.json')
+            for user in self.users:
+                self.store.update(user, self.reconciledLabelsDict, action='reconcile')
+            self.store.flush()
             
             logging.info("Updated save data for users: {}".format(self.users))
 
         else:
-            self.dump_dict(self.labeled, self.savepath)
-            logging.info("Saved data to disk")
+            # The label file is written even if nothing changed so the user is listed
+            self.store.dirty.add(self.username)
+            if background:
+                snapshot = self.store.snapshot()
+                self.store.flush_history()
+                self.tasks.submit(lambda token: self.store.write(snapshot), name='Saving', key='save',
+                                  callback=self.store.mtimes.update, errback=partial(self.save_failed, snapshot))
+            else:
+                self.store.flush()
+                logging.info("Saved data to disk")
+            self.record_checksums(background)
+
+        self.metrics.flush()
 
-        self.saveButton.config(highlightbackground='#3E4149', bg = '#3E4149')
+        self.styler.apply(self.saveButton, highlightbackground='#3E4149', bg = '#3E4149')
         self.saved = True
     
-    def load_dict(self, file):
-        '''Read a pickeled dictionary from file'''
-        with open(file,"r") as f:
-            return json.load(f)
+    def save_failed(self, snapshot, error):
+        '''Marks the labels of a background save that failed to be saved again'''
+        logging.error("Could not save the labels: {}".format(error))
+        self.store.dirty.update(snapshot)
+        self.saved = False
+        self.styler.apply(self.saveButton, highlightbackground=self.buttonOrigColor, bg=self.buttonBgOrigColor)
+
+    def show_busy(self, names):
+        '''Shows the names of the tasks running in the background and a busy cursor'''
+        self.busyLabel.config(text='{}...'.format(', '.join(names)) if names else '')
+        self.root.config(cursor='watch' if names else '')
+
+    def record_checksums(self, background=False):
+        '''Saves the content hash of the images labeled by the current user that do not have one yet'''
+        if not self.checksums:
+            return
+        recorded = self.store.checksums.get(self.username, {})
+        missing = [img for img in self.labeled if img not in recorded]
+        if background and missing:
+            self.tasks.submit(lambda token: (self.checksums.digests(missing), {}), name='Hashing', key='save',
+                              callback=self.apply_checksums)
+        else:
+            self.apply_checksums((self.checksums.digests(missing) if missing else {}, {}))
+
+    def check_labels(self, background=True):
+        '''Drops the labels of the images modified since they were labeled (see LabelStore.check_digests)
+
+        Only the labeled images whose content hash is not known yet are hashed (ChecksumCache only hashes the new
+        or modified ones), in a background task unless background is False.
+        '''
+        if not self.checksums:
+            return
+        images = [img for img in set(self.store.byImage) | set(self.labeled) if img not in self.store.digests]
+        users = [user for user in self.store.users() if user != self.username]
+        work = lambda token: (self.checksums.digests(images), self.store.read_checksums(users))
+        if background:
+            self.tasks.submit(work, name='Checking', key='checksums', callback=self.apply_checksums)
+        else:
+            self.apply_checksums(work(None))
+
+    def apply_checksums(self, result, refresh=True):
+        '''Drops the labels of the modified images from the (digests, checksums) of record_checksums or check_labels'''
+        (digests, checksums) = result
+        changed = self.store.check_digests(digests, checksums)
+        self.store.write_checksums(self.username)
+        if not changed:
+            return
+        if self.username in changed:
+            logging.warning("{} images were modified after being labeled, their labels were removed: {}".format(
+                len(changed[self.username]), changed[self.username][:10]))
+            self.saved = False
+        if refresh and not self.reconcileMode:
+            self.refresh_all_dict(reload=False, keepImage=True)
+            self.display_image()
+
+    @property
+    def labeled(self):
+        '''Labels of the current user {image: label}, changed through self.store'''
+        return self.store.labels[self.username]
+
+    def label_names(self, label):
+        '''Returns the list of label names of a saved label (single label name or bitset)'''
+        return self.labelSpace.names(label)
     
     def dump_dict(self, dict, file):
         '''Pickle a dictionary to file'''
@@ -992,7 +1362,30 @@ class ImageClassifier(tk.Frame):
             if result == 'yes':
                 self.save()
 
-        # Release the lock if the app obtained it
+        # Write the session metrics
+        self.metrics.close()
+
+        # Stop the background work, the saves still running are completed
+        self.tasks.cancel('refresh')
+        self.tasks.cancel('duplicates')
+        self.tasks.cancel('checksums')
+        self.tasks.cancel('scores')
+        self.tasks.shutdown()
+
+        # Close the grid view and its worker processes
+        if self.gridView:
+            self.gridView.close()
+
+        # Report the decode latency and stop the decoding processes
+        for (ext, backends) in self.decoder.report().items():
+            for (backend, (count, mean)) in backends.items():
+                logging.info("Decode latency - {}: {:.1f} ms ({} images, {})".format(ext, 1000 * mean, count, backend))
+        self.decoder.shutdown()
+        self.source.close()
+
+        # Release the leased batch and the lock if the app obtained it
+        if self.scheduler:
+            self.scheduler.release(self.username)
         if self.gotLock:
             self.lock.release()
 
@@ -1012,44 +1405,22 @@ class ImageClassifier(tk.Frame):
         sys.exit()
 
 
-class FsLock(object):
-    '''
-    A simple filesystem based lock mechanism to avoid multiple users logging in with the same username at once.
-    '''
-    def __init__(self, directory, username):
-        self.filename = directory + '/.' + username + '_lock.txt'
-
-        # If the lock file does not exist, create it now
-        if not os.path.exists(self.filename):
-            with open(self.filename, 'w') as f:
-                f.write('unlocked')
-
-    def acquire(self):
-        if self.is_locked():
-            raise Exception("Lock is already acquired.")     
-        else:
-            with open(self.filename, 'w') as f:
-                f.write('locked')
-            
-    def release(self):
-        with open(self.filename, 'w') as f:
-            f.write('unlocked')
-
-    def is_locked(self):
-        with open(self.filename, 'r') as f:
-            return f.read() == 'locked'
-
 def delete_all_files(directory):
     '''Deletes all files created by simplabel in a directory, this resets the labels and all saved data'''
 
     save_files = [f for f in os.listdir(directory) if (f.endswith('.json') and f.startswith('label'))]
     save_files.extend([f for f in os.listdir(directory) if f.startswith('.') and f.endswith('_lock.txt')])
     save_files.extend([f for f in os.listdir(directory) if f.startswith('.label') and f.endswith('.json')])
-    if len(save_files) > 0:
-        response = input("Are you sure you want to delete all saved files: {}? (y/n)".format(save_files))
+    save_files.extend([f for f in os.listdir(directory) if f in ('.leases.json', '.simplabel_hashes.json', '.simplabel_checksums.json')])
+    save_files.extend([f for f in os.listdir(directory) if f.startswith('.') and f.endswith('.index.json')])
+    save_dirs = [f for f in os.listdir(directory) if f in (ThumbnailCache.dirname, LabelHistory.dirname, SessionMetrics.dirname)]
+    if len(save_files) + len(save_dirs) > 0:
+        response = input("Are you sure you want to delete all saved files: {}? (y/n)".format(save_files + save_dirs))
         if response == 'y':
             for f in save_files:
                 os.remove(os.path.join(directory,f))
+            for d in save_dirs:
+                shutil.rmtree(os.path.join(directory,d))
             print("Successfully deleted all saved files")
         else:
             print("Cancelled deletion, your files are exactly where you left them ;)")
@@ -1060,7 +1431,7 @@ def delete_all_files(directory):
 def remove_label(directory, labelName):
     '''Removes a label from the label file after verifying it isn't in use'''
 
-    labelToRemove = labelName.strip().lower().capitalize()
+    labelToRemove = '/'.join(level.strip().lower().capitalize() for level in labelName.split('/'))
 
     # Load the label file to check the presence of the label to remove
     labelFile = directory + '/.labels.json'
@@ -1083,14 +1454,26 @@ def remove_label(directory, labelName):
         dictPath = directory + "/labeled_" + user +".json"
         with open(dictPath, "r") as f:
             userDict = json.load(f)
-        if labelToRemove in userDict.values():
+        if labelToRemove in LabelSpace(labels).names_used(userDict.values()):
             print("Label {} is used by {}, cannot remove it from the list".format(labelToRemove, user))
             return
 
     # If the check have passed, remove the label from the list and resave the list
+    idx = labels.index(labelToRemove)
     labels.remove(labelToRemove)
     with open(labelFile, 'w') as f:
         json.dump(labels, f)
+
+    # Bitsets of multi-label projects are indexed by category, shift the labels that came after the removed one
+    for user in users:
+        dictPath = directory + "/labeled_" + user +".json"
+        with open(dictPath, "r") as f:
+            userDict = json.load(f)
+        if any(isinstance(label, int) for label in userDict.values()):
+            userDict = {img: LabelSpace.drop_bit(label, idx) if isinstance(label, int) else label
+                        for (img, label) in userDict.items()}
+            with open(dictPath, 'w') as f:
+                json.dump(userDict, f)
     
     print("Successfully removed label {} from the list".format(labelToRemove))
     return
@@ -1107,6 +1490,27 @@ def main():
     ap.add_argument("--delete-all", action='store_true', help="Deletes all files created by simplabel in a directory, this resets the labels and all saved data")
     ap.add_argument("--reset-lock", action='store_true', help="Overrides the lock in case of incorrect lockout")
     ap.add_argument("--remove-label", help="Remove a label from the list")
+    ap.add_argument("-b", "--batch-size", type=int, default=0, help="Lease batches of this many unlabeled images so concurrent users do not label the same images (0 to disable)")
+    ap.add_argument("--scores", default=None, help="Scores file (.json or .csv) used to label the highest scoring images first")
+    ap.add_argument("--duplicates", choices=['propagate', 'confirm'], default=None, help="Propagate labels to near-duplicate images or queue them for one-key confirmation (Enter)")
+    ap.add_argument("--warm-cache", action='store_true', help="Pre-renders the thumbnails of all images in the directory to the shared cache")
+    ap.add_argument("--cache-budget", type=int, default=512, help="Disk budget in MB of the shared thumbnail cache (0 to disable)")
+    ap.add_argument("--memory-budget", type=int, default=1024, help="Memory budget in MB of the image buffers and caches of the app (0 to disable)")
+    ap.add_argument("--source", default=None, help="Url of an http file server serving the images and a manifest.json listing them, labels are saved in --directory")
+    ap.add_argument("--project", default=None, help="Project file listing several image directories (roots) to label together, labels are saved in the project's labels directory")
+    ap.add_argument("--redundancy", type=int, default=1, help="Number of users each image should be labeled by when using --batch-size")
+    ap.add_argument("--serve", action='store_true', help="Serve the labeling of the directory to web browsers instead of opening the app")
+    ap.add_argument("--host", default='127.0.0.1', help="With --serve, address to listen on (0.0.0.0 for all interfaces)")
+    ap.add_argument("--port", type=int, default=8080, help="With --serve, port to listen on")
+    ap.add_argument("-m", "--multi-label", action='store_true', help="Multi-label mode: several labels can be selected per image")
+    ap.add_argument("--import-predictions", default=None, help="Imports model predictions from a csv or jsonl file of (path, label, confidence) as pre-labels of the 'model' user")
+    ap.add_argument("--threshold", type=float, default=0.0, help="With --import-predictions, minimum confidence of the predictions imported")
+    ap.add_argument("--add-labels", action='store_true', help="With --import-predictions, adds the predicted labels missing from the label list")
+    ap.add_argument("--history", action='store_true', help="Print the labels of the user (-u) as they were at --at, or save them with --output")
+    ap.add_argument("--at", default=None, help="With --history, date ('2024-05-01 18:30') or unix timestamp (default: now)")
+    ap.add_argument("--metrics", action='store_true', help="Print the labeling throughput and time to decision of each user (or of -u) and day")
+    ap.add_argument("--idle-gap", type=float, default=120, help="With --metrics, pauses longer than this many seconds count as idle time")
+    ap.add_argument("-o", "--output", default=None, help="With --history, json file to save the labels to")
 
     args = ap.parse_args()
 
@@ -1117,12 +1521,32 @@ def main():
     username = args.user
     bResetLock = args.reset_lock
     bRedundant = args.redundant
+    source = args.source
+
+    # Images of a multi-root project are read from its roots, labels are saved in one directory
+    if args.project:
+        if args.source:
+            print("--project and --source cannot be used together")
+            sys.exit(1)
+        if args.serve:
+            print("--serve does not support projects yet, serve each root with -d instead")
+            sys.exit(1)
+        source = args.project
+        rawDirectory = rawDirectory or Project(args.project).folder
 
     # Reset all saved data if requested
     if args.delete_all:
         delete_all_files(rawDirectory)
         sys.exit(0)
 
+    # Pre-render the thumbnail cache
+    if args.warm_cache:
+        if not rawDirectory:
+            print("No directory specified. You must pass the image directory with -d")
+            sys.exit(1)
+        warm_cache(rawDirectory, budget=args.cache_budget*1024**2)
+        sys.exit(0)
+
     # Remove label
     if args.remove_label:
         if not rawDirectory:
@@ -1130,7 +1554,51 @@ def main():
         remove_label(rawDirectory, args.remove_label)
         sys.exit(0)
 
+    # Import model predictions as pre-labels
+    if args.import_predictions:
+        if not rawDirectory:
+            print("No directory specified. You must pass the image directory with -d")
+            sys.exit(1)
+        try:
+            counts = import_predictions(rawDirectory, args.import_predictions, threshold=args.threshold, addLabels=args.add_labels)
+        except RuntimeError as e:
+            print(e)
+            sys.exit(1)
+        print("Imported {imported} of {read} predictions ({below_threshold} below threshold, {unknown_label} with unknown labels)".format(**counts))
+        sys.exit(0)
+
+    # Rebuild the labels of a user at a point in time
+    if args.history:
+        if not rawDirectory or not username:
+            print("You must pass the directory with -d and the user with -u")
+            sys.exit(1)
+        materialize(rawDirectory, username, at=args.at, output=args.output)
+        sys.exit(0)
+
+    # Report the labeling activity
+    if args.metrics:
+        if not rawDirectory:
+            print("No directory specified. You must pass the directory with -d")
+            sys.exit(1)
+        print_report(rawDirectory, users=[username] if username else None, idleGap=args.idle_gap)
+        sys.exit(0)
+
+    # Serve the app to web browsers
+    if args.serve:
+        if not rawDirectory:
+            print("No directory specified. You must pass the image directory with -d")
+            sys.exit(1)
+        try:
+            serve(rawDirectory, categories, host=args.host, port=args.port, cacheBudget=args.cache_budget*1024**2)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        sys.exit(0)
+
     # Launch the app
     root = tk.Tk() 
-    MyApp = ImageClassifier(root, directory = rawDirectory, categories = categories, verbose = verbosity, username = username, bResetLock = bResetLock, bRedundant = bRedundant)
+    MyApp = ImageClassifier(root, directory = rawDirectory, categories = categories, verbose = verbosity, username = username, bResetLock = bResetLock, bRedundant = bRedundant,
+                            batchSize = args.batch_size, redundancy = args.redundancy, priority = args.scores,
+                            duplicates = args.duplicates, cacheBudget = args.cache_budget,
+                            source = source, multiLabel = args.multi_label, memoryBudget = args.memory_budget)
     tk.mainloop()
@@ -0,0 +1,291 @@
+import io
+import os
+import json
+import logging
+import queue
+import threading
+import http.client
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from .archives import archive_extensions, list_archive_images
+from .decode import Decoder
+from .project import Project
+
+
+# Supported image file formats (all extensions supported by PIL should work)
+supported_extensions = ['jpg', 'png', 'gif', 'jpeg ', 'eps', 'bmp', 'tiff', 'bmp',
+                        'icns', 'ico', 'spi',]
+
+
+def list_images(directory, extensions=supported_extensions):
+    '''Lists the images in directory, or in its sub-directories if it does not contain any image directly.
+
+    Paths are relative to directory, using '/' as separator. Images inside zip and tar archives of the
+    directory are listed as 'archive.zip!member.jpg'.
+    '''
+    ## If the directory contains at least 1 image, process only this directory
+    list_image_files = [d for d in os.listdir(directory) if d.split('.')[-1].lower() in extensions]
+    for d in sorted(os.listdir(directory)):
+        if d.lower().endswith(archive_extensions) and not d.startswith('.'):
+            list_image_files.extend(list_archive_images(os.path.join(directory, d), extensions))
+    if len(list_image_files) > 0:
+        return list_image_files
+
+    ## Otherwise, list and check subdirectories
+    logging.info("No image files in main directory, searching sub-directories...")
+    images = []
+    sub_folder_list = [dirName for dirName in next(os.walk(directory))[1] if not dirName.startswith('.')]
+    for dirName in sub_folder_list:
+        dir_path = os.path.join(directory, dirName)
+        images.extend(dirName + '/' + d for d in os.listdir(dir_path) if d.split('.')[-1].lower() in extensions)
+    return images
+
+
+class ImageSource(object):
+    '''Where the images of a project are listed and read from'''
+
+    def list_images(self, extensions):
+        '''Returns the relative paths of all the images available'''
+        raise NotImplementedError
+
+    def open(self, img, maxSize=None):
+        '''Returns the decoded image img, shrunk to fit in maxSize if passed'''
+        raise NotImplementedError
+
+    def prefetch(self, images, maxSize=None):
+        '''Hints that images will be opened soon, in that order'''
+        pass
+
+    def memory_usage(self):
+        '''Returns the bytes held in memory by the source'''
+        return 0
+
+    def release(self, nbytes):
+        '''Frees memory held by the source, returns the bytes freed'''
+        return 0
+
+    def close(self):
+        pass
+
+
+class LocalSource(ImageSource):
+    '''
+    Images stored in a local (or mounted) directory, including images inside archives.
+
+    Parameters
+    ----------
+    directory : string
+        Directory containing the images
+    decoder : Decoder
+        Decoder used to open the images
+    '''
+
+    def __init__(self, directory, decoder=None):
+        self.folder = directory
+        self.decoder = decoder or Decoder()
+
+    def list_images(self, extensions):
+        return list_images(self.folder, extensions)
+
+    def open(self, img, maxSize=None):
+        return self.decoder.decode("{}{}".format(self.folder + '/', img), maxSize)
+
+    def prefetch(self, images, maxSize=None):
+        # Only images that are slow to decode benefit from being decoded ahead
+        for img in images[:1]:
+            self.decoder.prefetch("{}{}".format(self.folder + '/', img), maxSize)
+
+
+class ProjectSource(ImageSource):
+    '''
+    Images stored in the roots of a project (see Project), listed as keys qualified with the name of their root.
+
+    The roots are scanned in parallel so slow mounts are listed concurrently. A root that is not available (e.g.
+    an unmounted disk) is skipped with a warning, its labels are kept.
+
+    Parameters
+    ----------
+    project : Project or string
+        Project or path of the project file
+    decoder : Decoder
+        Decoder used to open the images
+    workers : int
+        Maximum number of roots scanned at once
+    '''
+
+    def __init__(self, project, decoder=None, workers=8):
+        self.project = project if isinstance(project, Project) else Project(project)
+        self.folder = self.project.folder
+        self.decoder = decoder or Decoder()
+        self.workers = workers
+
+    def list_images(self, extensions):
+        roots = list(self.project.roots.items())
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(roots)))) as pool:
+            listings = list(pool.map(lambda root: self._list_root(root[0], root[1], extensions), roots))
+        return [img for listing in listings for img in listing]
+
+    def open(self, img, maxSize=None):
+        return self.decoder.decode(self.project.image_path(img), maxSize)
+
+    def prefetch(self, images, maxSize=None):
+        for img in images[:1]:
+            self.decoder.prefetch(self.project.image_path(img), maxSize)
+
+    @staticmethod
+    def _list_root(name, root, extensions):
+        if not os.path.isdir(root):
+            logging.warning("Root {} ({}) is not available, its images are not listed".format(name, root))
+            return []
+        images = ['{}/{}'.format(name, img) for img in list_images(root, extensions)]
+        logging.info("Found {} images in root {}".format(len(images), name))
+        return images
+
+
+class HttpSource(ImageSource):
+    '''
+    Images served by an HTTP file server.
+
+    The images are listed from a json manifest (a list of paths relative to url) and fetched through a pool of
+    keep-alive connections. Upcoming images are read ahead in parallel and the raw bytes are kept in a bounded
+    in-memory cache so going back and forth does not hit the server again.
+
+    Parameters
+    ----------
+    url : string
+        Base url of the images
+    manifest : string
+        Path of the manifest relative to url
+    connections : int
+        Number of persistent connections (and parallel read-ahead requests)
+    readAhead : int
+        Number of upcoming images fetched ahead of time
+    cacheBytes : int
+        Maximum size in bytes of the local byte cache
+    timeout : float
+        Socket timeout in seconds
+    '''
+
+    def __init__(self, url, manifest='manifest.json', connections=4, readAhead=8, cacheBytes=256*1024**2, timeout=30):
+        parts = urllib.parse.urlsplit(url)
+        self.connectionClass = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.netloc = parts.netloc
+        self.basePath = parts.path.rstrip('/')
+        self.manifest = manifest
+        self.readAhead = readAhead
+        self.cacheBytes = cacheBytes
+        self.timeout = timeout
+
+        # Idle connections, None stands for a connection that has not been opened yet
+        self.connections = queue.LifoQueue()
+        for _ in range(connections):
+            self.connections.put(None)
+        self.executor = ThreadPoolExecutor(max_workers=connections)
+
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.cacheSize = 0
+        self.inflight = {}
+
+    def list_images(self, extensions):
+        manifest = json.loads(self.request(self.manifest).decode('utf-8'))
+        return [img for img in manifest if img.split('.')[-1].lower() in extensions]
+
+    def open(self, img, maxSize=None):
+        im = Image.open(io.BytesIO(self.fetch(img)))
+        im.load()
+        if maxSize:
+            im.thumbnail(maxSize)
+        return im
+
+    def prefetch(self, images, maxSize=None):
+        with self.lock:
+            for img in images[:self.readAhead]:
+                if img not in self.cache and img not in self.inflight:
+                    self.inflight[img] = self.executor.submit(self._fetch_into_cache, img)
+
+    def fetch(self, img):
+        '''Returns the bytes of img from the cache, an in-flight read-ahead or the server'''
+        with self.lock:
+            if img in self.cache:
+                self.cache.move_to_end(img)
+                return self.cache[img]
+            future = self.inflight.get(img)
+        if future is not None:
+            return future.result()
+        return self._fetch_into_cache(img)
+
+    def request(self, path):
+        '''GETs path (relative to the base url) on a pooled connection, retrying once on a stale connection'''
+        target = urllib.parse.quote(self.basePath + '/' + path)
+        conn = self.connections.get()
+        try:
+            for attempt in range(2):
+                if conn is None:
+                    conn = self.connectionClass(self.netloc, timeout=self.timeout)
+                try:
+                    conn.request('GET', target)
+                    response = conn.getresponse()
+                    data = response.read()
+                except (http.client.HTTPException, OSError):
+                    # The server may have closed an idle keep-alive connection
+                    conn.close()
+                    conn = None
+                    if attempt:
+                        raise
+                    continue
+                if response.status != 200:
+                    raise OSError("HTTP {} while fetching {}".format(response.status, target))
+                return data
+        finally:
+            self.connections.put(conn)
+
+    def memory_usage(self):
+        return self.cacheSize
+
+    def release(self, nbytes):
+        '''Drops the least recently used bytes of the cache'''
+        freed = 0
+        with self.lock:
+            while self.cache and freed < nbytes:
+                _, old = self.cache.popitem(last=False)
+                self.cacheSize -= len(old)
+                freed += len(old)
+        return freed
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        while not self.connections.empty():
+            conn = self.connections.get_nowait()
+            if conn is not None:
+                conn.close()
+
+    def _fetch_into_cache(self, img):
+        try:
+            data = self.request(img)
+        except Exception:
+            with self.lock:
+                self.inflight.pop(img, None)
+            raise
+        with self.lock:
+            self.inflight.pop(img, None)
+            if img not in self.cache:
+                self.cache[img] = data
+                self.cacheSize += len(data)
+                while self.cacheSize > self.cacheBytes and len(self.cache) > 1:
+                    _, old = self.cache.popitem(last=False)
+                    self.cacheSize -= len(old)
+        return data
+
+
+def get_source(location, decoder=None):
+    '''Returns the image source for a directory, a project file or an http(s) url'''
+    if location.startswith(('http://', 'https://')):
+        return HttpSource(location)
+    if os.path.isfile(location):
+        return ProjectSource(location, decoder)
+    return LocalSource(location, decoder)
@@ -0,0 +1,433 @@
+import os
+import json
+import logging
+
+from .labelsets import LabelSpace, ancestors, separator
+from .history import LabelHistory
+
+
+class LabelStore(object):
+    '''
+    Labels of all the users of a directory, read from and written to the labeled_<user>.json files, without any GUI.
+
+    The labels of every user are held in memory along with an index by image so the labels of an image, its
+    agreement status and the master labels are available without going through all the files. Changes are
+    logged to the history of each user, marked dirty and written in batches by flush(). Label files of the
+    users not owned by this process are reloaded by reload() when they change on disk.
+
+        store = LabelStore('path/to/images')
+        store.set('alice', 'img1.jpg', 'Cat')
+        store.update('model', {'img2.jpg': 'Dog', 'img3.jpg': 'Cat'})
+        store.flush()
+        agreed, disagreed, unlabeled = store.sort(images)
+
+    The labels of the 'model' user are pre-labels (e.g. imported predictions): they are loaded and saved like the
+    labels of other users but are left out of the index, so they do not count as labels in conflicts, master
+    labels or when looking for images to label.
+
+    Labels of images modified after they were labeled are dropped by check_digests(), from the content hashes
+    recorded by each user in .labeled_<user>_checksums.json when they labeled the images.
+
+    Parameters
+    ----------
+    directory : string
+        Directory containing the images and the label files
+    categories : list[string]
+        Labels to use when the directory does not have a label file yet
+    multiLabel : bool
+        When true, labels are bitsets over the categories. Enabled automatically when bitsets are found on disk.
+    '''
+
+    masterUser = 'master'
+    modelUser = 'model'
+
+    def __init__(self, directory, categories=None, multiLabel=False):
+        self.folder = directory
+        self.labelpath = os.path.join(directory, '.labels.json')
+        self.categories = self.load_categories(categories)
+        self.labelSpace = LabelSpace(self.categories)
+        self.multiLabel = multiLabel
+
+        # {user: {image: label}} and the index {image: {user: label}}
+        self.labels = {}
+        self.byImage = {}
+        # mtime of the label file of each user when it was loaded
+        self.mtimes = {}
+        self.dirty = set()
+        # Users whose labels are changed through this store and are not reloaded from disk
+        self.owned = set()
+        self.histories = {}
+        # Content hashes of the images when each user labeled them {user: {image: sha1}}, and the current ones
+        self.checksums = {}
+        self.digests = {}
+        self.reload()
+
+        # Labels saved as bitsets mean the project is multi-label
+        if not self.multiLabel and any(isinstance(label, int) for labels in self.labels.values()
+                                       for label in labels.values()):
+            logging.info("Found multi-label data, enabling multi-label mode")
+            self.multiLabel = True
+            for user in list(self.labels):
+                self._replace(user, self.labels[user])
+
+    @staticmethod
+    def sanitize_label_name(rawString):
+        '''Removes leading and trailing spaces, makes label lowercase and capitalize the first word (of each level)'''
+        return separator.join(level.strip().lower().capitalize() for level in rawString.split(separator))
+
+    @staticmethod
+    def sanitize_user_name(rawString):
+        '''Removes all spaces and makes lowercase'''
+        return ''.join(rawString.strip().lower().split())
+
+    def load_categories(self, categories=None):
+        '''Returns the labels of the label file if it exists, else saves and returns the categories passed'''
+        if os.path.isfile(self.labelpath):
+            if categories:
+                logging.warning("Found label file, ignoring labels passed as argument.")
+            with open(self.labelpath, 'r') as f:
+                categories = json.load(f)
+            categories = list(dict.fromkeys(self.sanitize_label_name(label) for label in categories))
+            logging.info("Loaded labels from file: {}".format(categories))
+        elif categories:
+            categories = list(dict.fromkeys(self.sanitize_label_name(label) for label in categories))
+            logging.info("Using labels passed as argument: {}".format(categories))
+            self._write_json(self.labelpath, categories)
+        else:
+            categories = []
+        return categories
+
+    def label_path(self, user):
+        return os.path.join(self.folder, 'labeled_{}.json'.format(user))
+
+    def users(self):
+        '''Returns the labelers with labels in the directory or owned by this store, not the model user'''
+        return sorted(user for user in self.labels if user != self.modelUser)
+
+    def reload(self):
+        '''Loads the label files of the users not owned by this store that are new or changed on disk'''
+        self.apply_changes(self.read_changes())
+
+    def read_changes(self, mtimes=None, skip=None):
+        '''
+        Returns {user: (mtime, labels)} read from the label files that are new or changed on disk
+
+        Files of the users in skip (the owned users by default) are not read. Only reads files so it can run in
+        a worker thread when passed copies of mtimes and skip, see apply_changes().
+        '''
+        mtimes = self.mtimes if mtimes is None else mtimes
+        skip = self.owned if skip is None else skip
+        changes = {}
+        for f in os.listdir(self.folder):
+            if not (f.startswith('labeled_') and f.endswith('.json')):
+                continue
+            user = f[len('labeled_'):-len('.json')]
+            if user == self.masterUser or user in skip:
+                continue
+            try:
+                mtime = os.path.getmtime(self.label_path(user))
+                if mtimes.get(user) != mtime:
+                    changes[user] = (mtime, self._read(user))
+            except (OSError, ValueError) as e:
+                # The file is being written by another process, it is read at the next reload
+                logging.debug("Could not load the labels of {}: {}".format(user, e))
+        return changes
+
+    def changed_images(self, changes):
+        '''Returns the set of images whose labels in the changes read by read_changes() differ from the loaded ones'''
+        images = set()
+        for (user, (mtime, labels)) in changes.items():
+            if user in self.owned:
+                continue
+            old = self.labels.get(user, {})
+            images.update(img for img in set(old) | set(labels) if old.get(img) != labels.get(img))
+        return images
+
+    def apply_changes(self, changes):
+        '''Replaces the labels of the users read by read_changes(), except those owned since'''
+        for (user, (mtime, labels)) in changes.items():
+            if user not in self.owned:
+                self._replace(user, labels)
+                self.mtimes[user] = mtime
+
+    def own(self, user):
+        '''Loads the labels of user, which are from then on only changed through this store'''
+        if user not in self.owned:
+            if user not in self.labels:
+                path = self.label_path(user)
+                self._replace(user, self._read(user) if os.path.isfile(path) else {})
+            self.owned.add(user)
+            self.history(user)
+        return self.labels[user]
+
+    def get(self, user, img, default=None):
+        '''Returns the label of img by user'''
+        return self.labels.get(user, {}).get(img, default)
+
+    def labels_of(self, img):
+        '''Returns the labels of img by user {user: label} (not to be modified)'''
+        return self.byImage.get(img, {})
+
+    def items(self, user):
+        '''Iterates over the (image, label) of user'''
+        return iter(self.labels.get(user, {}).items())
+
+    def __iter__(self):
+        '''Iterates over the images labeled by any user'''
+        return iter(self.byImage)
+
+    def __contains__(self, img):
+        return img in self.byImage
+
+    def __len__(self):
+        return len(self.byImage)
+
+    def set(self, user, img, label, action='classify'):
+        '''Sets the label of img by user (None removes it), returns the previous label'''
+        history = self.history(user)
+        userLabels = self.labels.setdefault(user, {})
+        old = userLabels.get(img)
+        if label is None:
+            if img not in userLabels:
+                return old
+            del userLabels[img]
+            self._unindex(user, img)
+        else:
+            userLabels[img] = label
+            self._index(user, img, label)
+        history.record(img, old, label, action=action)
+        self.dirty.add(user)
+        return old
+
+    def update(self, user, labels, action='classify'):
+        '''Sets the labels {image: label} of user'''
+        for (img, label) in labels.items():
+            self.set(user, img, label, action)
+
+    def forget(self, user, img):
+        '''Drops the label of img by user from memory only, the label file is left untouched'''
+        self.labels.get(user, {}).pop(img, None)
+        self._unindex(user, img)
+
+    def is_agreed(self, img):
+        '''Returns True if all the users who labeled img agree, None if it is not labeled'''
+        users = self.byImage.get(img)
+        if not users:
+            return None
+        if self.multiLabel:
+            (intersection, union) = self.labelSpace.agreement({img: list(users.values())})[img]
+            return intersection == union
+        labels = iter(users.values())
+        first = next(labels)
+        return all(label == first for label in labels)
+
+    def sort(self, images):
+        '''Returns sub-lists of images: (labeledAgreed, labeledDisagreed, toLabel)'''
+        agreed = []
+        disagreed = []
+        toLabel = []
+        if self.multiLabel:
+            agreement = self.labelSpace.agreement({img: list(self.byImage[img].values())
+                                                   for img in images if img in self.byImage})
+            for img in images:
+                if img not in agreement:
+                    toLabel.append(img)
+                elif agreement[img][0] == agreement[img][1]:
+                    agreed.append(img)
+                else:
+                    disagreed.append(img)
+            return (agreed, disagreed, toLabel)
+
+        for img in images:
+            status = self.is_agreed(img)
+            if status is None:
+                toLabel.append(img)
+            elif status:
+                agreed.append(img)
+            else:
+                disagreed.append(img)
+        return (agreed, disagreed, toLabel)
+
+    def conflicts(self, images=None):
+        '''Returns the images (among images, all labeled images by default) that users labeled differently'''
+        return self.sort(list(self.byImage) if images is None else images)[1]
+
+    def master(self):
+        '''Returns the master labels {image: label}, raises ValueError if some images have conflicting labels'''
+        conflicts = self.conflicts()
+        if conflicts:
+            raise ValueError("{} images have conflicting labels, e.g. {}".format(len(conflicts), conflicts[:5]))
+        return {img: next(iter(users.values())) for (img, users) in self.byImage.items()}
+
+    def make_master(self):
+        '''Writes the master labels to labeled_master.json (see master()) and returns them'''
+        masterDict = self.master()
+        path = self.label_path(self.masterUser)
+        oldMaster = {}
+        if os.path.isfile(path):
+            with open(path, 'r') as f:
+                oldMaster = json.load(f)
+        history = self.history(self.masterUser, oldMaster)
+        for (img, label) in oldMaster.items():
+            if img not in masterDict:
+                history.record(img, label, None, action='make_master')
+        for (img, label) in masterDict.items():
+            history.record(img, oldMaster.get(img), label, action='make_master')
+        history.flush()
+        self._write_json(path, masterDict)
+        logging.info('Saved the master dictionary to disk.')
+        return masterDict
+
+    def add_label(self, label):
+        '''Adds a label (and its missing parents) to the categories, returns the sanitized label'''
+        label = self.sanitize_label_name(label)
+        if not label or label in self.categories:
+            return label
+        for parent in reversed(ancestors(label)):
+            if parent not in self.categories:
+                self.categories.append(parent)
+        self.categories.append(label)
+        self.labelSpace = LabelSpace(self.categories)
+        self._write_json(self.labelpath, self.categories)
+        for user in self.owned:
+            self.history(user).record(None, None, label, action='add_label')
+        return label
+
+    def history(self, user, labels=None):
+        '''Returns the label history of user, started from labels (the current labels by default)'''
+        if user not in self.histories:
+            self.histories[user] = LabelHistory(self.folder, user)
+            self.histories[user].start(self.labels.get(user, {}) if labels is None else labels)
+        return self.histories[user]
+
+    def checksum_path(self, user):
+        return os.path.join(self.folder, '.labeled_{}_checksums.json'.format(user))
+
+    def read_checksums(self, users):
+        '''Returns the content hashes recorded by users {user: {image: sha1}}, only reads files'''
+        checksums = {}
+        for user in users:
+            try:
+                with open(self.checksum_path(user), 'r') as f:
+                    checksums[user] = json.load(f)
+            except FileNotFoundError:
+                checksums[user] = {}
+            except (OSError, ValueError) as e:
+                logging.debug("Could not load the checksums of {}: {}".format(user, e))
+        return checksums
+
+    def write_checksums(self, user):
+        '''Saves the content hashes of the images labeled by user'''
+        labels = self.labels.get(user, {})
+        self._write_json(self.checksum_path(user),
+                         {img: digest for (img, digest) in self.checksums.get(user, {}).items() if img in labels})
+
+    def check_digests(self, digests, checksums=None):
+        '''
+        Drops the labels of the images whose content changed since they were labeled, returns {user: [image]}
+
+        digests are the current content hashes {image: sha1} of images not checked yet (new labels, images
+        modified since the last check) and checksums the hashes recorded by users {user: {image: sha1}} read by
+        read_checksums() (e.g. of the users whose files changed). Only the labels of these images and users are
+        checked. Labels of owned users are removed, those of other users are only dropped from memory. Labels of
+        owned users without a recorded hash (e.g. labeled by an older version) get the current one.
+        '''
+        digests = {img: digest for (img, digest) in digests.items() if digest is not None}
+        checksums = checksums or {}
+        self.digests.update(digests)
+        for (user, recorded) in checksums.items():
+            # The hashes of owned users are only changed through this store
+            if user not in self.owned or user not in self.checksums:
+                self.checksums[user] = dict(recorded)
+
+        changed = {}
+        for (user, recorded) in self.checksums.items():
+            images = recorded if user in checksums else [img for img in digests if img in recorded]
+            for img in [img for img in images if self.digests.get(img, recorded[img]) != recorded[img]]:
+                if user in self.owned:
+                    self.set(user, img, None, action='invalidate')
+                    del recorded[img]
+                else:
+                    self.forget(user, img)
+                changed.setdefault(user, []).append(img)
+
+        for user in self.owned:
+            recorded = self.checksums.setdefault(user, {})
+            for img in self.labels.get(user, {}):
+                if img in digests and img not in recorded:
+                    recorded[img] = digests[img]
+        return changed
+
+    def flush(self):
+        '''Writes the label files of the users whose labels changed and their history'''
+        self.mtimes.update(self.write(self.snapshot()))
+        self.flush_history()
+
+    def flush_history(self):
+        self.write_history(self.take_history())
+
+    def take_history(self):
+        '''Returns [(history, events)] of the buffered history events and empties the buffers'''
+        return [(history, history.take()) for history in self.histories.values()]
+
+    def write_history(self, pending):
+        '''Appends the events returned by take_history() to the history logs, can run in a worker thread'''
+        for (history, events) in pending:
+            history.flush(events)
+
+    def snapshot(self):
+        '''Returns copies of the labels of the users whose labels changed {user: labels} and marks them saved'''
+        snapshot = {user: dict(self.labels[user]) for user in self.dirty}
+        self.dirty = set()
+        return snapshot
+
+    def write(self, snapshot):
+        '''
+        Writes the label files of a snapshot, returns their mtimes {user: mtime}
+
+        Only writes files so it can run in a worker thread, the mtimes are then added to self.mtimes.
+        '''
+        mtimes = {}
+        for user in sorted(snapshot):
+            path = self.label_path(user)
+            self._write_json(path, snapshot[user])
+            mtimes[user] = os.path.getmtime(path)
+        if snapshot:
+            logging.info("Saved the labels of {}".format(sorted(snapshot)))
+        return mtimes
+
+    def _read(self, user):
+        with open(self.label_path(user), 'r') as f:
+            labels = json.load(f)
+        # Single labels saved before switching to multi-label mode are converted to bitsets
+        if self.multiLabel:
+            labels = {img: self.labelSpace.as_mask(label) for (img, label) in labels.items()}
+        return labels
+
+    def _replace(self, user, labels):
+        '''Replaces all the labels of user, keeping the index by image up to date'''
+        if self.multiLabel:
+            labels = {img: self.labelSpace.as_mask(label) for (img, label) in labels.items()}
+        for img in self.labels.get(user, {}):
+            self._unindex(user, img)
+        self.labels[user] = labels
+        for (img, label) in labels.items():
+            self._index(user, img, label)
+
+    def _index(self, user, img, label):
+        if user != self.modelUser:
+            self.byImage.setdefault(img, {})[user] = label
+
+    def _unindex(self, user, img):
+        users = self.byImage.get(img)
+        if users is not None:
+            users.pop(user, None)
+            if not users:
+                del self.byImage[img]
+
+    @staticmethod
+    def _write_json(path, data):
+        tmppath = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmppath, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmppath, path)
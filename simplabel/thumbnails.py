@@ -0,0 +1,142 @@
+import os
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from .cache import ThumbnailCache
+from .archives import open_image
+
+
+def make_thumbnail(path, size):
+    '''Decodes an image and shrinks it to fit in size, returns (size, rgb_bytes) so it can cross process boundaries'''
+    with open_image(path) as im:
+        # Let the JPEG decoder downscale while decoding
+        im.draft('RGB', size)
+        im = im.convert('RGB')
+        im.thumbnail(size)
+        return im.size, im.tobytes()
+
+
+# Caches opened by this (worker) process, reused so that periodic eviction is triggered
+_caches = {}
+
+def cached_thumbnail(directory, img, size, budget):
+    '''Same as make_thumbnail but goes through the shared on-disk cache of the project'''
+    if (directory, budget) not in _caches:
+        _caches[(directory, budget)] = ThumbnailCache(directory, budget)
+    im = _caches[(directory, budget)].get_or_create(img, size)
+    return im.size, im.tobytes()
+
+
+class ThumbnailLoader(object):
+    '''
+    Generates thumbnails in a pool of worker processes.
+
+    Thumbnails are requested ahead of time (e.g. for the next page of a grid) and collected when ready
+    without blocking the caller.
+
+    Parameters
+    ----------
+    directory : string
+        Directory containing the images
+    size : (int, int)
+        Maximum thumbnail width and height
+    workers : int
+        Number of worker processes (defaults to the number of CPUs)
+    maxItems : int
+        Number of thumbnails kept in memory, the oldest are dropped first
+    cacheBudget : int
+        Disk budget in bytes of the shared thumbnail cache (0 to disable the cache)
+    '''
+
+    def __init__(self, directory, size=(160, 120), workers=None, maxItems=512, cacheBudget=0):
+        self.folder = directory
+        self.size = tuple(size)
+        self.maxItems = maxItems
+        self.cacheBudget = cacheBudget
+        self.futures = OrderedDict()
+        # Spawn workers rather than forking the Tk process and its threads
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def request(self, images):
+        '''Schedules thumbnail generation for images that are not already requested'''
+        for img in images:
+            if img in self.futures:
+                self.futures.move_to_end(img)
+            else:
+                if self.cacheBudget:
+                    future = self.pool.submit(cached_thumbnail, self.folder, img, self.size, self.cacheBudget)
+                else:
+                    future = self.pool.submit(make_thumbnail, os.path.join(self.folder, img), self.size)
+                self.futures[img] = future
+
+        # Forget the oldest thumbnails, cancelling them if they have not started yet
+        while len(self.futures) > self.maxItems:
+            _, future = self.futures.popitem(last=False)
+            future.cancel()
+
+    def get(self, img):
+        '''Returns the thumbnail of img as a PIL image, or None if it is not ready yet'''
+        future = self.futures.get(img)
+        if future is None or not future.done():
+            return None
+        try:
+            size, data = future.result()
+        except Exception as e:
+            logging.warning("Could not make a thumbnail for {}: {}".format(img, e))
+            size, data = self.size, bytes(3 * self.size[0] * self.size[1])
+            self.futures[img] = _Done((size, data))
+        return Image.frombytes('RGB', size, data)
+
+    def memory_usage(self):
+        '''Returns the bytes held by the thumbnails generated'''
+        return sum(self._size(future) for future in self.futures.values())
+
+    def release(self, nbytes):
+        '''Forgets the least recently requested thumbnails until nbytes are freed, returns the bytes freed'''
+        freed = 0
+        while self.futures and freed < nbytes:
+            _, future = self.futures.popitem(last=False)
+            freed += self._size(future)
+            future.cancel()
+        return freed
+
+    @staticmethod
+    def _size(future):
+        if not future.done() or future.cancelled() or future.exception() is not None:
+            return 0
+        return len(future.result()[1])
+
+    def is_pending(self, img):
+        future = self.futures.get(img)
+        return future is not None and not future.done()
+
+    def shutdown(self):
+        for future in self.futures.values():
+            future.cancel()
+        self.pool.shutdown(wait=False)
+
+
+class _Done(object):
+    '''Stand-in for a completed future'''
+
+    def __init__(self, result):
+        self._result = result
+
+    def done(self):
+        return True
+
+    def cancelled(self):
+        return False
+
+    def exception(self):
+        return None
+
+    def cancel(self):
+        return False
+
+    def result(self):
+        return self._result
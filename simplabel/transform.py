@@ -0,0 +1,124 @@
+import os
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from PIL import Image, ImageOps
+
+from .archives import open_image
+
+
+class ImageTransform(object):
+    '''
+    Resizes and re-encodes an image while it is exported.
+
+    Parameters
+    ----------
+    maxSide : int
+        Images larger than this on their longest side are shrunk to it (None to keep the size)
+    format : string
+        Output format: 'jpeg', 'png' or 'webp' (None to keep the format of each image)
+    quality : int
+        Encoding quality of JPEG and WebP images
+    exifTranspose : bool
+        When true, pixels are rotated according to the EXIF orientation tag which is then dropped
+    '''
+
+    extensions = {'jpeg': 'jpg', 'png': 'png', 'webp': 'webp'}
+
+    def __init__(self, maxSide=None, format=None, quality=90, exifTranspose=True):
+        if format is not None and format.lower() not in self.extensions:
+            raise ValueError("Unsupported output format {}, use one of {}".format(format, sorted(self.extensions)))
+        self.maxSide = maxSide
+        self.format = format.lower() if format else None
+        self.quality = quality
+        self.exifTranspose = exifTranspose
+
+    def output_name(self, image):
+        '''Returns the file name of the transformed image'''
+        name = os.path.basename(image.replace('!', '/'))
+        if self.format:
+            name = os.path.splitext(name)[0] + '.' + self.extensions[self.format]
+        return name
+
+    def apply(self, source, labelDirect, image):
+        '''Writes the transformed image at source to labelDirect, returns the number of bytes written'''
+        with open_image(source) as im:
+            fmt = self.format or (im.format or 'png').lower()
+            if fmt == 'mpo':
+                fmt = 'jpeg'
+            if self.maxSide:
+                # Let the JPEG decoder skip the resolution that will be thrown away
+                im.draft(im.mode, (self.maxSide, self.maxSide))
+            out = ImageOps.exif_transpose(im) if self.exifTranspose else im.copy()
+        if self.maxSide and max(out.size) > self.maxSide:
+            out.thumbnail((self.maxSide, self.maxSide), Image.LANCZOS)
+
+        options = {}
+        if fmt == 'jpeg':
+            if out.mode not in ('RGB', 'L'):
+                out = out.convert('RGB')
+            options = {'quality': self.quality, 'optimize': True}
+        elif fmt == 'webp':
+            options = {'quality': self.quality}
+
+        path = os.path.join(labelDirect, self.output_name(image))
+        out.save(path, fmt.upper(), **options)
+        return os.path.getsize(path)
+
+
+def _transform_one(args):
+    transform, source, labelDirect, image = args
+    try:
+        transform.apply(source, labelDirect, image)
+    except (OSError, ValueError) as e:
+        return "{}: {}".format(image, e)
+    return None
+
+
+def run_transforms(jobs, transform, workers=None, maxPending=None):
+    '''
+    Runs transform on (source, labelDirect, image) jobs in a process pool, returns (images written, seconds)
+
+    At most maxPending jobs (4 per worker by default) are queued at once so jobs can come from a generator of
+    any length without piling up in memory.
+    '''
+    workers = workers or os.cpu_count() or 1
+    maxPending = maxPending or 4 * workers
+    try:
+        import tqdm
+        progress = tqdm.tqdm()
+    except ImportError:
+        progress = None
+
+    start = time.time()
+    done = 0
+    pending = set()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        for job in jobs:
+            if len(pending) >= maxPending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                done += _collect(finished, progress)
+            pending.add(pool.submit(_transform_one, (transform,) + tuple(job)))
+        finished, _ = wait(pending)
+        done += _collect(finished, progress)
+
+    if progress is not None:
+        progress.close()
+    elapsed = time.time() - start
+    logging.info("Transformed {} images in {:.1f}s ({:.1f} images/s)".format(done, elapsed, done / max(elapsed, 1e-9)))
+    return done, elapsed
+
+
+def _collect(finished, progress):
+    ok = 0
+    for future in finished:
+        error = future.result()
+        if error:
+            logging.warning("Could not transform {}".format(error))
+        else:
+            ok += 1
+    if progress is not None:
+        progress.update(len(finished))
+    return ok
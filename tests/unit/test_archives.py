@@ -0,0 +1,88 @@
+import unittest
+
+import io
+import os
+import json
+import tarfile
+import zipfile
+import tempfile
+from unittest import mock
+
+from PIL import Image
+
+from simplabel import archives
+from simplabel.archives import split_key, open_image, read_member, list_archive_images
+from simplabel.sources import list_images, supported_extensions
+from simplabel.flow_to_directory import flow_to_dict
+
+class Test_Archives(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+
+        self.members = {}
+        for i, color in enumerate([(255, 0, 0), (0, 255, 0), (0, 0, 255)]):
+            buf = io.BytesIO()
+            Image.new('RGB', (64, 48), color).save(buf, 'PNG')
+            self.members['imgs/img{}.png'.format(i)] = buf.getvalue()
+
+        with zipfile.ZipFile(os.path.join(self.directory, 'stored.zip'), 'w', zipfile.ZIP_STORED) as z:
+            for name, data in self.members.items():
+                z.writestr(name, data)
+        with zipfile.ZipFile(os.path.join(self.directory, 'deflated.zip'), 'w', zipfile.ZIP_DEFLATED) as z:
+            for name, data in self.members.items():
+                z.writestr(name, data)
+            z.writestr('notes.txt', 'not an image')
+        with tarfile.open(os.path.join(self.directory, 'plain.tar'), 'w') as t:
+            for name, data in self.members.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                t.addfile(info, io.BytesIO(data))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_split_key(self):
+        self.assertEqual(split_key('dir/a.zip!imgs/b.jpg'), ('dir/a.zip', 'imgs/b.jpg'))
+        self.assertIsNone(split_key('dir/b.jpg'))
+        self.assertEqual(split_key('dir/Photos.ZIP!b.jpg'), ('dir/Photos.ZIP', 'b.jpg'))
+        self.assertEqual(split_key('dir/a.Tar!b.jpg'), ('dir/a.Tar', 'b.jpg'))
+
+    def test_tar_checked_once(self):
+        archive = os.path.join(self.directory, 'plain.tar')
+        with mock.patch('simplabel.archives._is_plain_tar', wraps=archives._is_plain_tar) as isPlain:
+            index = archives.ArchiveIndex(archive)
+            for name, data in self.members.items():
+                self.assertEqual(b''.join(index.iter_member(name)), data)
+        self.assertEqual(isPlain.call_count, 1)
+
+    def test_read_members(self):
+        for archive in ['stored.zip', 'deflated.zip', 'plain.tar']:
+            for name, data in self.members.items():
+                key = os.path.join(self.directory, archive + '!' + name)
+                self.assertEqual(read_member(key), data)
+                with open_image(key) as im:
+                    self.assertEqual(im.size, (64, 48))
+
+    def test_index_is_cached(self):
+        archive = os.path.join(self.directory, 'deflated.zip')
+        keys = list_archive_images(archive, supported_extensions)
+        self.assertEqual(len(keys), 3)
+        self.assertTrue(os.path.isfile(os.path.join(self.directory, '.deflated.zip.index.json')))
+
+    def test_list_images(self):
+        images = list_images(self.directory)
+        self.assertEqual(len(images), 9)
+        self.assertIn('plain.tar!imgs/img2.png', images)
+
+    def test_flow_from_archive(self):
+        labels = {'stored.zip!imgs/img0.png': 'Red', 'plain.tar!imgs/img1.png': 'Green'}
+        with open(os.path.join(self.directory, 'labeled_master.json'), 'w') as f:
+            json.dump(labels, f)
+        outDir = os.path.join(self.directory, 'out')
+        flow_to_dict(self.directory, outDir)
+
+        with open(os.path.join(outDir, 'Red', 'img0.png'), 'rb') as f:
+            self.assertEqual(f.read(), self.members['imgs/img0.png'])
+        self.assertTrue(os.path.isfile(os.path.join(outDir, 'Green', 'img1.png')))
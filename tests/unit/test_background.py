@@ -0,0 +1,111 @@
+import unittest
+
+import threading
+
+from simplabel.background import BackgroundTasks, CancelToken, Cancelled
+
+class FakeWidget(object):
+    '''Stand-in for a Tk widget, after() callbacks are run by run_after()'''
+
+    def __init__(self):
+        self.jobs = []
+
+    def after(self, delay, callback):
+        self.jobs.append(callback)
+        return len(self.jobs)
+
+    def after_cancel(self, job):
+        pass
+
+    def run_after(self):
+        (jobs, self.jobs) = (self.jobs, [])
+        for job in jobs:
+            job()
+
+class Test_BackgroundTasks(unittest.TestCase):
+
+    def setUp(self):
+        self.widget = FakeWidget()
+        self.busy = []
+        self.tasks = BackgroundTasks(self.widget, workers=2, onBusy=self.busy.append)
+
+    def tearDown(self):
+        self.tasks.shutdown()
+
+    def test_results_delivered_on_tk_thread(self):
+        results = []
+        release = threading.Event()
+        future = self.tasks.submit(lambda token, x: release.wait() and x * 2, 21, name='Double',
+                                   callback=lambda result: results.append((result, threading.current_thread())))
+        self.assertEqual(self.busy, [['Double']])
+        self.assertEqual(len(self.widget.jobs), 1)
+
+        # Nothing is delivered until the Tk thread polls
+        release.set()
+        future.result()
+        self.assertEqual(results, [])
+        self.widget.run_after()
+        self.assertEqual(results, [(42, threading.current_thread())])
+        self.assertEqual(self.busy, [['Double'], []])
+        self.assertEqual(self.tasks.running(), [])
+        self.assertEqual(self.widget.jobs, [])
+
+    def test_errors(self):
+        errors = []
+        self.tasks.submit(lambda token: 1 / 0, errback=errors.append)
+        with self.assertLogs(level='ERROR'):
+            future = self.tasks.submit(lambda token: 1 / 0, name='Divide')
+            self.tasks.wait()
+        self.assertIsInstance(errors[0], ZeroDivisionError)
+        with self.assertRaises(ZeroDivisionError):
+            self.tasks.result(future)
+
+    def test_cancel(self):
+        results = []
+        started = threading.Event()
+
+        def work(token):
+            started.set()
+            while True:
+                token.check()
+
+        future = self.tasks.submit(work, key='refresh', callback=results.append)
+        other = self.tasks.submit(lambda token: 'kept', key='save', callback=results.append)
+        started.wait()
+        self.tasks.cancel('refresh')
+        self.tasks.wait()
+        self.assertIsInstance(future.exception(), Cancelled)
+        self.assertEqual(results, ['kept'])
+        self.assertEqual(other.result(), 'kept')
+
+    def test_wait_by_key(self):
+        results = []
+        release = threading.Event()
+        self.tasks.submit(lambda token: release.wait(5) and 'slow', key='refresh', callback=results.append)
+        self.tasks.submit(lambda token: 'save', key='save', callback=results.append)
+        self.tasks.wait(key='save')
+        self.assertEqual(results, ['save'])
+        self.assertEqual([future.key for future in self.tasks.running()], ['refresh'])
+        release.set()
+        self.tasks.wait()
+        self.assertEqual(results, ['save', 'slow'])
+
+    def test_inline(self):
+        tasks = BackgroundTasks(self.widget, workers=0)
+        results = []
+        tasks.submit(lambda token, x: x + 1, 1, callback=results.append)
+        self.assertEqual(results, [2])
+        self.assertEqual(tasks.running(), [])
+        self.assertEqual(self.widget.jobs, [])
+
+    def test_token(self):
+        token = CancelToken()
+        token.check()
+        token.cancel()
+        self.assertTrue(token.cancelled)
+        with self.assertRaises(Cancelled):
+            token.check()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+import os
+import time
+import tempfile
+import threading
+
+from PIL import Image
+
+from simplabel.cache import ThumbnailCache
+
+class Test_ThumbnailCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+        self.images = []
+        for i in range(4):
+            name = "img{}.jpg".format(i)
+            Image.new('RGB', (640, 480), (60*i, 30, 0)).save(os.path.join(self.directory, name))
+            self.images.append(name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_get_or_create(self):
+        cache = ThumbnailCache(self.directory)
+        self.assertIsNone(cache.get(self.images[0], (100, 100)))
+        thumb = cache.get_or_create(self.images[0], (100, 100))
+        self.assertEqual(thumb.size, (100, 75))
+        self.assertEqual(cache.get(self.images[0], (100, 100)).size, (100, 75))
+        # Different sizes are different entries
+        self.assertIsNone(cache.get(self.images[0], (50, 50)))
+
+    def test_modified_image_misses(self):
+        cache = ThumbnailCache(self.directory)
+        cache.get_or_create(self.images[0], (100, 100))
+        path = os.path.join(self.directory, self.images[0])
+        os.utime(path, (time.time() + 10, time.time() + 10))
+        self.assertIsNone(cache.get(self.images[0], (100, 100)))
+
+    def test_evict_least_recently_used(self):
+        cache = ThumbnailCache(self.directory)
+        for idx, img in enumerate(self.images):
+            cache.get_or_create(img, (100, 100))
+            entry = cache.key(img, (100, 100))
+            os.utime(entry, (1000 + idx, 1000 + idx))
+        entrySize = os.path.getsize(cache.key(self.images[0], (100, 100)))
+
+        cache.budget = 2 * entrySize + entrySize // 2
+        self.assertEqual(cache.evict(), 2)
+        self.assertIsNone(cache.get(self.images[0], (100, 100)))
+        self.assertIsNone(cache.get(self.images[1], (100, 100)))
+        self.assertIsNotNone(cache.get(self.images[3], (100, 100)))
+
+    def test_concurrent_puts(self):
+        cache = ThumbnailCache(self.directory)
+        image = Image.new('RGB', (100, 75))
+        errors = []
+
+        def put():
+            try:
+                for _ in range(20):
+                    cache.put(self.images[0], (100, 100), image)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=put) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(cache.get(self.images[0], (100, 100)).size, (100, 75))
+        entries = os.listdir(os.path.dirname(cache.key(self.images[0], (100, 100))))
+        self.assertEqual([entry for entry in entries if entry.endswith('.tmp')], [])
+
+    def test_warm(self):
+        cache = ThumbnailCache(self.directory)
+        self.assertEqual(cache.warm(self.images, [(100, 100), (50, 50)], workers=2), 8)
+        self.assertEqual(cache.warm(self.images, [(100, 100)], workers=2), 0)
+        self.assertIsNotNone(cache.get(self.images[2], (50, 50)))
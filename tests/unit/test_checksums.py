@@ -0,0 +1,109 @@
+import unittest
+
+import os
+import json
+import time
+import zipfile
+import tempfile
+from unittest import mock
+
+from simplabel.checksums import ChecksumCache, file_digest, find_duplicates
+from simplabel.flow_to_directory import flow_to_dict, main
+
+class Test_ChecksumCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+        self.write('a.jpg', b'same')
+        self.write('b.jpg', b'same')
+        self.write('c.jpg', b'other')
+        with zipfile.ZipFile(os.path.join(self.directory, 'arch.zip'), 'w') as z:
+            z.writestr('d.jpg', b'same')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name, data):
+        with open(os.path.join(self.directory, name), 'wb') as f:
+            f.write(data)
+
+    def test_duplicates(self):
+        digests = ChecksumCache(self.directory, workers=2).digests(['a.jpg', 'b.jpg', 'c.jpg', 'arch.zip!d.jpg', 'missing.jpg'])
+        self.assertIsNone(digests['missing.jpg'])
+        self.assertEqual(digests['arch.zip!d.jpg'], file_digest(os.path.join(self.directory, 'a.jpg')))
+        self.assertEqual(list(find_duplicates(digests).values()), [['a.jpg', 'arch.zip!d.jpg', 'b.jpg']])
+
+    def test_cache_invalidated_on_change(self):
+        ChecksumCache(self.directory).digests(['c.jpg'])
+        self.assertTrue(os.path.isfile(os.path.join(self.directory, ChecksumCache.filename)))
+        before = ChecksumCache(self.directory).digests(['c.jpg'])['c.jpg']
+        self.write('c.jpg', b'changed')
+        os.utime(os.path.join(self.directory, 'c.jpg'), ns=(time.time_ns(), time.time_ns() + 10**9))
+        self.assertNotEqual(ChecksumCache(self.directory).digests(['c.jpg'])['c.jpg'], before)
+
+
+class Test_Dedupe(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+        for name, data in (('a.jpg', b'same'), ('sub_b.jpg', b'same'), ('c.jpg', b'other')):
+            with open(os.path.join(self.directory, name), 'wb') as f:
+                f.write(data)
+        self.outDir = os.path.join(self.directory, 'out')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def save_master(self, labels):
+        with open(os.path.join(self.directory, 'labeled_master.json'), 'w') as f:
+            json.dump(labels, f)
+
+    def test_single_copy(self):
+        self.save_master({'a.jpg': 'Cat', 'sub_b.jpg': 'Cat', 'c.jpg': 'Dog'})
+        flow_to_dict(self.directory, self.outDir, dedupe=True)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.outDir, 'Cat'))), ['a.jpg'])
+        with open(os.path.join(self.outDir, 'duplicates_report.json')) as f:
+            report = json.load(f)
+        self.assertEqual(report['duplicates'][0]['images'], ['a.jpg', 'sub_b.jpg'])
+        self.assertEqual(report['conflicts'], [])
+
+    def test_conflicting_labels_fail(self):
+        self.save_master({'a.jpg': 'Cat', 'sub_b.jpg': 'Dog', 'c.jpg': 'Dog'})
+        with self.assertRaises(SystemExit):
+            flow_to_dict(self.directory, self.outDir, dedupe=True)
+        self.assertFalse(os.path.exists(os.path.join(self.outDir, 'Cat')))
+
+    def test_manifest_and_shards(self):
+        self.save_master({'a.jpg': 'Cat', 'sub_b.jpg': 'Cat', 'c.jpg': 'Dog'})
+        manifest = os.path.join(self.outDir, 'manifest.jsonl')
+        with mock.patch('sys.argv', ['flow', '-i', self.directory, '-m', manifest, '--splits', '--dedupe']):
+            main()
+        with open(manifest) as f:
+            self.assertEqual(sorted(json.loads(line)['path'] for line in f), ['a.jpg', 'c.jpg'])
+        self.assertTrue(os.path.isfile(os.path.join(self.outDir, 'duplicates_report.json')))
+
+        shards = os.path.join(self.directory, 'shards')
+        with mock.patch('sys.argv', ['flow', '-i', self.directory, '-s', shards, '--splits', '--workers', '1', '--dedupe']):
+            main()
+        with open(os.path.join(shards, 'index.json')) as f:
+            self.assertEqual(json.load(f)['samples'], 2)
+
+        with mock.patch('sys.argv', ['flow', '-i', self.directory, '-j', manifest, '--dedupe']):
+            with self.assertRaises(SystemExit):
+                main()
+
+    def test_manifest_conflicting_labels_fail(self):
+        # Anagram labels must not compare equal
+        self.save_master({'a.jpg': 'Stop', 'sub_b.jpg': 'Spot', 'c.jpg': 'Dog'})
+        manifest = os.path.join(self.outDir, 'manifest.jsonl')
+        with mock.patch('sys.argv', ['flow', '-i', self.directory, '-m', manifest, '--dedupe']):
+            with self.assertRaises(SystemExit):
+                main()
+        self.assertFalse(os.path.exists(manifest))
+        with open(os.path.join(self.outDir, 'duplicates_report.json')) as f:
+            self.assertEqual(json.load(f)['conflicts'][0]['images'], ['a.jpg', 'sub_b.jpg'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+import os
+import tempfile
+
+from PIL import Image
+
+from simplabel.decode import Decoder
+
+class Test_Decoder(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.jpg = os.path.join(self.tmpdir.name, 'small.jpg')
+        self.tif = os.path.join(self.tmpdir.name, 'large.tif')
+        Image.new('RGB', (320, 240), (200, 10, 10)).save(self.jpg)
+        Image.new('RGB', (1200, 900), (10, 200, 10)).save(self.tif)
+        self.decoder = Decoder(workers=1, sizeThreshold=1024**2)
+
+    def tearDown(self):
+        self.decoder.shutdown()
+        self.tmpdir.cleanup()
+
+    def test_backend_selection(self):
+        self.assertFalse(self.decoder.use_process(self.jpg))
+        self.assertTrue(self.decoder.use_process(self.tif))
+
+    def test_decode_in_thread(self):
+        im = self.decoder.decode(self.jpg, (160, 160))
+        self.assertEqual(im.size, (160, 120))
+        self.assertIn('thread', self.decoder.report()['jpg'])
+
+    def test_decode_in_process(self):
+        im = self.decoder.decode(self.tif, (600, 600))
+        self.assertEqual(im.size, (600, 450))
+        self.assertEqual(im.getpixel((10, 10)), (10, 200, 10))
+        self.assertIn('process', self.decoder.report()['tif'])
+
+    def test_prefetch(self):
+        self.decoder.prefetch(self.tif)
+        self.assertEqual(len(self.decoder.pending), 1)
+        im = self.decoder.decode(self.tif)
+        self.assertEqual(im.size, (1200, 900))
+        self.assertEqual(len(self.decoder.pending), 0)
@@ -0,0 +1,78 @@
+import unittest
+
+import os
+import tempfile
+
+from PIL import Image, ImageDraw
+
+from simplabel.duplicates import DuplicateIndex, dhash, phash, hamming
+from simplabel.background import CancelToken, Cancelled
+
+class Test_DuplicateIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+
+        # Two bursts of near identical frames and one unrelated image
+        self.save_image('burst1_a.png', shape='ellipse', offset=0)
+        self.save_image('burst1_b.png', shape='ellipse', offset=2)
+        self.save_image('burst2_a.png', shape='rectangle', offset=0)
+        self.save_image('burst2_b.png', shape='rectangle', offset=2)
+        self.save_image('other.png', shape='gradient', offset=0)
+        self.images = sorted(os.listdir(self.directory))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def save_image(self, name, shape, offset):
+        im = Image.new('L', (200, 150), 30)
+        draw = ImageDraw.Draw(im)
+        if shape == 'ellipse':
+            draw.ellipse((20 + offset, 20, 120 + offset, 120), fill=220)
+        elif shape == 'rectangle':
+            draw.rectangle((100 + offset, 10, 190 + offset, 60), fill=220)
+            draw.rectangle((10 + offset, 90, 60 + offset, 140), fill=120)
+        else:
+            for x in range(200):
+                draw.line((x, 0, x, 150), fill=255 - x)
+        im.save(os.path.join(self.directory, name))
+
+    def test_hashes_are_stable(self):
+        with Image.open(os.path.join(self.directory, 'burst1_a.png')) as im:
+            self.assertEqual(dhash(im), dhash(im))
+            self.assertEqual(phash(im), phash(im))
+
+    def test_near_duplicates_have_close_hashes(self):
+        hashes = {}
+        for img in self.images:
+            with Image.open(os.path.join(self.directory, img)) as im:
+                hashes[img] = dhash(im)
+        self.assertLess(hamming(hashes['burst1_a.png'], hashes['burst1_b.png']),
+                        hamming(hashes['burst1_a.png'], hashes['burst2_a.png']))
+
+    def test_groups(self):
+        index = DuplicateIndex(self.directory)
+        index.build(self.images)
+        self.assertTrue(index.ready.is_set())
+        self.assertEqual(index.group('burst1_a.png'), ['burst1_b.png'])
+        self.assertEqual(index.group('burst2_b.png'), ['burst2_a.png'])
+        self.assertEqual(index.group('other.png'), [])
+        self.assertEqual(index.neighbors('burst1_b.png'), ['burst1_a.png'])
+
+    def test_hashes_are_cached(self):
+        DuplicateIndex(self.directory).build(self.images)
+        self.assertTrue(os.path.isfile(os.path.join(self.directory, '.simplabel_hashes.json')))
+
+        index = DuplicateIndex(self.directory)
+        index._hash_file = None # Any hashing would fail
+        index.build(self.images)
+        self.assertEqual(index.group('burst1_a.png'), ['burst1_b.png'])
+
+    def test_cancelled_build(self):
+        token = CancelToken()
+        token.cancel()
+        index = DuplicateIndex(self.directory)
+        with self.assertRaises(Cancelled):
+            index.build(self.images, token=token)
+        self.assertFalse(index.ready.is_set())
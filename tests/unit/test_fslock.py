@@ -0,0 +1,151 @@
+import unittest
+
+import os
+import time
+import tempfile
+import threading
+
+from simplabel.fslock import FsLock
+
+class Test_FsLock(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_constructor_does_not_create_file(self):
+        FsLock(self.directory, "testuser")
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_acquire_release(self):
+        lock = FsLock(self.directory, "testuser")
+        lock.acquire()
+        self.assertTrue(lock.is_locked())
+        lock.release()
+        self.assertFalse(lock.is_locked())
+        # Releasing twice is harmless
+        lock.release()
+
+    def test_double_acquire_fails(self):
+        lock1 = FsLock(self.directory, "testuser")
+        lock2 = FsLock(self.directory, "testuser")
+        lock1.acquire()
+        with self.assertRaises(Exception):
+            lock2.acquire()
+        lock1.release()
+        lock2.acquire()
+        lock2.release()
+
+    def test_stale_lock_is_broken(self):
+        lock1 = FsLock(self.directory, "testuser", leaseTimeout=10)
+        lock1.acquire()
+        lock1._cancel_heartbeat()
+        # Age the lease past its timeout
+        old = time.time() - 60
+        os.utime(lock1.filename, (old, old))
+
+        lock2 = FsLock(self.directory, "testuser", leaseTimeout=10)
+        self.assertFalse(lock2.is_locked())
+        lock2.acquire()
+        self.assertTrue(lock2.is_locked())
+        lock2.release()
+
+    def test_taken_over_lock_is_left_alone(self):
+        lock1 = FsLock(self.directory, "testuser", leaseTimeout=10)
+        lock1.acquire()
+        lock1._cancel_heartbeat()
+        old = time.time() - 60
+        os.utime(lock1.filename, (old, old))
+
+        # Another session breaks the lapsed lease and takes the lock
+        lock2 = FsLock(self.directory, "testuser", leaseTimeout=10)
+        lock2.acquire()
+        lock2._cancel_heartbeat()
+        os.utime(lock2.filename, (old + 55, old + 55))
+
+        # The heartbeat of the first session does not refresh the lock of the second one
+        lock1._heartbeat()
+        self.assertEqual(os.path.getmtime(lock2.filename), old + 55)
+        self.assertTrue(lock2.owns_file())
+        self.assertFalse(lock1.owns_file())
+
+        # Nor does its release remove it
+        lock1.release()
+        self.assertTrue(lock2.is_locked())
+        self.assertEqual(os.listdir(self.directory), ['.testuser_lock.txt'])
+        lock2.release()
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_forced_release(self):
+        lock1 = FsLock(self.directory, "testuser")
+        lock1.acquire()
+        lock2 = FsLock(self.directory, "testuser")
+        lock2.release(force=True)
+        self.assertFalse(lock1.is_locked())
+        lock2.acquire()
+        lock1.release()
+        self.assertTrue(lock2.is_locked())
+        lock2.release()
+
+    def test_racing_acquirers(self):
+        for _ in range(20):
+            lock = FsLock(self.directory, "testuser", leaseTimeout=10)
+            with open(lock.filename, 'w') as f:
+                f.write('{}')
+            old = time.time() - 60
+            os.utime(lock.filename, (old, old))
+
+            # All the sessions find the stale lock, only one of them gets it
+            barrier = threading.Barrier(4)
+            winners = []
+
+            def acquire():
+                contender = FsLock(self.directory, "testuser", leaseTimeout=10)
+                barrier.wait()
+                try:
+                    contender.acquire()
+                except Exception:
+                    return
+                winners.append(contender)
+
+            threads = [threading.Thread(target=acquire) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(winners), 1)
+            self.assertTrue(winners[0].is_locked())
+            winners[0].release()
+            self.assertEqual(os.listdir(self.directory), [])
+
+    def test_legacy_unlocked_file(self):
+        with open(os.path.join(self.directory, '.testuser_lock.txt'), 'w') as f:
+            f.write('unlocked')
+        lock = FsLock(self.directory, "testuser")
+        self.assertFalse(lock.is_locked())
+        lock.acquire()
+        self.assertTrue(lock.is_locked())
+        lock.release()
+
+    def test_heartbeat_refreshes_lease(self):
+        lock = FsLock(self.directory, "testuser", leaseTimeout=0.3)
+        lock.acquire()
+        time.sleep(0.6)
+        self.assertTrue(lock.is_locked())
+        lock.release()
+
+    def test_locked_users(self):
+        locks = [FsLock(self.directory, user) for user in ["user1", "user2"]]
+        for lock in locks:
+            lock.acquire()
+        with open(os.path.join(self.directory, '.user3_lock.txt'), 'w') as f:
+            f.write('unlocked')
+
+        self.assertEqual(FsLock.locked_users(self.directory), {"user1", "user2"})
+
+        for lock in locks:
+            lock.release()
+        self.assertEqual(FsLock.locked_users(self.directory), set())
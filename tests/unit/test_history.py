@@ -0,0 +1,74 @@
+import unittest
+
+import os
+import json
+import tempfile
+
+from simplabel.history import LabelHistory, materialize, parse_time
+
+class Test_LabelHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_state_at(self):
+        history = LabelHistory(self.directory, 'alice')
+        history.start({'a.jpg': 'Cat'}, timestamp=100)
+        history.record('b.jpg', None, 'Dog', timestamp=110)
+        history.record('a.jpg', 'Cat', 'Dog', timestamp=120)
+        history.record('b.jpg', 'Dog', None, action='invalidate', timestamp=130)
+        history.record(None, None, 'Bird', action='add_label', timestamp=135)
+        history.flush()
+
+        history = LabelHistory(self.directory, 'alice')
+        self.assertEqual(history.state_at(50), {})
+        self.assertEqual(history.state_at(105), {'a.jpg': 'Cat'})
+        self.assertEqual(history.state_at(115), {'a.jpg': 'Cat', 'b.jpg': 'Dog'})
+        self.assertEqual(history.state_at(125), {'a.jpg': 'Dog', 'b.jpg': 'Dog'})
+        self.assertEqual(history.state_at(), {'a.jpg': 'Dog'})
+        self.assertEqual([e['action'] for e in history.events()], ['classify', 'classify', 'invalidate', 'add_label'])
+
+    def test_unchanged_labels_not_logged(self):
+        history = LabelHistory(self.directory, 'alice')
+        history.record('a.jpg', 'Cat', 'Cat')
+        self.assertEqual(history.buffer, [])
+
+    def test_compaction(self):
+        history = LabelHistory(self.directory, 'alice', segmentEvents=3)
+        history.start({}, timestamp=0)
+        for t in range(1, 11):
+            history.record('img{}.jpg'.format(t % 4), None, 'L{}'.format(t), timestamp=t)
+        history.flush()
+
+        self.assertEqual(len(history.index['segments']), 4)
+        self.assertEqual([count for (_, _, count) in history.index['segments']], [3, 3, 3, 1])
+        files = os.listdir(history.userDir)
+        self.assertEqual(len([f for f in files if f.endswith('.jsonl.gz')]), 3)
+
+        # Every point in time matches a full replay
+        for t in range(0, 12):
+            expected = {}
+            for u in range(1, min(t, 10) + 1):
+                expected['img{}.jpg'.format(u % 4)] = 'L{}'.format(u)
+            self.assertEqual(LabelHistory(self.directory, 'alice').state_at(t), expected)
+        self.assertEqual(len(list(history.events())), 10)
+
+    def test_materialize(self):
+        history = LabelHistory(self.directory, 'bob')
+        history.start({}, timestamp=parse_time('2024-05-01'))
+        history.record('a.jpg', None, 'Cat', timestamp=parse_time('2024-05-02 12:00'))
+        history.flush()
+
+        output = os.path.join(self.directory, 'out.json')
+        materialize(self.directory, 'bob', at='2024-05-03', output=output)
+        with open(output, 'r') as f:
+            self.assertEqual(json.load(f), {'a.jpg': 'Cat'})
+        self.assertEqual(materialize(self.directory, 'bob', at='2024-05-01 06:00'), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+import os
+import json
+import tempfile
+
+from simplabel.labelsets import LabelSpace, ancestors
+from simplabel.flow_to_directory import flow_to_dict, export_json
+
+class Test_LabelSpace(unittest.TestCase):
+
+    def setUp(self):
+        self.categories = ["Animal", "Animal/cat", "Animal/dog", "Outdoor", "Animal/cat/kitten"]
+        self.space = LabelSpace(self.categories)
+
+    def test_ancestors(self):
+        self.assertEqual(ancestors("Animal/cat/kitten"), ["Animal/cat", "Animal"])
+        self.assertEqual(ancestors("Animal"), [])
+
+    def test_encode_includes_ancestors(self):
+        mask = self.space.encode(["Animal/cat/kitten", "Outdoor"])
+        self.assertEqual(self.space.decode(mask), ["Animal", "Animal/cat", "Outdoor", "Animal/cat/kitten"])
+        self.assertEqual(self.space.leaves(mask), ["Outdoor", "Animal/cat/kitten"])
+
+    def test_toggle_removes_descendants(self):
+        mask = self.space.toggle(0, "Animal/cat/kitten")
+        mask = self.space.toggle(mask, "Animal/dog")
+        mask = self.space.toggle(mask, "Animal/cat")
+        self.assertEqual(self.space.decode(mask), ["Animal", "Animal/dog"])
+
+    def test_as_mask_converts_single_labels(self):
+        self.assertEqual(self.space.as_mask("Animal/dog"), self.space.encode(["Animal/dog"]))
+        self.assertEqual(self.space.as_mask(5), 5)
+        self.assertEqual(self.space.as_mask(None), 0)
+
+    def test_agreement(self):
+        cat = self.space.encode(["Animal/cat"])
+        dog = self.space.encode(["Animal/dog"])
+        agreement = self.space.agreement({"a.jpg": [cat, cat], "b.jpg": [cat, dog, cat], "c.jpg": [dog]})
+        self.assertEqual(agreement["a.jpg"], (cat, cat))
+        self.assertEqual(agreement["b.jpg"], (self.space.encode(["Animal"]), cat | dog))
+        self.assertEqual(agreement["c.jpg"], (dog, dog))
+
+    def test_drop_bit(self):
+        self.assertEqual(LabelSpace.drop_bit(0b1011, 1), 0b101)
+        self.assertEqual(LabelSpace.drop_bit(0b1011, 0), 0b101)
+        self.assertEqual(LabelSpace.drop_bit(0b1011, 2), 0b111)
+
+
+class Test_MultiLabelExport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+        for name in ("a.jpg", "b.jpg"):
+            with open(os.path.join(self.directory, name), 'wb') as f:
+                f.write(b'jpg')
+        categories = ["Animal", "Animal/cat", "Outdoor"]
+        space = LabelSpace(categories)
+        with open(os.path.join(self.directory, '.labels.json'), 'w') as f:
+            json.dump(categories, f)
+        with open(os.path.join(self.directory, 'labeled_master.json'), 'w') as f:
+            json.dump({"a.jpg": space.encode(["Animal/cat", "Outdoor"]), "b.jpg": space.encode(["Animal"])}, f)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_flow_to_nested_directories(self):
+        outDir = os.path.join(self.directory, 'out')
+        flow_to_dict(self.directory, outDir)
+        self.assertTrue(os.path.isfile(os.path.join(outDir, 'Animal', 'cat', 'a.jpg')))
+        self.assertTrue(os.path.isfile(os.path.join(outDir, 'Outdoor', 'a.jpg')))
+        self.assertTrue(os.path.isfile(os.path.join(outDir, 'Animal', 'b.jpg')))
+        self.assertFalse(os.path.exists(os.path.join(outDir, 'Animal', 'a.jpg')))
+
+    def test_export_json(self):
+        path = os.path.join(self.directory, 'export.json')
+        export_json(self.directory, path)
+        with open(path) as f:
+            exported = json.load(f)
+        self.assertEqual(exported, {"a.jpg": ["Animal", "Animal/cat", "Outdoor"], "b.jpg": ["Animal"]})
+
+if __name__ == '__main__':
+    unittest.main()
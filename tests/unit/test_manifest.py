@@ -0,0 +1,83 @@
+import unittest
+
+import os
+import csv
+import json
+import tempfile
+from collections import Counter
+
+from simplabel.manifest import StratifiedSplitter, export_manifest, iter_records
+
+class Test_StratifiedSplitter(unittest.TestCase):
+
+    def test_deterministic(self):
+        def splits(seed):
+            splitter = StratifiedSplitter(seed=seed)
+            return [splitter.assign("img{}.jpg".format(i), 'A') for i in range(50)]
+        self.assertEqual(splits(1), splits(1))
+        self.assertNotEqual(splits(1), splits(2))
+
+    def test_stratified(self):
+        splitter = StratifiedSplitter((0.8, 0.1, 0.1), seed=3)
+        counts = {'A': Counter(), 'B': Counter()}
+        for i in range(1000):
+            label = 'A' if i % 10 else 'B'
+            counts[label][splitter.assign("img{}.jpg".format(i), label)] += 1
+        self.assertEqual(sorted(counts['A'].values()), [90, 90, 720])
+        self.assertEqual(sorted(counts['B'].values()), [10, 10, 80])
+
+    def test_groups(self):
+        splitter = StratifiedSplitter(seed=0)
+        splits = set(splitter.assign_group('dir1', "dir1/img{}.jpg".format(i), 'A') for i in range(20))
+        self.assertEqual(len(splits), 1)
+
+
+class Test_ExportManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+        with open(os.path.join(self.directory, 'labeled_alice.json'), 'w') as f:
+            json.dump({"a.jpg": "Cat", "b.jpg": "Dog", "c.jpg": "Cat"}, f)
+        with open(os.path.join(self.directory, 'labeled_bob.json'), 'w') as f:
+            json.dump({"a.jpg": "Cat", "b.jpg": "Cat", "d.jpg": "Dog"}, f)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_majority_records(self):
+        records = {record['path']: record for record in iter_records(self.directory)}
+        self.assertEqual(sorted(records), ["a.jpg", "b.jpg", "c.jpg", "d.jpg"])
+        self.assertEqual(records["a.jpg"]['labelers'], ["alice", "bob"])
+        self.assertEqual(records["a.jpg"]['agreement'], 1.0)
+        self.assertEqual(records["b.jpg"]['agreement'], 0.5)
+
+    def test_master_is_preferred(self):
+        with open(os.path.join(self.directory, 'labeled_master.json'), 'w') as f:
+            json.dump({"b.jpg": "Dog"}, f)
+        records = list(iter_records(self.directory))
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['label'], "Dog")
+
+    def test_csv(self):
+        path = os.path.join(self.directory, 'manifest.csv')
+        counts = export_manifest(self.directory, path, user='alice', splits=(0.5, 0.5))
+        with open(path) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(set(rows[0]), {'path', 'label', 'labelers', 'agreement', 'split'})
+        self.assertEqual(sum(counts.values()), 3)
+
+    def test_jsonl_multi_label(self):
+        with open(os.path.join(self.directory, '.labels.json'), 'w') as f:
+            json.dump(["Cat", "Dog"], f)
+        with open(os.path.join(self.directory, 'labeled_master.json'), 'w') as f:
+            json.dump({"a.jpg": 3}, f)
+        path = os.path.join(self.directory, 'manifest.jsonl')
+        export_manifest(self.directory, path, splits=[])
+        with open(path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(records, [{'path': "a.jpg", 'label': ["Cat", "Dog"], 'labelers': ["alice", "bob"], 'agreement': 0.0}])
+
+if __name__ == '__main__':
+    unittest.main()
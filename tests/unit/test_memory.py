@@ -0,0 +1,68 @@
+import unittest
+
+from simplabel.memory import MemoryGovernor, current_rss
+from simplabel.sources import HttpSource
+
+class Consumer(object):
+
+    def __init__(self, held, releasable=True):
+        self.held = held
+        self.releasable = releasable
+
+    def memory_usage(self):
+        return self.held
+
+    def release(self, nbytes):
+        if not self.releasable:
+            return 0
+        freed = min(self.held, nbytes)
+        self.held -= freed
+        return freed
+
+class Test_MemoryGovernor(unittest.TestCase):
+
+    def test_enforce_in_order(self):
+        governor = MemoryGovernor(100)
+        display = Consumer(40, releasable=False)
+        prefetch = Consumer(50)
+        cache = Consumer(60)
+        governor.register('prefetch', prefetch)
+        governor.register('cache', cache)
+        governor.register('display', display)
+        governor.register('cache', cache)
+
+        self.assertEqual(governor.enforce(), 100)
+        self.assertEqual((prefetch.held, cache.held, display.held), (0, 60, 40))
+        self.assertEqual(governor.usage(), {'prefetch': 0, 'cache': 60, 'display': 40})
+
+        cache.held = 200
+        self.assertEqual(governor.enforce(), 100)
+        self.assertEqual(cache.held, 60)
+
+    def test_disabled_and_unregister(self):
+        governor = MemoryGovernor(0)
+        consumer = Consumer(1000)
+        governor.register('cache', consumer)
+        self.assertEqual(governor.enforce(), 1000)
+        governor.unregister(consumer)
+        self.assertEqual(governor.usage(), {})
+        self.assertIn('RSS', governor.report())
+
+    def test_http_source_release(self):
+        source = HttpSource('http://localhost:1/images')
+        for idx in range(4):
+            source.cache['{}.jpg'.format(idx)] = bytes(100)
+            source.cacheSize += 100
+        self.assertEqual(source.memory_usage(), 400)
+        self.assertEqual(source.release(150), 200)
+        self.assertEqual(list(source.cache), ['2.jpg', '3.jpg'])
+        self.assertEqual(source.memory_usage(), 200)
+        source.close()
+
+    def test_current_rss(self):
+        rss = current_rss()
+        self.assertTrue(rss is None or rss > 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+from unittest import mock
+
+import os
+import json
+import time
+import tempfile
+
+from simplabel.metrics import SessionMetrics, aggregate, metrics_path, percentile
+
+class Test_SessionMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+        self.now = 1714557600.0
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def clock(self):
+        return self.now
+
+    def read(self, user):
+        with open(metrics_path(self.directory, user), 'r') as f:
+            return [json.loads(line) for line in f]
+
+    def test_events(self):
+        with mock.patch('simplabel.metrics.time.time', self.clock):
+            metrics = SessionMetrics(self.directory, 'alice', flushEvery=1000)
+            metrics.shown('a.jpg')
+            self.now += 2
+            metrics.classified('a.jpg', 'Cat')
+            metrics.shown('b.jpg')
+            self.now += 5
+            metrics.shown('c.jpg')
+            metrics.shown('c.jpg')
+            self.now += 1
+            metrics.classified('c.jpg', 'Dog')
+            self.assertFalse(os.path.isfile(metrics_path(self.directory, 'alice')))
+            metrics.close()
+
+        events = self.read('alice')
+        self.assertEqual([e['event'] for e in events], ['start', 'classify', 'navigate', 'classify', 'end'])
+        self.assertEqual([e['dwell'] for e in events[1:4]], [2, 5, 1])
+        self.assertEqual(events[2]['img'], 'b.jpg')
+
+    def test_flush_in_batches(self):
+        metrics = SessionMetrics(self.directory, 'bob', flushEvery=3)
+        metrics.shown('a.jpg')
+        metrics.classified('a.jpg', 'Cat')
+        self.assertEqual(len(metrics.buffer), 2)
+        metrics.classified('a.jpg', 'Dog')
+        self.assertEqual(metrics.buffer, [])
+        self.assertEqual(len(self.read('bob')), 3)
+
+    def test_aggregate(self):
+        with mock.patch('simplabel.metrics.time.time', self.clock):
+            metrics = SessionMetrics(self.directory, 'alice')
+            for (idx, wait) in enumerate([10, 20, 30, 600, 10]):
+                metrics.shown('{}.jpg'.format(idx))
+                self.now += wait
+                metrics.classified('{}.jpg'.format(idx), 'Cat')
+            metrics.shown('skipped.jpg')
+            self.now += 10
+            metrics.close()
+
+        report = aggregate(self.directory, idleGap=120)
+        day = time.strftime('%Y-%m-%d', time.localtime(self.now))
+        stats = report[('alice', day)]
+        self.assertEqual(stats['labels'], 5)
+        self.assertEqual(stats['skipped'], 1)
+        self.assertEqual(stats['sessions'], 1)
+        self.assertEqual(stats['idle_min'], 10.0)
+        self.assertEqual(stats['active_min'], 1.3)
+        self.assertEqual(stats['labels_per_min'], round(5 / (80 / 60), 2))
+        self.assertEqual(stats['dwell_median'], 20)
+        self.assertEqual(aggregate(self.directory, users=['bob']), {})
+
+    def test_percentile(self):
+        self.assertIsNone(percentile([], 50))
+        self.assertEqual(percentile(list(range(101)), 90), 90)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+
+from simplabel.palette import LabelIndex, NumberEntry
+
+class FakeWidget(object):
+    '''Stand-in for a Tk widget, the pending after() callback is run by timeout()'''
+
+    def __init__(self):
+        self.job = None
+
+    def after(self, delay, callback):
+        self.job = callback
+        return 1
+
+    def after_cancel(self, job):
+        self.job = None
+
+    def timeout(self):
+        (job, self.job) = (self.job, None)
+        job()
+
+class Test_LabelIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.labels = ["Cat", "Dog", "Hot dog", "Catfish", "Black cat", "Chair"]
+        self.index = LabelIndex(self.labels)
+
+    def test_empty_query_returns_all(self):
+        self.assertEqual(self.index.search(''), list(range(len(self.labels))))
+
+    def test_prefix_ranked_first(self):
+        matches = self.index.search('cat')
+        self.assertEqual(matches[:2], [0, 3])
+        self.assertEqual(matches[2], 4)
+
+    def test_word_prefix(self):
+        self.assertEqual(self.index.search('dog'), [1, 2])
+
+    def test_fuzzy(self):
+        self.assertEqual(self.index.search('chr'), [5])
+        self.assertEqual(self.index.search('xyz'), [])
+
+    def test_incremental(self):
+        self.index.search('c')
+        self.assertEqual(self.index.search('ca'), [0, 3, 4, 5])
+        # A query that does not extend the previous one searches all labels again
+        self.assertEqual(self.index.search('do'), [1, 2])
+
+class Test_NumberEntry(unittest.TestCase):
+
+    def setUp(self):
+        self.widget = FakeWidget()
+        self.count = 12
+        self.applied = []
+        self.entry = NumberEntry(self.widget, lambda: self.count, self.applied.append)
+
+    def test_applied_when_complete(self):
+        # No label number starts with 2 or 11 but these labels
+        self.entry.key('2')
+        self.entry.key('1')
+        self.entry.key('1')
+        self.assertEqual(self.applied, [1, 10])
+        self.assertIsNone(self.widget.job)
+        # 0 does not start any label number
+        self.entry.key('0')
+        self.assertEqual(self.applied, [1, 10])
+        self.assertEqual(self.entry.buffer, '')
+
+    def test_applied_after_timeout(self):
+        self.entry.key('1')
+        self.assertEqual(self.applied, [])
+        self.widget.timeout()
+        self.assertEqual(self.applied, [0])
+        self.entry.key('1')
+        self.entry.key('3')
+        self.assertEqual(self.applied, [0])
+        self.assertIsNone(self.widget.job)
+
+    def test_labels_added(self):
+        self.count = 9
+        self.entry.key('1')
+        self.assertEqual(self.applied, [0])
+        self.count = 20
+        self.entry.key('2')
+        self.entry.key('0')
+        self.assertEqual(self.applied, [0, 19])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+
+import os
+import json
+import tempfile
+from unittest import mock
+
+from simplabel.predictions import iter_predictions, import_predictions
+from simplabel.store import LabelStore
+from simplabel.fslock import FsLock
+from simplabel.flow_to_directory import load_labels
+
+class Test_Predictions(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+        with open(os.path.join(self.directory, '.labels.json'), 'w') as f:
+            json.dump(['Cat', 'Dog'], f)
+        with open(os.path.join(self.directory, 'labeled_alice.json'), 'w') as f:
+            json.dump({'a.jpg': 'Cat'}, f)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def read_model(self):
+        with open(os.path.join(self.directory, 'labeled_model.json'), 'r') as f:
+            return json.load(f)
+
+    def test_iter_csv(self):
+        path = self.write('header.csv', "score,image,class\n0.9,a.jpg,cat\n0.2,b.jpg,dog\n")
+        self.assertEqual(list(iter_predictions(path)), [('a.jpg', 'cat', 0.9), ('b.jpg', 'dog', 0.2)])
+        path = self.write('positional.csv', "a.jpg,cat,0.9\nb.jpg,dog\n")
+        self.assertEqual(list(iter_predictions(path)), [('a.jpg', 'cat', 0.9), ('b.jpg', 'dog', 1.0)])
+
+    def test_iter_jsonl(self):
+        path = self.write('preds.jsonl', '{"path": "a.jpg", "label": "Cat", "confidence": 0.5}\n\n'
+                                         '{"image": "b.jpg", "class": "Dog"}\n')
+        self.assertEqual(list(iter_predictions(path)), [('a.jpg', 'Cat', 0.5), ('b.jpg', 'Dog', 1.0)])
+
+    def test_import(self):
+        path = self.write('preds.csv', "path,label,confidence\n"
+                                       "a.jpg,dog,0.8\n"
+                                       "b.jpg,cat,0.3\n"
+                                       "c.jpg,cat,0.6\n"
+                                       "c.jpg,dog,0.9\n"
+                                       "c.jpg,cat,0.7\n"
+                                       "{},bird,0.9\n".format(os.path.join(self.directory, 'd.jpg')))
+        counts = import_predictions(self.directory, path, threshold=0.5)
+        self.assertEqual(counts, {'read': 6, 'imported': 3, 'below_threshold': 1, 'unknown_label': 1})
+        self.assertEqual(self.read_model(), {'a.jpg': 'Dog', 'c.jpg': 'Dog'})
+
+        counts = import_predictions(self.directory, path, threshold=0.5, addLabels=True)
+        self.assertEqual(counts['imported'], 4)
+        self.assertEqual(self.read_model()['d.jpg'], 'Bird')
+
+    def test_model_is_not_a_labeler(self):
+        path = self.write('preds.csv', "a.jpg,dog\nb.jpg,cat\n")
+        import_predictions(self.directory, path)
+        store = LabelStore(self.directory)
+        self.assertEqual(store.get('model', 'a.jpg'), 'Dog')
+        self.assertEqual(store.conflicts(), [])
+        self.assertEqual(store.sort(['a.jpg', 'b.jpg']), (['a.jpg'], [], ['b.jpg']))
+        self.assertEqual(store.users(), ['alice'])
+
+        # Only the labelers are offered when flowing without master labels
+        with mock.patch('builtins.input', return_value='alice') as prompt:
+            self.assertEqual(load_labels(self.directory), {'a.jpg': ['Cat']})
+        self.assertNotIn('model', prompt.call_args[0][0])
+
+    def test_concurrent_import_refused(self):
+        path = self.write('preds.csv', "a.jpg,dog\n")
+        lock = FsLock(self.directory, 'model')
+        lock.acquire()
+        try:
+            with self.assertRaises(RuntimeError):
+                import_predictions(self.directory, path)
+        finally:
+            lock.release()
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'labeled_model.json')))
+
+        import_predictions(self.directory, path)
+        self.assertEqual(self.read_model(), {'a.jpg': 'Dog'})
+        self.assertFalse(lock.is_locked())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+import os
+import json
+import tempfile
+
+from simplabel.priority import ImagePrioritizer
+
+class Test_ImagePrioritizer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.images = ["a.jpg", "b.jpg", "c.jpg", "d.jpg"]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_order_from_json(self):
+        path = os.path.join(self.tmpdir.name, 'scores.json')
+        with open(path, 'w') as f:
+            json.dump({"a.jpg": 0.1, "c.jpg": 0.9, "d.jpg": 0.5}, f)
+        prioritizer = ImagePrioritizer(path)
+        self.assertEqual(prioritizer.order(self.images), ["c.jpg", "d.jpg", "a.jpg", "b.jpg"])
+
+    def test_order_from_csv(self):
+        path = os.path.join(self.tmpdir.name, 'scores.csv')
+        with open(path, 'w') as f:
+            f.write("path,score\nb.jpg,2\na.jpg,1\n")
+        prioritizer = ImagePrioritizer(path)
+        self.assertEqual(prioritizer.order(self.images), ["b.jpg", "a.jpg", "c.jpg", "d.jpg"])
+
+    def test_file_change_is_picked_up(self):
+        path = os.path.join(self.tmpdir.name, 'scores.json')
+        with open(path, 'w') as f:
+            json.dump({"a.jpg": 1}, f)
+        prioritizer = ImagePrioritizer(path)
+        self.assertEqual(prioritizer.order(self.images)[0], "a.jpg")
+
+        with open(path, 'w') as f:
+            json.dump({"d.jpg": 1}, f)
+        os.utime(path, (0, 1))
+        self.assertEqual(prioritizer.order(self.images)[0], "d.jpg")
+
+    def test_callable_is_batched_and_cached(self):
+        calls = []
+        def score(batch):
+            calls.append(list(batch))
+            return [len(img) + ord(img[0]) for img in batch]
+
+        prioritizer = ImagePrioritizer(score, batchSize=3)
+        self.assertEqual(prioritizer.order(self.images), ["d.jpg", "c.jpg", "b.jpg", "a.jpg"])
+        self.assertEqual([len(batch) for batch in calls], [3, 1])
+
+        prioritizer.order(self.images)
+        self.assertEqual(len(calls), 2)
+
+        # Outdated scores are computed apart from the cached ones, then replace them
+        scores = prioritizer.score(["a.jpg", "b.jpg"])
+        self.assertEqual(calls[-1], ["a.jpg", "b.jpg"])
+        self.assertEqual(prioritizer.scores["a.jpg"], scores["a.jpg"])
+        prioritizer.update({"a.jpg": 1000})
+        self.assertEqual(prioritizer.order(self.images)[0], "a.jpg")
+        self.assertEqual(len(calls), 3)
@@ -0,0 +1,103 @@
+import unittest
+
+import os
+import csv
+import json
+import tarfile
+import tempfile
+
+from PIL import Image
+
+from simplabel.project import Project
+from simplabel.flow_to_directory import flow_to_dict
+from simplabel.manifest import export_manifest
+from simplabel.shards import export_shards
+from simplabel.sources import ProjectSource, get_source
+from simplabel.store import LabelStore
+
+class Test_Project(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+        for (root, names) in (('disk1/images', ['a.png', 'b.png']), ('disk2/images', ['a.png']), ('disk3/sub', ['c.png'])):
+            os.makedirs(os.path.join(self.directory, root))
+            for (i, name) in enumerate(names):
+                Image.new('RGB', (32, 24), (50*i, 0, 0)).save(os.path.join(self.directory, root, name))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_project(self, config):
+        path = os.path.join(self.directory, 'project.json')
+        with open(path, 'w') as f:
+            json.dump(config, f)
+        return path
+
+    def test_named_roots(self):
+        path = self.write_project({'roots': {'one': 'disk1/images', 'two': os.path.join(self.directory, 'disk2/images')},
+                                   'labels': 'labels'})
+        project = Project(path)
+        self.assertEqual(project.roots, {'one': os.path.join(self.directory, 'disk1', 'images'),
+                                         'two': os.path.join(self.directory, 'disk2', 'images')})
+        self.assertEqual(project.folder, os.path.join(self.directory, 'labels'))
+        self.assertTrue(os.path.isdir(project.folder))
+        self.assertEqual(project.image_path('two/a.png'), os.path.join(self.directory, 'disk2', 'images', 'a.png'))
+
+    def test_listed_roots(self):
+        project = Project(self.write_project({'roots': ['disk1/images', 'disk2/images/']}))
+        self.assertEqual(list(project.roots), ['images', 'images_2'])
+        self.assertEqual(project.folder, self.directory)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            Project(self.write_project({'roots': []}))
+        with self.assertRaises(ValueError):
+            Project(self.write_project({'roots': {'a/b': 'disk1'}}))
+
+    def test_source(self):
+        path = self.write_project({'roots': {'one': 'disk1/images', 'two': 'disk2/images', 'three': 'disk3',
+                                             'offline': 'missing'}})
+        source = get_source(path)
+        self.assertIsInstance(source, ProjectSource)
+        images = source.list_images(['png'])
+        self.assertEqual(sorted(images), ['one/a.png', 'one/b.png', 'three/sub/c.png', 'two/a.png'])
+        self.assertEqual(source.open('one/b.png').size, (32, 24))
+        self.assertEqual(source.open('two/a.png', (16, 16)).size, (16, 12))
+
+        # Images with the same relative path in different roots are labeled separately, in one place
+        store = LabelStore(source.folder, ['cat', 'dog'])
+        store.update('alice', {'one/a.png': 'Cat', 'two/a.png': 'Dog'})
+        store.flush()
+        with open(os.path.join(self.directory, 'labeled_alice.json'), 'r') as f:
+            self.assertEqual(json.load(f), {'one/a.png': 'Cat', 'two/a.png': 'Dog'})
+
+    def test_exports(self):
+        project = Project(self.write_project({'roots': {'one': 'disk1/images', 'two': 'disk2/images'},
+                                              'labels': 'labels'}))
+        # one/a.png and two/a.png have the same content
+        labels = {'one/a.png': 'Cat', 'one/b.png': 'Dog', 'two/a.png': 'Cat'}
+        with open(os.path.join(project.folder, 'labeled_master.json'), 'w') as f:
+            json.dump(labels, f)
+
+        outDir = os.path.join(self.directory, 'flowed')
+        flow_to_dict(project.folder, outDir, dedupe=True, project=project)
+        self.assertEqual(sorted(os.listdir(os.path.join(outDir, 'Cat'))), ['a.png'])
+        self.assertEqual(sorted(os.listdir(os.path.join(outDir, 'Dog'))), ['b.png'])
+
+        manifest = os.path.join(self.directory, 'manifest.csv')
+        export_manifest(project.folder, manifest, splits=[], project=project)
+        with open(manifest, 'r', newline='') as f:
+            paths = sorted(row['path'] for row in csv.DictReader(f))
+        self.assertEqual(paths, sorted(project.image_path(img) for img in labels))
+        self.assertTrue(all(os.path.isfile(path) for path in paths))
+
+        index = export_shards(project.folder, os.path.join(self.directory, 'shards'), splits=[], workers=1,
+                              project=project)
+        self.assertEqual(index['samples'], 3)
+        with tarfile.open(os.path.join(self.directory, 'shards', index['shards'][0]['name'])) as tar:
+            self.assertEqual(len([name for name in tar.getnames() if name.endswith('.png')]), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+
+from simplabel.render import WidgetStyler
+
+class FakeWidget(object):
+    '''Stand-in for a Tk widget recording the options sent by config()'''
+
+    def __init__(self):
+        self.calls = []
+
+    def config(self, **options):
+        self.calls.append(options)
+
+class Test_WidgetStyler(unittest.TestCase):
+
+    def setUp(self):
+        self.styler = WidgetStyler()
+        self.widget = FakeWidget()
+
+    def test_unchanged_options_skipped(self):
+        self.assertTrue(self.styler.apply(self.widget, bg='red', state='normal'))
+        self.assertFalse(self.styler.apply(self.widget, bg='red', state='normal'))
+        self.assertTrue(self.styler.apply(self.widget, bg='blue', state='normal'))
+        self.assertFalse(self.styler.apply(self.widget, state='normal'))
+        self.assertEqual(self.widget.calls, [{'bg': 'red', 'state': 'normal'}, {'bg': 'blue'}])
+
+    def test_widgets_are_independent(self):
+        other = FakeWidget()
+        self.styler.apply(self.widget, bg='red')
+        self.styler.apply(other, bg='red')
+        self.assertEqual(other.calls, [{'bg': 'red'}])
+
+    def test_forgotten_widgets_are_reset(self):
+        other = FakeWidget()
+        self.styler.apply(self.widget, bg='red', state='normal')
+        self.styler.apply(other, bg='red')
+
+        # A recreated widget gets all its options again
+        self.styler.forget(self.widget)
+        self.assertTrue(self.styler.apply(self.widget, bg='red', state='normal'))
+        self.assertEqual(self.widget.calls[-1], {'bg': 'red', 'state': 'normal'})
+        self.assertFalse(self.styler.apply(other, bg='red'))
+
+        self.styler.forget()
+        self.assertTrue(self.styler.apply(other, bg='red'))
+        self.assertEqual(other.calls, [{'bg': 'red'}, {'bg': 'red'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+
+import os
+import time
+import tempfile
+
+from simplabel.scheduler import WorkScheduler
+
+class Test_WorkScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+        self.images = ["img{}.jpg".format(i) for i in range(10)]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_batches_are_disjoint(self):
+        scheduler = WorkScheduler(self.directory, batchSize=4)
+        batch1 = scheduler.lease("user1", self.images)
+        batch2 = scheduler.lease("user2", self.images)
+        self.assertEqual(len(batch1), 4)
+        self.assertEqual(len(batch2), 4)
+        self.assertFalse(set(batch1) & set(batch2))
+        self.assertEqual(scheduler.leased_by_others("user2"), set(batch1))
+
+    def test_lease_is_renewed(self):
+        scheduler = WorkScheduler(self.directory, batchSize=4)
+        batch1 = scheduler.lease("user1", self.images)
+        self.assertEqual(scheduler.lease("user1", self.images), batch1)
+
+    def test_labeled_images_are_replaced(self):
+        scheduler = WorkScheduler(self.directory, batchSize=4)
+        batch1 = scheduler.lease("user1", self.images)
+        remaining = [img for img in self.images if img not in batch1[:2]]
+        batch2 = scheduler.lease("user1", remaining)
+        self.assertEqual(len(batch2), 4)
+        self.assertTrue(set(batch1[2:]) <= set(batch2))
+
+    def test_redundancy(self):
+        scheduler = WorkScheduler(self.directory, batchSize=4, redundancy=2)
+        batch1 = scheduler.lease("user1", self.images)
+        batch2 = scheduler.lease("user2", self.images)
+        batch3 = scheduler.lease("user3", self.images)
+        self.assertEqual(batch1, batch2)
+        self.assertFalse(set(batch1) & set(batch3))
+
+    def test_label_counts_reduce_capacity(self):
+        scheduler = WorkScheduler(self.directory, batchSize=4, redundancy=2)
+        labelCounts = {img: 2 for img in self.images[:5]}
+        batch = scheduler.lease("user1", self.images, labelCounts)
+        self.assertFalse(set(batch) & set(self.images[:5]))
+
+    def test_expired_leases_are_reclaimed(self):
+        scheduler = WorkScheduler(self.directory, batchSize=4, leaseDuration=0.1)
+        batch1 = scheduler.lease("user1", self.images)
+        time.sleep(0.2)
+        batch2 = scheduler.lease("user2", self.images)
+        self.assertEqual(batch1, batch2)
+
+    def test_release(self):
+        scheduler = WorkScheduler(self.directory, batchSize=4)
+        batch1 = scheduler.lease("user1", self.images)
+        scheduler.release("user1")
+        self.assertEqual(scheduler.leased_by_others("user2"), set())
+        self.assertEqual(scheduler.lease("user2", self.images), batch1)
@@ -0,0 +1,173 @@
+import unittest
+
+import io
+import os
+import json
+import asyncio
+import time
+import tempfile
+
+from PIL import Image
+
+from simplabel.server import LabelState, LabelServer
+
+class Test_LabelState(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+        for i in range(6):
+            Image.new('RGB', (64, 48), (i*40, 0, 0)).save(os.path.join(self.directory, 'img{}.jpg'.format(i)))
+        with open(os.path.join(self.directory, 'labeled_tkuser.json'), 'w') as f:
+            json.dump({'img0.jpg': 'Cat'}, f)
+        self.state = LabelState(self.directory, ['cat', 'dog'])
+
+    def tearDown(self):
+        self.state.close()
+        self.tmpdir.cleanup()
+
+    def test_categories_saved(self):
+        with open(os.path.join(self.directory, '.labels.json')) as f:
+            self.assertEqual(json.load(f), ['Cat', 'Dog'])
+
+    def test_users_get_distinct_images(self):
+        alice = self.state.join('Alice')
+        bob = self.state.join('bob')
+        first = self.state.next_images(alice, 3)
+        second = self.state.next_images(bob, 3)
+        self.assertNotIn('img0.jpg', first + second)
+        self.assertEqual(len(set(first) | set(second)), 5)
+
+    def test_user_locked_elsewhere(self):
+        self.state.join('alice')
+        other = LabelState(self.directory)
+        with self.assertRaises(Exception):
+            other.join('alice')
+
+    def test_batched_writes(self):
+        alice = self.state.join('alice')
+        self.state.classify(alice, 'img1.jpg', 'Dog')
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'labeled_alice.json')))
+        self.state.flush()
+        with open(os.path.join(self.directory, 'labeled_alice.json')) as f:
+            self.assertEqual(json.load(f), {'img1.jpg': 'Dog'})
+        with self.assertRaises(ValueError):
+            self.state.classify(alice, 'img2.jpg', 'Bird')
+
+    def test_release_idle(self):
+        alice = self.state.join('alice')
+        bob = self.state.join('bob')
+        self.state.classify(alice, 'img1.jpg', 'Dog')
+        self.state.next_images(bob, 2)
+        now = time.time() + 60
+        # alice has unsaved labels
+        self.assertEqual(self.state.release_idle(30, now), ['bob'])
+        self.assertEqual(self.state.release_idle(120, now), [])
+        self.assertEqual(list(self.state.locks), ['alice'])
+        self.assertEqual(set(owner for (owner, _) in self.state.reserved.values()), set())
+
+        # bob can label elsewhere, then here again
+        other = LabelState(self.directory)
+        other.join('bob')
+        other.classify('bob', 'img2.jpg', 'Cat')
+        other.close()
+        self.state.reload()
+        self.assertEqual(self.state.labels_of('img2.jpg'), {'bob': 'Cat'})
+        self.assertEqual(self.state.join('bob'), 'bob')
+        self.assertEqual(self.state.get('bob', 'img2.jpg'), 'Cat')
+
+        self.state.flush()
+        self.assertEqual(sorted(self.state.release_idle(30, now)), ['alice', 'bob'])
+        self.assertEqual(self.state.locks, {})
+
+    def test_multi_label_rejected(self):
+        with open(os.path.join(self.directory, 'labeled_carol.json'), 'w') as f:
+            json.dump({'img1.jpg': 3}, f)
+        with self.assertRaises(ValueError):
+            LabelState(self.directory)
+
+
+class Test_LabelServer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+        for i in range(3):
+            Image.new('RGB', (640, 480)).save(os.path.join(self.directory, 'img{}.jpg'.format(i)))
+        self.state = LabelState(self.directory, ['cat', 'dog'])
+        self.server = LabelServer(self.state, cacheBudget=1024**2)
+
+    def tearDown(self):
+        self.state.close()
+        self.server.executor.shutdown()
+        self.tmpdir.cleanup()
+
+    def request(self, *requests):
+        '''Sends raw requests on a single connection and returns the raw responses'''
+        async def run():
+            server = await asyncio.start_server(self.server.handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            responses = []
+            for request in requests:
+                writer.write(request.encode('latin-1'))
+                await writer.drain()
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = int([line for line in head.split(b'\r\n') if line.lower().startswith(b'content-length')][0].split(b':')[1])
+                responses.append((head.decode('latin-1'), await reader.readexactly(length)))
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return responses
+        return asyncio.run(run())
+
+    def test_label_flow(self):
+        body = json.dumps({'user': 'alice', 'image': 'img1.jpg', 'label': 'Cat'})
+        responses = self.request(
+            "GET /api/next?user=alice&count=2&size=100x100 HTTP/1.1\r\nHost: x\r\n\r\n",
+            "POST /api/label HTTP/1.1\r\nHost: x\r\nContent-Length: {}\r\n\r\n{}".format(len(body), body),
+            "GET /api/state HTTP/1.1\r\nHost: x\r\n\r\n")
+        self.assertEqual(json.loads(responses[0][1])['images'], ['img0.jpg', 'img1.jpg'])
+        self.assertIn('200 OK', responses[1][0])
+        self.assertEqual(json.loads(responses[2][1])['labeled'], 1)
+
+    def test_image_cache_headers(self):
+        head, data = self.request("GET /image/img0.jpg?size=100x100 HTTP/1.1\r\nHost: x\r\n\r\n")[0]
+        self.assertIn('Content-Type: image/jpeg', head)
+        etag = [line.split(': ', 1)[1] for line in head.split('\r\n') if line.startswith('ETag')][0]
+        self.assertEqual(Image.open(io.BytesIO(data)).size, (100, 75))
+        head, data = self.request("GET /image/img0.jpg?size=100x100 HTTP/1.1\r\nIf-None-Match: {}\r\n\r\n".format(etag))[0]
+        self.assertIn('304', head)
+        head, _ = self.request("GET /image/../secret.jpg HTTP/1.1\r\n\r\n")[0]
+        self.assertIn('404', head)
+
+    def test_flush(self):
+        self.state.join('alice')
+        self.state.classify('alice', 'img1.jpg', 'Dog')
+        with open(os.path.join(self.directory, 'labeled_tkuser.json'), 'w') as f:
+            json.dump({'img0.jpg': 'Cat'}, f)
+        asyncio.run(self.server.flush())
+        with open(os.path.join(self.directory, 'labeled_alice.json')) as f:
+            self.assertEqual(json.load(f), {'img1.jpg': 'Dog'})
+        self.assertEqual(self.state.labels_of('img0.jpg'), {'tkuser': 'Cat'})
+        self.assertEqual(self.state.dirty, set())
+        self.assertEqual(list(self.state.locks), ['alice'])
+
+    def test_renders_shared(self):
+        calls = []
+        render = self.server.render
+        self.server.render = lambda img, size: calls.append(img) or render(img, size)
+
+        async def run():
+            first = self.server.prepare('img0.jpg', (100, 100))
+            second = self.server.prepare('img0.jpg', (100, 100))
+            self.assertIs(first, second)
+            return await asyncio.gather(first, second)
+
+        first, second = asyncio.run(run())
+        self.assertEqual(first, second)
+        self.assertEqual(calls, ['img0.jpg'])
+        self.assertEqual(self.server.rendering, {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+import os
+import json
+import tarfile
+import zipfile
+import tempfile
+
+from simplabel.shards import export_shards, plan_shards, sample_key
+
+class Test_Shards(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+        labels = {}
+        for i in range(10):
+            name = "img{}.jpg".format(i)
+            with open(os.path.join(self.directory, name), 'wb') as f:
+                f.write(bytes([i]) * (100 + i))
+            labels[name] = "Cat" if i % 2 else "Dog"
+        with zipfile.ZipFile(os.path.join(self.directory, 'more.zip'), 'w') as z:
+            z.writestr('sub/zipped.png', b'png')
+        labels['more.zip!sub/zipped.png'] = "Cat"
+        with open(os.path.join(self.directory, 'labeled_master.json'), 'w') as f:
+            json.dump(labels, f)
+        self.output = os.path.join(self.directory, 'shards')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_sample_key(self):
+        self.assertEqual(sample_key(3, "a/b.c.jpg"), "000000003_b_c")
+        self.assertEqual(sample_key(4, "x.zip!sub/y.png"), "000000004_y")
+
+    def test_plan_shards(self):
+        samples = [("k{}".format(i), "i", {}, 10) for i in range(7)]
+        self.assertEqual([len(shard) for shard in plan_shards(samples, maxCount=3)], [3, 3, 1])
+        self.assertEqual([len(shard) for shard in plan_shards(samples, maxBytes=25)], [2, 2, 2, 1])
+
+    def test_export(self):
+        index = export_shards(self.directory, self.output, splits=[], maxCount=4, workers=2)
+        self.assertEqual(index['samples'], 11)
+        self.assertEqual([shard['samples'] for shard in index['shards']], [4, 4, 3])
+        with open(os.path.join(self.output, 'index.json')) as f:
+            self.assertEqual(json.load(f), index)
+
+        records = {}
+        images = {}
+        for shard in index['shards']:
+            with tarfile.open(os.path.join(self.output, shard['name'])) as tar:
+                for member in tar.getmembers():
+                    key, ext = member.name.split('.', 1)
+                    data = tar.extractfile(member).read()
+                    if ext == 'json':
+                        records[key] = json.loads(data.decode('utf-8'))
+                    else:
+                        images[key] = data
+        self.assertEqual(sorted(records), sorted(images))
+        for key, record in records.items():
+            if record['path'].startswith('more.zip'):
+                self.assertEqual(images[key], b'png')
+            else:
+                self.assertEqual(len(images[key]), 100 + int(record['path'][3]))
+
+    def test_export_splits(self):
+        index = export_shards(self.directory, self.output, splits=[0.5, 0.5], workers=1)
+        self.assertEqual(sorted(shard['split'] for shard in index['shards']), ['train', 'val'])
+        self.assertEqual(sum(shard['samples'] for shard in index['shards']), 11)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+
+import io
+import os
+import json
+import time
+import tempfile
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+from PIL import Image
+
+from simplabel.sources import HttpSource, LocalSource, get_source
+
+class SlowHandler(SimpleHTTPRequestHandler):
+    '''File server stand-in with injected latency and keep-alive connections'''
+    protocol_version = 'HTTP/1.1'
+    latency = 0.1
+    connections = set()
+
+    def do_GET(self):
+        SlowHandler.connections.add(self.client_address)
+        time.sleep(self.latency)
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+class Test_HttpSource(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.images = []
+        for i in range(6):
+            name = "img{}.png".format(i)
+            Image.new('RGB', (64, 48), (40*i, 0, 0)).save(os.path.join(self.tmpdir.name, name))
+            self.images.append(name)
+        with open(os.path.join(self.tmpdir.name, 'manifest.json'), 'w') as f:
+            json.dump(self.images + ['notes.txt'], f)
+
+        SlowHandler.connections = set()
+        handler = partial(SlowHandler, directory=self.tmpdir.name)
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.source = HttpSource('http://127.0.0.1:{}/'.format(self.server.server_address[1]), connections=3)
+
+    def tearDown(self):
+        self.source.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+    def test_list_images(self):
+        self.assertEqual(self.source.list_images(['png']), self.images)
+
+    def test_open(self):
+        im = self.source.open(self.images[2], (32, 32))
+        self.assertEqual(im.size, (32, 24))
+        self.assertEqual(im.getpixel((0, 0)), (80, 0, 0))
+
+    def test_connections_are_reused(self):
+        for img in self.images:
+            self.source.fetch(img)
+        self.assertEqual(len(SlowHandler.connections), 1)
+
+    def test_read_ahead(self):
+        self.source.prefetch(self.images)
+        time.sleep(5 * SlowHandler.latency)
+        start = time.time()
+        for img in self.images:
+            self.source.open(img)
+        # All images were read ahead in parallel and come from the local cache
+        self.assertLess(time.time() - start, SlowHandler.latency)
+        self.assertLessEqual(len(SlowHandler.connections), 3)
+
+    def test_cache_is_bounded(self):
+        self.source.cacheBytes = 1
+        for img in self.images:
+            self.source.fetch(img)
+        self.assertEqual(list(self.source.cache), [self.images[-1]])
+
+    def test_get_source(self):
+        self.assertIsInstance(get_source('http://localhost/images'), HttpSource)
+        self.assertIsInstance(get_source(self.tmpdir.name), LocalSource)
@@ -0,0 +1,157 @@
+import unittest
+
+import os
+import json
+import tempfile
+
+from simplabel.store import LabelStore
+from simplabel.history import LabelHistory
+
+class Test_LabelStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+        self.write('alice', {'a.jpg': 'Cat', 'b.jpg': 'Dog', 'c.jpg': 'Cat'})
+        self.write('bob', {'a.jpg': 'Cat', 'b.jpg': 'Cat'})
+        self.store = LabelStore(self.directory, ['cat', ' dog'])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, user, labels):
+        with open(os.path.join(self.directory, 'labeled_{}.json'.format(user)), 'w') as f:
+            json.dump(labels, f)
+
+    def read(self, user):
+        with open(os.path.join(self.directory, 'labeled_{}.json'.format(user)), 'r') as f:
+            return json.load(f)
+
+    def test_load(self):
+        self.assertEqual(self.store.categories, ['Cat', 'Dog'])
+        self.assertEqual(self.store.users(), ['alice', 'bob'])
+        self.assertEqual(self.store.labels_of('a.jpg'), {'alice': 'Cat', 'bob': 'Cat'})
+        self.assertEqual(self.store.get('bob', 'c.jpg'), None)
+        self.assertEqual(sorted(self.store), ['a.jpg', 'b.jpg', 'c.jpg'])
+        self.assertIn('c.jpg', self.store)
+
+    def test_sort_and_master(self):
+        images = ['a.jpg', 'b.jpg', 'c.jpg', 'd.jpg']
+        self.assertEqual(self.store.sort(images), (['a.jpg', 'c.jpg'], ['b.jpg'], ['d.jpg']))
+        self.assertEqual(self.store.conflicts(), ['b.jpg'])
+        with self.assertRaises(ValueError):
+            self.store.make_master()
+
+        self.store.set('bob', 'b.jpg', 'Dog', action='reconcile')
+        self.assertEqual(self.store.make_master(), {'a.jpg': 'Cat', 'b.jpg': 'Dog', 'c.jpg': 'Cat'})
+        self.assertEqual(self.read('master'), {'a.jpg': 'Cat', 'b.jpg': 'Dog', 'c.jpg': 'Cat'})
+        self.assertNotIn('master', self.store.users())
+
+    def test_batched_writes(self):
+        self.store.own('carol')
+        self.store.update('carol', {'a.jpg': 'Dog', 'd.jpg': 'Cat'})
+        self.store.set('alice', 'c.jpg', None)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'labeled_carol.json')))
+        self.assertEqual(self.store.labels_of('d.jpg'), {'carol': 'Cat'})
+        self.assertEqual(self.store.labels_of('c.jpg'), {})
+        self.assertNotIn('c.jpg', self.store)
+
+        self.store.flush()
+        self.assertEqual(self.read('carol'), {'a.jpg': 'Dog', 'd.jpg': 'Cat'})
+        self.assertEqual(self.read('alice'), {'a.jpg': 'Cat', 'b.jpg': 'Dog'})
+        self.assertEqual(self.store.dirty, set())
+        self.assertEqual(LabelHistory(self.directory, 'carol').state_at(), {'a.jpg': 'Dog', 'd.jpg': 'Cat'})
+
+    def test_reload_skips_owned_users(self):
+        self.store.own('alice')
+        self.store.set('alice', 'd.jpg', 'Dog')
+        self.write('alice', {})
+        self.write('bob', {'d.jpg': 'Cat'})
+        os.utime(os.path.join(self.directory, 'labeled_bob.json'), (0, 0))
+        self.store.reload()
+        self.assertEqual(self.store.labels_of('d.jpg'), {'alice': 'Dog', 'bob': 'Cat'})
+        self.assertEqual(self.store.labels_of('a.jpg'), {'alice': 'Cat'})
+
+    def test_background_reload_and_write(self):
+        self.store.own('alice')
+        self.store.set('alice', 'd.jpg', 'Dog')
+        snapshot = self.store.snapshot()
+        self.store.set('alice', 'a.jpg', 'Dog')
+        self.assertEqual(self.store.dirty, {'alice'})
+        mtimes = self.store.write(snapshot)
+        self.assertEqual(self.read('alice'), {'a.jpg': 'Cat', 'b.jpg': 'Dog', 'c.jpg': 'Cat', 'd.jpg': 'Dog'})
+
+        self.write('bob', {'d.jpg': 'Cat'})
+        os.utime(os.path.join(self.directory, 'labeled_bob.json'), (0, 0))
+        changes = self.store.read_changes(dict(self.store.mtimes), set(self.store.owned))
+        self.assertEqual(list(changes), ['bob'])
+        self.assertEqual(self.store.labels_of('d.jpg'), {'alice': 'Dog'})
+        self.assertEqual(self.store.changed_images(changes), {'a.jpg', 'b.jpg', 'd.jpg'})
+        self.store.apply_changes(changes)
+        self.store.mtimes.update(mtimes)
+        self.assertEqual(self.store.labels_of('d.jpg'), {'alice': 'Dog', 'bob': 'Cat'})
+        self.assertEqual(self.store.read_changes(), {})
+
+    def test_modified_image_loses_label(self):
+        self.store.own('alice')
+        self.store.check_digests({'a.jpg': 'old', 'b.jpg': 'b', 'c.jpg': 'c'})
+        self.store.write_checksums('alice')
+        self.assertEqual(self.store.read_checksums(['alice', 'carol']),
+                         {'alice': {'a.jpg': 'old', 'b.jpg': 'b', 'c.jpg': 'c'}, 'carol': {}})
+
+        # Only the images passed are checked
+        self.assertEqual(self.store.check_digests({'a.jpg': 'new'}), {'alice': ['a.jpg']})
+        self.assertEqual(self.store.labels_of('a.jpg'), {'bob': 'Cat'})
+        self.assertEqual(self.store.dirty, {'alice'})
+        self.store.flush()
+        self.store.write_checksums('alice')
+        self.assertEqual(self.read('alice'), {'b.jpg': 'Dog', 'c.jpg': 'Cat'})
+        self.assertEqual(self.store.read_checksums(['alice']), {'alice': {'b.jpg': 'b', 'c.jpg': 'c'}})
+
+    def test_stale_labels_of_others_dropped(self):
+        self.store.own('alice')
+        digests = {'a.jpg': 'a', 'b.jpg': 'new', 'c.jpg': 'c'}
+        self.assertEqual(self.store.check_digests(digests, {'bob': {'a.jpg': 'a', 'b.jpg': 'old'}}), {'bob': ['b.jpg']})
+        self.assertEqual(self.store.labels_of('b.jpg'), {'alice': 'Dog'})
+        self.assertEqual(self.store.conflicts(), [])
+        # The label file of bob is left to him
+        self.assertEqual(self.store.dirty, set())
+        self.assertEqual(self.read('bob'), {'a.jpg': 'Cat', 'b.jpg': 'Cat'})
+
+        # Checksums recorded since are checked against the known hashes
+        self.write('bob', {'b.jpg': 'Cat', 'c.jpg': 'Dog'})
+        os.utime(os.path.join(self.directory, 'labeled_bob.json'), (0, 0))
+        self.store.reload()
+        self.assertEqual(self.store.check_digests({}, {'bob': {'b.jpg': 'new', 'c.jpg': 'old'}}), {'bob': ['c.jpg']})
+        self.assertEqual(self.store.labels_of('b.jpg'), {'alice': 'Dog', 'bob': 'Cat'})
+
+    def test_legacy_labels_backfilled(self):
+        self.store.own('alice')
+        self.store.check_digests({}, {'alice': {'a.jpg': 'a'}})
+        self.assertEqual(self.store.check_digests({'a.jpg': 'a', 'b.jpg': 'b', 'c.jpg': None, 'd.jpg': 'd'}), {})
+        self.assertEqual(self.store.checksums['alice'], {'a.jpg': 'a', 'b.jpg': 'b'})
+        # Hashes recorded by other users are not made up
+        self.assertNotIn('bob', self.store.checksums)
+        self.assertEqual(self.store.labels_of('c.jpg'), {'alice': 'Cat'})
+
+    def test_forget(self):
+        self.store.forget('bob', 'b.jpg')
+        self.assertEqual(self.store.conflicts(), [])
+        self.assertEqual(self.store.dirty, set())
+
+    def test_add_label(self):
+        self.assertEqual(self.store.add_label('animal/ bird'), 'Animal/Bird')
+        self.assertEqual(self.store.categories, ['Cat', 'Dog', 'Animal', 'Animal/Bird'])
+        with open(os.path.join(self.directory, '.labels.json'), 'r') as f:
+            self.assertEqual(json.load(f), self.store.categories)
+
+    def test_multi_label_detected(self):
+        self.write('carol', {'a.jpg': 3})
+        store = LabelStore(self.directory)
+        self.assertTrue(store.multiLabel)
+        self.assertEqual(store.labels_of('a.jpg'), {'alice': 1, 'bob': 1, 'carol': 3})
+        self.assertEqual(store.sort(['a.jpg', 'c.jpg']), (['c.jpg'], ['a.jpg'], []))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+import os
+import time
+import tempfile
+
+from PIL import Image
+
+from simplabel.thumbnails import ThumbnailLoader, make_thumbnail
+
+class Test_Thumbnails(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+        self.images = []
+        for i in range(6):
+            name = "img{}.jpg".format(i)
+            Image.new('RGB', (640, 480), (40*i, 0, 0)).save(os.path.join(self.directory, name))
+            self.images.append(name)
+        with open(os.path.join(self.directory, 'broken.jpg'), 'w') as f:
+            f.write("not an image")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_make_thumbnail(self):
+        size, data = make_thumbnail(os.path.join(self.directory, self.images[0]), (160, 120))
+        self.assertEqual(size, (160, 120))
+        self.assertEqual(len(data), 160 * 120 * 3)
+
+    def test_loader(self):
+        loader = ThumbnailLoader(self.directory, size=(80, 80), workers=2, maxItems=4)
+        try:
+            loader.request(self.images[:4] + ['broken.jpg'])
+            # The oldest request is dropped to stay within maxItems
+            self.assertNotIn(self.images[0], loader.futures)
+
+            deadline = time.time() + 60
+            while any(loader.is_pending(img) for img in loader.futures) and time.time() < deadline:
+                time.sleep(0.05)
+
+            thumb = loader.get(self.images[3])
+            self.assertEqual(thumb.size, (80, 60))
+            # Broken images are replaced by a blank thumbnail
+            self.assertEqual(loader.get('broken.jpg').size, (80, 80))
+        finally:
+            loader.shutdown()
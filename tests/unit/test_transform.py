@@ -0,0 +1,66 @@
+import unittest
+
+import os
+import json
+import tempfile
+
+from PIL import Image
+
+from simplabel.transform import ImageTransform, run_transforms
+from simplabel.flow_to_directory import flow_to_dict
+
+class Test_ImageTransform(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_resize_and_convert(self):
+        src = os.path.join(self.directory, 'a.png')
+        Image.new('RGBA', (400, 200), (255, 0, 0, 128)).save(src)
+        ImageTransform(maxSide=100, format='jpeg', quality=80).apply(src, self.directory, 'a.png')
+        with Image.open(os.path.join(self.directory, 'a.jpg')) as im:
+            self.assertEqual(im.format, 'JPEG')
+            self.assertEqual(im.size, (100, 50))
+
+    def test_exif_orientation(self):
+        src = os.path.join(self.directory, 'rotated.jpg')
+        exif = Image.Exif()
+        exif[0x0112] = 6 # Rotated 90 degrees
+        Image.new('RGB', (40, 20)).save(src, exif=exif)
+        outDir = os.path.join(self.directory, 'out')
+        os.mkdir(outDir)
+        ImageTransform().apply(src, outDir, 'rotated.jpg')
+        with Image.open(os.path.join(outDir, 'rotated.jpg')) as im:
+            self.assertEqual(im.size, (20, 40))
+            self.assertNotIn(0x0112, im.getexif())
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            ImageTransform(format='bmp')
+
+    def test_run_transforms_bounded(self):
+        jobs = []
+        for i in range(6):
+            src = os.path.join(self.directory, 'img{}.png'.format(i))
+            Image.new('RGB', (64, 64)).save(src)
+            jobs.append((src, self.directory, 'img{}.png'.format(i)))
+        jobs.append((os.path.join(self.directory, 'missing.png'), self.directory, 'missing.png'))
+        done, _ = run_transforms(iter(jobs), ImageTransform(format='webp'), workers=2, maxPending=2)
+        self.assertEqual(done, 6)
+        self.assertTrue(os.path.isfile(os.path.join(self.directory, 'img5.webp')))
+
+    def test_flow_with_transform(self):
+        Image.new('RGB', (300, 300)).save(os.path.join(self.directory, 'a.png'))
+        with open(os.path.join(self.directory, 'labeled_master.json'), 'w') as f:
+            json.dump({"a.png": "Cat"}, f)
+        outDir = os.path.join(self.directory, 'out')
+        flow_to_dict(self.directory, outDir, transform=ImageTransform(maxSide=30, format='jpeg'), workers=1)
+        with Image.open(os.path.join(outDir, 'Cat', 'a.jpg')) as im:
+            self.assertEqual(im.size, (30, 30))
+
+if __name__ == '__main__':
+    unittest.main()